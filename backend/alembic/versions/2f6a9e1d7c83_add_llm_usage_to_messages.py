@@ -0,0 +1,44 @@
+"""add llm usage to messages
+
+Revision ID: 2f6a9e1d7c83
+Revises: 5b8e2f0c9d14
+Create Date: 2026-10-16 15:12:37.904481
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f6a9e1d7c83'
+down_revision: Union[str, Sequence[str], None] = '5b8e2f0c9d14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+USAGE_COLUMNS = (
+    ('provider', sa.String(length=50)),
+    ('model_name', sa.String(length=100)),
+    ('prompt_tokens', sa.Integer()),
+    ('completion_tokens', sa.Integer()),
+    ('cached_tokens', sa.Integer()),
+    ('ttft_ms', sa.Float()),
+    ('latency_ms', sa.Float()),
+    ('finish_reason', sa.String(length=50)),
+    ('provider_request_id', sa.String(length=200)),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('messages', 'chat_session_messages'):
+        for name, column_type in USAGE_COLUMNS:
+            op.add_column(table, sa.Column(name, column_type, nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ('messages', 'chat_session_messages'):
+        for name, _ in reversed(USAGE_COLUMNS):
+            op.drop_column(table, name)
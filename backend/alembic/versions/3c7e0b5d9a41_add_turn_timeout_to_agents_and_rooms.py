@@ -0,0 +1,30 @@
+"""add turn_timeout to agents and rooms
+
+Revision ID: 3c7e0b5d9a41
+Revises: 8d4c1f7a2b95
+Create Date: 2026-10-16 16:48:12.530926
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c7e0b5d9a41'
+down_revision: Union[str, Sequence[str], None] = '8d4c1f7a2b95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('agents', sa.Column('turn_timeout', sa.Float(), nullable=True))
+    op.add_column('rooms', sa.Column('turn_timeout', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('rooms', 'turn_timeout')
+    op.drop_column('agents', 'turn_timeout')
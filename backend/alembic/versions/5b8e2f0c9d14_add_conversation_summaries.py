@@ -0,0 +1,46 @@
+"""add conversation_summaries
+
+Revision ID: 5b8e2f0c9d14
+Revises: e91b3c7d5a20
+Create Date: 2026-10-16 14:02:51.226470
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e2f0c9d14'
+down_revision: Union[str, Sequence[str], None] = 'e91b3c7d5a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('conversation_summaries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('room_id', sa.Integer(), nullable=True),
+    sa.Column('room_session_id', sa.Integer(), nullable=False),
+    sa.Column('chat_session_id', sa.Integer(), nullable=True),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=False),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['chat_session_id'], ['chat_sessions.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['room_id'], ['rooms.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_conversation_summaries_id'), 'conversation_summaries', ['id'], unique=False)
+    op.create_index(op.f('ix_conversation_summaries_room_id'), 'conversation_summaries', ['room_id'], unique=False)
+    op.create_index(op.f('ix_conversation_summaries_chat_session_id'), 'conversation_summaries', ['chat_session_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_conversation_summaries_chat_session_id'), table_name='conversation_summaries')
+    op.drop_index(op.f('ix_conversation_summaries_room_id'), table_name='conversation_summaries')
+    op.drop_index(op.f('ix_conversation_summaries_id'), table_name='conversation_summaries')
+    op.drop_table('conversation_summaries')
@@ -0,0 +1,30 @@
+"""add fallback chain and hedging to agents
+
+Revision ID: 7c1e4a9b2f60
+Revises: d33d724be91c
+Create Date: 2026-10-16 10:12:31.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e4a9b2f60'
+down_revision: Union[str, Sequence[str], None] = 'd33d724be91c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('agents', sa.Column('fallback_chain', sa.JSON(), nullable=True))
+    op.add_column('agents', sa.Column('hedge_enabled', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('agents', 'hedge_enabled')
+    op.drop_column('agents', 'fallback_chain')
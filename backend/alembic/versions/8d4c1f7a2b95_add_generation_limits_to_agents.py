@@ -0,0 +1,30 @@
+"""add generation limits to agents
+
+Revision ID: 8d4c1f7a2b95
+Revises: 2f6a9e1d7c83
+Create Date: 2026-10-16 16:04:51.218337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4c1f7a2b95'
+down_revision: Union[str, Sequence[str], None] = '2f6a9e1d7c83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('agents', sa.Column('max_tokens', sa.Integer(), nullable=True))
+    op.add_column('agents', sa.Column('stop_sequences', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('agents', 'stop_sequences')
+    op.drop_column('agents', 'max_tokens')
@@ -0,0 +1,28 @@
+"""add cache_enabled to agents
+
+Revision ID: a4f2d81c6e3b
+Revises: 7c1e4a9b2f60
+Create Date: 2026-10-16 11:03:47.518302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4f2d81c6e3b'
+down_revision: Union[str, Sequence[str], None] = '7c1e4a9b2f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('agents', sa.Column('cache_enabled', sa.Boolean(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('agents', 'cache_enabled')
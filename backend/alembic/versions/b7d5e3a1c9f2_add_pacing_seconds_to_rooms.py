@@ -0,0 +1,28 @@
+"""add pacing_seconds to rooms
+
+Revision ID: b7d5e3a1c9f2
+Revises: 3c7e0b5d9a41
+Create Date: 2026-10-16 18:02:41.118304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d5e3a1c9f2'
+down_revision: Union[str, Sequence[str], None] = '3c7e0b5d9a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('rooms', sa.Column('pacing_seconds', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('rooms', 'pacing_seconds')
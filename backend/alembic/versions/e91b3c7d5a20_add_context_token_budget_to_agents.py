@@ -0,0 +1,28 @@
+"""add context_token_budget to agents
+
+Revision ID: e91b3c7d5a20
+Revises: a4f2d81c6e3b
+Create Date: 2026-10-16 13:21:09.734115
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e91b3c7d5a20'
+down_revision: Union[str, Sequence[str], None] = 'a4f2d81c6e3b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('agents', sa.Column('context_token_budget', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('agents', 'context_token_budget')
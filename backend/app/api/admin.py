@@ -0,0 +1,38 @@
+"""
+Admin API endpoints for the room runtime.
+"""
+import logging
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from app.models import User
+from app.services.room_runtime import room_runtime
+from app.api.deps import get_current_admin
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+@router.get("/rooms")
+async def list_room_runs(current_user: User = Depends(get_current_admin)):
+    """
+    List running and queued room conversations and recently ended runs,
+    with their state, turn timing and errors.
+    """
+    return {
+        "runtime": room_runtime.stats(),
+        **room_runtime.list_runs(),
+    }
+
+
+@router.post("/rooms/{room_id}/cancel")
+async def cancel_room_run(room_id: int, current_user: User = Depends(get_current_admin)):
+    """
+    Cancel a room's conversation: drop it from the queue or cancel its task.
+    """
+    if not room_runtime.cancel(room_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Room {room_id} is not running"
+        )
+    logger.info(f"Admin {current_user.username} cancelled room {room_id}")
+    return {"message": "Conversation cancelled", "room_id": room_id}
@@ -10,14 +10,27 @@ from sqlalchemy import or_
 from app.core.database import get_db
 from app.models import Agent, User
 from app.schemas import AgentCreate, AgentUpdate, AgentResponse
+from app.services.prompts import prompt_cache
 from app.api.deps import get_current_user
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/agents", tags=["agents"])
 
+VALID_PROVIDERS = ["openai", "deepseek", "ollama", "google", "chatanywhere", "dashscope", "mock"]
+
+
+def _validate_providers(providers: List[str]):
+    """Raise 400 if any provider name is not supported."""
+    for provider in providers:
+        if provider.lower() not in VALID_PROVIDERS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid provider. Must be one of: {', '.join(VALID_PROVIDERS)}"
+            )
+
 
 @router.post("", response_model=AgentResponse, status_code=status.HTTP_201_CREATED)
-async def create_agent(agent_data: AgentCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def create_agent(agent_data: AgentCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     """
     Create a new AI agent.
     
@@ -33,13 +46,8 @@ async def create_agent(agent_data: AgentCreate, db: Session = Depends(get_db), c
         HTTPException: If creation fails
     """
     try:
-        # Validate provider
-        valid_providers = ["openai", "deepseek", "ollama", "google", "chatanywhere", "dashscope"]
-        if agent_data.provider.lower() not in valid_providers:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid provider. Must be one of: {', '.join(valid_providers)}"
-            )
+        # Validate provider and fallback providers
+        _validate_providers([agent_data.provider] + [target.provider for target in agent_data.fallback_chain or []])
         
         # Create agent
         agent = Agent(**agent_data.model_dump(), user_id=current_user.id)
@@ -62,7 +70,7 @@ async def create_agent(agent_data: AgentCreate, db: Session = Depends(get_db), c
 
 
 @router.get("", response_model=List[AgentResponse])
-async def get_agents(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_agents(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     """
     Get all available AI agents for the current user.
     
@@ -127,7 +135,7 @@ def get_agent(agent_id: int, db: Session = Depends(get_db), current_user: User =
 
 
 @router.patch("/{agent_id}", response_model=AgentResponse)
-async def update_agent(agent_id: int, agent_data: AgentUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def update_agent(agent_id: int, agent_data: AgentUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     """
     Update an agent.
     
@@ -160,6 +168,9 @@ async def update_agent(agent_id: int, agent_data: AgentUpdate, db: Session = Dep
         # Update fields
         update_data = agent_data.model_dump(exclude_unset=True)
         
+        if update_data.get("fallback_chain"):
+            _validate_providers([target["provider"] for target in update_data["fallback_chain"]])
+        
         # If api_key_config is provided but empty, do not update it (keep existing)
         if "api_key_config" in update_data and update_data["api_key_config"] == "":
             del update_data["api_key_config"]
@@ -169,6 +180,7 @@ async def update_agent(agent_id: int, agent_data: AgentUpdate, db: Session = Dep
         
         db.commit()
         db.refresh(agent)
+        prompt_cache.invalidate_agent(agent_id)
         
         logger.info(f"Updated agent {agent_id}")
         return agent
@@ -185,7 +197,7 @@ async def update_agent(agent_id: int, agent_data: AgentUpdate, db: Session = Dep
 
 
 @router.delete("/{agent_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_agent(agent_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def delete_agent(agent_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     """
     Delete an agent.
     
@@ -207,6 +219,7 @@ async def delete_agent(agent_id: int, db: Session = Depends(get_db), current_use
         
         db.delete(agent)
         db.commit()
+        prompt_cache.invalidate_agent(agent_id)
         
         logger.info(f"Deleted agent {agent_id}")
         
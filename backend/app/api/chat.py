@@ -1,18 +1,23 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from app.core.database import get_db, SessionLocal
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_db, AsyncSessionLocal
 from app.models import Agent, Role, ChatSession, ChatSessionMessage, User
 from app.schemas import (
     ChatRequest, ChatCompletionResponse, 
     ChatSessionResponse, ChatSessionCreate, 
     ChatSessionMessageResponse
 )
-from app.services.llm_adapter import get_llm_adapter
+from app.services.agent_adapter import get_agent_adapter
+from app.services.context_builder import agent_token_budget, fit_to_budget
+from app.services.message_writer import message_writer
+from app.services.prompts import chat_prompt_key, prompt_cache, render_chat_prompt
+from app.services.summarizer import aload_chat_summary, summarizer, summary_prompt_section
+from app.core.config import settings
 from app.api.deps import get_current_user
 import logging
-from typing import List
+from typing import List, Optional
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 logger = logging.getLogger(__name__)
@@ -20,21 +25,27 @@ logger = logging.getLogger(__name__)
 # ===== Session Management Endpoints =====
 
 @router.get("/sessions", response_model=List[ChatSessionResponse])
-def get_sessions(skip: int = 0, limit: int = 50, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_sessions(skip: int = 0, limit: int = 50, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """Get all chat sessions ordered by updated_at desc for current user."""
-    sessions = db.query(ChatSession).filter(ChatSession.user_id == current_user.id).order_by(desc(ChatSession.updated_at)).offset(skip).limit(limit).all()
+    sessions = (await db.scalars(
+        select(ChatSession)
+        .where(ChatSession.user_id == current_user.id)
+        .order_by(desc(ChatSession.updated_at))
+        .offset(skip)
+        .limit(limit)
+    )).all()
     return sessions
 
 @router.post("/sessions", response_model=ChatSessionResponse)
-def create_session(session_in: ChatSessionCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_session(session_in: ChatSessionCreate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """Create a new chat session."""
     # Validate agent ownership
-    agent = db.query(Agent).filter(Agent.id == session_in.agent_id, Agent.user_id == current_user.id).first()
+    agent = await db.scalar(select(Agent).where(Agent.id == session_in.agent_id, Agent.user_id == current_user.id))
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found or access denied")
         
     if session_in.role_id:
-        role = db.query(Role).filter(Role.id == session_in.role_id, Role.user_id == current_user.id).first()
+        role = await db.scalar(select(Role).where(Role.id == session_in.role_id, Role.user_id == current_user.id))
         if not role:
              raise HTTPException(status_code=404, detail="Role not found or access denied")
 
@@ -45,67 +56,88 @@ def create_session(session_in: ChatSessionCreate, db: Session = Depends(get_db),
         title=session_in.title or "New Chat"
     )
     db.add(session)
-    db.commit()
-    db.refresh(session)
+    await db.commit()
     return session
 
 @router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_session(session_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def delete_session(session_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """Delete a chat session."""
-    session = db.query(ChatSession).filter(ChatSession.id == session_id, ChatSession.user_id == current_user.id).first()
+    session = await db.scalar(select(ChatSession).where(ChatSession.id == session_id, ChatSession.user_id == current_user.id))
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    db.delete(session)
-    db.commit()
+    # Queued messages of the session are deleted with it
+    await message_writer.flush()
+    await db.delete(session)
+    await db.commit()
 
 @router.get("/sessions/{session_id}/messages", response_model=List[ChatSessionMessageResponse])
-def get_session_messages(session_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_session_messages(session_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """Get messages for a specific session."""
-    session = db.query(ChatSession).filter(ChatSession.id == session_id, ChatSession.user_id == current_user.id).first()
+    session = await db.scalar(select(ChatSession).where(ChatSession.id == session_id, ChatSession.user_id == current_user.id))
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
         
-    messages = db.query(ChatSessionMessage).filter(ChatSessionMessage.session_id == session_id).order_by(ChatSessionMessage.created_at).all()
+    # Messages already returned to the client may still be waiting for their batch
+    await message_writer.flush()
+    messages = (await db.scalars(
+        select(ChatSessionMessage)
+        .where(ChatSessionMessage.session_id == session_id)
+        .order_by(ChatSessionMessage.created_at)
+    )).all()
     return messages
 
 
 # ===== Completion Endpoint =====
 
-async def stream_and_save(generator, session_id: int):
-    """Wrapper to save streamed content to DB."""
+async def stream_and_save(generator, session_id: int, agent: Optional[Agent] = None):
+    """
+    Wrapper to save streamed content to DB and schedule the session summary.
+    
+    If the generator is an LLMStream, the usage it reports is saved with the message.
+    """
     full_content = ""
     try:
         async for chunk in generator:
             full_content += chunk
             yield chunk
+    except Exception as e:
+        # Headers are already sent, so surface the failure inline in the stream
+        logger.error(f"Chat stream failed: {str(e)}")
+        error_text = f"[Error: {str(e)}]"
+        full_content += error_text
+        yield error_text
     finally:
         # Save complete message to DB using a new session
         # This runs after the response is fully sent (or if client disconnects?)
         # Ideally, we save what we have.
         if full_content:
             try:
-                db = SessionLocal()
+                db = AsyncSessionLocal()
+                result = getattr(generator, "result", None)
                 msg = ChatSessionMessage(
                     session_id=session_id,
                     role="assistant",
-                    content=full_content
+                    content=full_content,
+                    **(result.usage_columns() if result else {})
                 )
-                db.add(msg)
                 # Update session timestamp
-                session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+                session = await db.get(ChatSession, session_id)
                 if session:
                     session.updated_at = session.updated_at # force update? No, assigning new value.
                     # SQLA automatically updates onupdate=... but we need to trigger it.
                     # Just committing might work if we touch it.
                     from datetime import datetime
                     session.updated_at = datetime.utcnow()
-                db.commit()
-                db.close()
+                await db.commit()
+                await message_writer.save(db, msg)
+                await db.close()
+                if agent is not None:
+                    summarizer.schedule_chat_session(session_id, agent)
             except Exception as e:
                 logger.error(f"Failed to save assistant message: {e}")
 
 @router.post("/completion", response_model=ChatCompletionResponse)
-async def chat_completion(request: ChatRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def chat_completion(request: ChatRequest, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """
     Get a chat completion from a specific agent and optional role.
     """
@@ -114,7 +146,7 @@ async def chat_completion(request: ChatRequest, db: Session = Depends(get_db), c
         session_id = request.session_id
         if session_id:
              # Verify session ownership
-             session = db.query(ChatSession).filter(ChatSession.id == session_id, ChatSession.user_id == current_user.id).first()
+             session = await db.scalar(select(ChatSession).where(ChatSession.id == session_id, ChatSession.user_id == current_user.id))
              if not session:
                  raise HTTPException(status_code=404, detail="Session not found or access denied")
              
@@ -123,35 +155,27 @@ async def chat_completion(request: ChatRequest, db: Session = Depends(get_db), c
              # For now, let's use request params but validate they match user ownership if provided.
              
         # 1. Get Agent
-        agent = db.query(Agent).filter(Agent.id == request.agent_id, Agent.user_id == current_user.id).first()
+        agent = await db.scalar(select(Agent).where(Agent.id == request.agent_id, Agent.user_id == current_user.id))
         if not agent:
             raise HTTPException(status_code=404, detail="Agent not found or access denied")
 
-        # 2. Get Role (if provided) and construct system prompt
-        base_prompt = agent.system_prompt or ""  # Use empty string if None
-        
-        system_prompt = base_prompt
-        
-        if request.role_id:
-            role = db.query(Role).filter(Role.id == request.role_id, Role.user_id == current_user.id).first()
-            if role:
-                # Construct persona prompt
-                persona_parts = [f"Name: {role.name}"]
-                if role.gender: persona_parts.append(f"Gender: {role.gender}")
-                if role.age: persona_parts.append(f"Age: {role.age}")
-                if role.profession: persona_parts.append(f"Profession: {role.profession}")
-                if role.personality: persona_parts.append(f"Personality: {role.personality}")
-                
-                persona_text = "\n".join(persona_parts)
-                
-                # Combine agent prompt (base instruction) with role prompt (persona)
-                if base_prompt:
-                    system_prompt = f"{base_prompt}\n\nRole Persona:\n{persona_text}"
-                else:
-                    system_prompt = f"Role Persona:\n{persona_text}"
-            else:
-                 # Role requested but not found/owned
-                 raise HTTPException(status_code=404, detail="Role not found or access denied")
+        # 2. Get Role (if provided) and construct system prompt; a cached prompt
+        # for this user, agent and role skips the role lookup
+        prompt_key = chat_prompt_key(current_user.id, agent.id, request.role_id)
+        system_prompt = prompt_cache.get(prompt_key)
+        if system_prompt is None:
+            role = None
+            if request.role_id:
+                role = await db.scalar(select(Role).where(Role.id == request.role_id, Role.user_id == current_user.id))
+                if not role:
+                    # Role requested but not found/owned
+                    raise HTTPException(status_code=404, detail="Role not found or access denied")
+            system_prompt = prompt_cache.put(
+                prompt_key,
+                render_chat_prompt(agent.system_prompt, role),
+                agent_id=agent.id,
+                role_id=request.role_id
+            )
 
         if not session_id:
             # Create new session if not provided
@@ -162,10 +186,12 @@ async def chat_completion(request: ChatRequest, db: Session = Depends(get_db), c
                 title=request.message[:30] + "..." if len(request.message) > 30 else request.message
             )
             db.add(new_session)
-            db.commit()
-            db.refresh(new_session)
+            await db.commit()
             session_id = new_session.id
         
+        # Earlier messages of the session must be stored before its history is read
+        await message_writer.flush()
+        
         # Save User Message
         user_msg = ChatSessionMessage(
             session_id=session_id,
@@ -173,24 +199,37 @@ async def chat_completion(request: ChatRequest, db: Session = Depends(get_db), c
             content=request.message,
             image_url=request.image
         )
-        db.add(user_msg)
+        await message_writer.save(db, user_msg)
         
         # Update session timestamp
-        session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        session = await db.get(ChatSession, session_id)
         if session:
             # Re-touch to update timestamp
             from datetime import datetime
             session.updated_at = datetime.utcnow()
             
-        db.commit()
+        await db.commit()
 
-        # 4. Prepare Messages (Load from DB + Current)
+        # 4. Prepare Messages (Load from DB + Current; the current one may still be queued)
         # Strategy: We trust the DB state.
         # But we also need to respect the 'history' passed if we want to support non-persistent context?
         # Actually, if we use session_id, we should load from DB.
-        # Let's load last 20 messages from this session.
+        # Load the most recent messages of this session; the token budget trims them below.
+        
+        # Messages already folded into the rolling summary are sent as the summary instead
+        summary = await aload_chat_summary(db, session_id)
+        system_prompt += summary_prompt_section(summary)
         
-        db_messages = db.query(ChatSessionMessage).filter(ChatSessionMessage.session_id == session_id).order_by(ChatSessionMessage.created_at).all()
+        db_messages = list((await db.scalars(
+            select(ChatSessionMessage)
+            .where(ChatSessionMessage.session_id == session_id)
+            .where(ChatSessionMessage.id > (summary.last_message_id if summary else 0))
+            .where(ChatSessionMessage.id < user_msg.id)
+            .order_by(desc(ChatSessionMessage.created_at))
+            .limit(max(settings.max_context_messages - 1, 0))
+        )).all())
+        db_messages.reverse()
+        db_messages.append(user_msg)
         
         valid_messages = []
         for msg in db_messages:
@@ -201,33 +240,38 @@ async def chat_completion(request: ChatRequest, db: Session = Depends(get_db), c
             if msg.image_url:
                  msg_dict["image"] = msg.image_url # Pass image to adapter
             valid_messages.append(msg_dict)
+        
+        # Keep the newest history that fits the agent's token budget
+        valid_messages = fit_to_budget(
+            valid_messages,
+            agent_token_budget(agent),
+            agent.provider,
+            agent.model_name,
+            system_prompt
+        )
             
         # 5. Call LLM
-        adapter = get_llm_adapter(
-            provider=agent.provider,
-            model_name=agent.model_name,
-            temperature=agent.temperature,
-            api_key=agent.api_key_config,
-            use_proxy=agent.use_proxy
-        )
+        adapter = get_agent_adapter(agent)
         
         if request.stream:
             return StreamingResponse(
-                stream_and_save(adapter.generate_stream(valid_messages, system_prompt), session_id),
+                stream_and_save(adapter.stream(valid_messages, system_prompt), session_id, agent),
                 media_type="text/plain"
             )
         
         # Non-streaming
-        response_content = await adapter.generate(valid_messages, system_prompt)
+        result = await adapter.complete(valid_messages, system_prompt)
+        response_content = result.content
         
         # Save Assistant Message
         asst_msg = ChatSessionMessage(
             session_id=session_id,
             role="assistant",
-            content=response_content
+            content=response_content,
+            **result.usage_columns()
         )
-        db.add(asst_msg)
-        db.commit()
+        await message_writer.save(db, asst_msg)
+        summarizer.schedule_chat_session(session_id, agent)
         
         return ChatCompletionResponse(content=response_content)
         
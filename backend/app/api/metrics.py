@@ -0,0 +1,44 @@
+"""
+API endpoints for runtime metrics.
+"""
+import logging
+from fastapi import APIRouter, Depends
+
+from app.models import User
+from app.services.llm_adapter import adapter_registry
+from app.services.http_pool import http_pool
+from app.services.rate_limit import limiter_registry
+from app.services.resilience import breaker_registry
+from app.services.agent_adapter import fallback_stats
+from app.services.llm_cache import response_cache
+from app.services.singleflight import singleflight
+from app.services.context_builder import token_counter
+from app.services.message_window import message_windows
+from app.services.message_writer import message_writer
+from app.services.prompts import prompt_cache
+from app.services.summarizer import summarizer
+from app.api.deps import get_current_user
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@router.get("/llm")
+async def get_llm_metrics(current_user: User = Depends(get_current_user)):
+    """
+    Get LLM adapter layer metrics.
+    """
+    return {
+        "adapters": adapter_registry.stats(),
+        "http_pools": http_pool.stats(),
+        "limiters": limiter_registry.stats(),
+        "resilience": breaker_registry.stats(),
+        "fallback": dict(fallback_stats),
+        "cache": response_cache.stats(),
+        "singleflight": singleflight.stats(),
+        "token_counts": token_counter.stats(),
+        "message_windows": message_windows.stats(),
+        "message_writer": message_writer.stats(),
+        "prompts": prompt_cache.stats(),
+        "summaries": summarizer.stats(),
+    }
@@ -9,6 +9,7 @@ from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.models import Role, Agent, User
 from app.schemas import RoleCreate, RoleUpdate, RoleResponse
+from app.services.prompts import prompt_cache
 from app.api.deps import get_current_user
 
 logger = logging.getLogger(__name__)
@@ -49,7 +50,7 @@ def create_role(role_data: RoleCreate, db: Session = Depends(get_db), current_us
 
 
 @router.get("", response_model=List[RoleResponse])
-async def get_roles(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_roles(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     """
     Get all available roles for current user.
     """
@@ -65,7 +66,7 @@ async def get_roles(skip: int = 0, limit: int = 100, db: Session = Depends(get_d
 
 
 @router.get("/{role_id}", response_model=RoleResponse)
-async def get_role(role_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_role(role_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     """
     Get a specific role by ID.
     """
@@ -116,6 +117,7 @@ def update_role(role_id: int, role_data: RoleUpdate, db: Session = Depends(get_d
             
         db.commit()
         db.refresh(role)
+        prompt_cache.invalidate_role(role_id)
         return role
         
     except HTTPException:
@@ -130,7 +132,7 @@ def update_role(role_id: int, role_data: RoleUpdate, db: Session = Depends(get_d
 
 
 @router.delete("/{role_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_role(role_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def delete_role(role_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     """
     Delete a role.
     """
@@ -144,6 +146,7 @@ async def delete_role(role_id: int, db: Session = Depends(get_db), current_user:
             
         db.delete(role)
         db.commit()
+        prompt_cache.invalidate_role(role_id)
         return None
         
     except HTTPException:
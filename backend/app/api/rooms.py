@@ -4,13 +4,18 @@ API endpoints for room management.
 import logging
 import asyncio
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.models import Room, Agent, Role, User
 from app.schemas import RoomCreate, RoomResponse, RoomJoin, MessageResponse, UserMessageRequest
 from app.services.orchestrator import ChatOrchestrator
+from app.services.room_runtime import RoomAlreadyActive, RuntimeFull, room_runtime
+from app.services.message_window import message_windows
+from app.services.message_writer import message_writer
 from app.api.websocket import manager
 from app.api.deps import get_current_user
 from app.models import Room, Agent, Role, User, Message
@@ -18,15 +23,15 @@ from app.models import Room, Agent, Role, User, Message
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/rooms", tags=["rooms"])
 
-# Store active orchestrators
-active_orchestrators = {}
+# Rooms are returned with their roles and the roles' agents; load them with the room
+ROOM_ROLES = selectinload(Room.roles).selectinload(Role.agent)
 
 
 @router.post("/{room_id}/messages", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
 async def send_message(
     room_id: int, 
     message_data: UserMessageRequest, 
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_async_db), 
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -34,7 +39,7 @@ async def send_message(
     """
     try:
         # Validate room
-        room = db.query(Room).filter(Room.id == room_id, Room.creator_id == current_user.id).first()
+        room = await db.scalar(select(Room).where(Room.id == room_id, Room.creator_id == current_user.id))
         if not room:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -50,9 +55,10 @@ async def send_message(
             sender_name=current_user.username
         )
         
-        db.add(message)
-        db.commit()
-        db.refresh(message)
+        await message_writer.save(db, message)
+        
+        # Make it part of the running conversation's context
+        message_windows.append(room_id, message.session_id, message)
         
         # Broadcast to WebSocket
         # Construct message dict for broadcast
@@ -76,7 +82,7 @@ async def send_message(
         raise
     except Exception as e:
         logger.error(f"Error sending message to room {room_id}: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to send message: {str(e)}"
@@ -84,7 +90,7 @@ async def send_message(
 
 
 @router.post("", response_model=RoomResponse, status_code=status.HTTP_201_CREATED)
-def create_room(room_data: RoomCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_room(room_data: RoomCreate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """
     Create a new chat room.
     
@@ -104,7 +110,11 @@ def create_room(room_data: RoomCreate, db: Session = Depends(get_db), current_us
         roles = []
         if room_data.role_ids:
             # Check roles exist and belong to user
-            roles = db.query(Role).filter(Role.id.in_(room_data.role_ids), Role.user_id == current_user.id).all()
+            roles = (await db.scalars(
+                select(Role)
+                .options(selectinload(Role.agent))
+                .where(Role.id.in_(room_data.role_ids), Role.user_id == current_user.id)
+            )).all()
             if len(roles) != len(room_data.role_ids):
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -117,8 +127,7 @@ def create_room(room_data: RoomCreate, db: Session = Depends(get_db), current_us
         room.roles = roles
         
         db.add(room)
-        db.commit()
-        db.refresh(room)
+        await db.commit()
         
         logger.info(f"Created room: {room.name} (ID: {room.id}) for user {current_user.username}")
         return room
@@ -127,7 +136,7 @@ def create_room(room_data: RoomCreate, db: Session = Depends(get_db), current_us
         raise
     except Exception as e:
         logger.error(f"Error creating room: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create room: {str(e)}"
@@ -135,12 +144,19 @@ def create_room(room_data: RoomCreate, db: Session = Depends(get_db), current_us
 
 
 @router.get("", response_model=List[RoomResponse])
-async def get_rooms(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_rooms(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """
     Get all rooms for current user.
     """
     try:
-        rooms = db.query(Room).filter(Room.creator_id == current_user.id).order_by(Room.created_at.desc()).offset(skip).limit(limit).all()
+        rooms = (await db.scalars(
+            select(Room)
+            .options(ROOM_ROLES)
+            .where(Room.creator_id == current_user.id)
+            .order_by(Room.created_at.desc())
+            .offset(skip)
+            .limit(limit)
+        )).all()
         return rooms
     except Exception as e:
         logger.error(f"Error fetching rooms: {str(e)}")
@@ -151,12 +167,14 @@ async def get_rooms(skip: int = 0, limit: int = 100, db: Session = Depends(get_d
 
 
 @router.get("/{room_id}", response_model=RoomResponse)
-def get_room(room_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_room(room_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """
     Get a specific room by ID.
     """
     try:
-        room = db.query(Room).filter(Room.id == room_id, Room.creator_id == current_user.id).first()
+        room = await db.scalar(
+            select(Room).options(ROOM_ROLES).where(Room.id == room_id, Room.creator_id == current_user.id)
+        )
         if not room:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -174,19 +192,23 @@ def get_room(room_id: int, db: Session = Depends(get_db), current_user: User = D
 
 
 @router.post("/{room_id}/join", response_model=RoomResponse)
-async def join_room(room_id: int, join_data: RoomJoin, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def join_room(room_id: int, join_data: RoomJoin, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """
     Add a role to a room.
     """
     try:
-        room = db.query(Room).filter(Room.id == room_id, Room.creator_id == current_user.id).first()
+        room = await db.scalar(
+            select(Room).options(ROOM_ROLES).where(Room.id == room_id, Room.creator_id == current_user.id)
+        )
         if not room:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Room {room_id} not found"
             )
         
-        role = db.query(Role).filter(Role.id == join_data.role_id, Role.user_id == current_user.id).first()
+        role = await db.scalar(
+            select(Role).options(selectinload(Role.agent)).where(Role.id == join_data.role_id, Role.user_id == current_user.id)
+        )
         if not role:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -202,8 +224,7 @@ async def join_room(room_id: int, join_data: RoomJoin, db: Session = Depends(get
         
         # Add role to room
         room.roles.append(role)
-        db.commit()
-        db.refresh(room)
+        await db.commit()
         
         logger.info(f"Role {role.name} joined room {room.name}")
         return room
@@ -212,7 +233,7 @@ async def join_room(room_id: int, join_data: RoomJoin, db: Session = Depends(get
         raise
     except Exception as e:
         logger.error(f"Error joining room {room_id}: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to join room: {str(e)}"
@@ -220,19 +241,24 @@ async def join_room(room_id: int, join_data: RoomJoin, db: Session = Depends(get
 
 
 @router.post("/{room_id}/start", status_code=status.HTTP_202_ACCEPTED)
-async def start_room(room_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def start_room(room_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """
     Start the autonomous conversation in a room.
+    
+    The conversation runs in the room runtime; when the maximum number of
+    running rooms is reached it waits in the queue until a slot frees up.
     """
     try:
-        room = db.query(Room).filter(Room.id == room_id, Room.creator_id == current_user.id).first()
+        room = await db.scalar(
+            select(Room).options(ROOM_ROLES).where(Room.id == room_id, Room.creator_id == current_user.id)
+        )
         if not room:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Room {room_id} not found"
             )
         
-        if room.status == "running":
+        if room.status == "running" or room_runtime.is_active(room_id):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Room conversation already running"
@@ -244,12 +270,18 @@ async def start_room(room_id: int, background_tasks: BackgroundTasks, db: Sessio
                 detail="Room has no roles"
             )
         
-        # Create orchestrator
-        orchestrator = ChatOrchestrator(room_id)
-        active_orchestrators[room_id] = orchestrator
+        # Run the conversation under the room runtime's supervision
+        try:
+            run = room_runtime.submit(ChatOrchestrator(room_id), manager.broadcast, user_id=current_user.id)
+        except RoomAlreadyActive as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        except RuntimeFull as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
         
-        # Start conversation in background
-        background_tasks.add_task(orchestrator.start_conversation, manager.broadcast)
+        if run.state == "queued":
+            position = room_runtime.queue_position(room_id)
+            logger.info(f"Queued conversation for room {room_id} (position {position})")
+            return {"message": "Conversation queued", "room_id": room_id, "queue_position": position}
         
         logger.info(f"Started conversation for room {room_id}")
         return {"message": "Conversation started", "room_id": room_id}
@@ -265,12 +297,12 @@ async def start_room(room_id: int, background_tasks: BackgroundTasks, db: Sessio
 
 
 @router.post("/{room_id}/stop", status_code=status.HTTP_200_OK)
-async def stop_room(room_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def stop_room(room_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """
     Stop the conversation in a room.
     """
     try:
-        room = db.query(Room).filter(Room.id == room_id, Room.creator_id == current_user.id).first()
+        room = await db.scalar(select(Room).where(Room.id == room_id, Room.creator_id == current_user.id))
         if not room:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -278,13 +310,11 @@ async def stop_room(room_id: int, db: Session = Depends(get_db), current_user: U
             )
         
         # Stop orchestrator if running
-        if room_id in active_orchestrators:
-            active_orchestrators[room_id].stop()
-            del active_orchestrators[room_id]
+        room_runtime.stop(room_id)
         
         # Update room status
         room.status = "idle"
-        db.commit()
+        await db.commit()
         
         logger.info(f"Stopped conversation for room {room_id}")
         return {"message": "Conversation stopped", "room_id": room_id}
@@ -293,7 +323,7 @@ async def stop_room(room_id: int, db: Session = Depends(get_db), current_user: U
         raise
     except Exception as e:
         logger.error(f"Error stopping room {room_id}: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to stop room: {str(e)}"
@@ -301,12 +331,12 @@ async def stop_room(room_id: int, db: Session = Depends(get_db), current_user: U
 
 
 @router.post("/{room_id}/finish", status_code=status.HTTP_200_OK)
-async def finish_room(room_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def finish_room(room_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """
     Terminate the conversation in a room (mark as finished).
     """
     try:
-        room = db.query(Room).filter(Room.id == room_id, Room.creator_id == current_user.id).first()
+        room = await db.scalar(select(Room).where(Room.id == room_id, Room.creator_id == current_user.id))
         if not room:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -314,13 +344,11 @@ async def finish_room(room_id: int, db: Session = Depends(get_db), current_user:
             )
         
         # Stop orchestrator if running
-        if room_id in active_orchestrators:
-            active_orchestrators[room_id].stop()
-            del active_orchestrators[room_id]
+        room_runtime.stop(room_id)
         
         # Update room status
         room.status = "finished"
-        db.commit()
+        await db.commit()
         
         logger.info(f"Terminated conversation for room {room_id}")
         return {"message": "Conversation terminated", "room_id": room_id}
@@ -329,7 +357,7 @@ async def finish_room(room_id: int, db: Session = Depends(get_db), current_user:
         raise
     except Exception as e:
         logger.error(f"Error terminating room {room_id}: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to terminate room: {str(e)}"
@@ -337,12 +365,12 @@ async def finish_room(room_id: int, db: Session = Depends(get_db), current_user:
 
 
 @router.post("/{room_id}/restart", status_code=status.HTTP_200_OK)
-async def restart_room(room_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def restart_room(room_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """
     Restart the conversation in a room (new session).
     """
     try:
-        room = db.query(Room).filter(Room.id == room_id, Room.creator_id == current_user.id).first()
+        room = await db.scalar(select(Room).where(Room.id == room_id, Room.creator_id == current_user.id))
         if not room:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -350,15 +378,13 @@ async def restart_room(room_id: int, db: Session = Depends(get_db), current_user
             )
             
         # Stop orchestrator if running
-        if room_id in active_orchestrators:
-            active_orchestrators[room_id].stop()
-            del active_orchestrators[room_id]
+        room_runtime.stop(room_id)
             
         # Update room state for new session
         room.status = "idle"
         room.current_rounds = 0
         room.session_id += 1
-        db.commit()
+        await db.commit()
         
         logger.info(f"Restarted room {room_id} (New Session ID: {room.session_id})")
         return {"message": "Conversation restarted", "room_id": room_id, "session_id": room.session_id}
@@ -367,7 +393,7 @@ async def restart_room(room_id: int, db: Session = Depends(get_db), current_user
         raise
     except Exception as e:
         logger.error(f"Error restarting room {room_id}: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to restart room: {str(e)}"
@@ -375,12 +401,12 @@ async def restart_room(room_id: int, db: Session = Depends(get_db), current_user
 
 
 @router.delete("/{room_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_room(room_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def delete_room(room_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """
     Delete a chat room.
     """
     try:
-        room = db.query(Room).filter(Room.id == room_id, Room.creator_id == current_user.id).first()
+        room = await db.scalar(select(Room).where(Room.id == room_id, Room.creator_id == current_user.id))
         if not room:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -388,12 +414,12 @@ async def delete_room(room_id: int, db: Session = Depends(get_db), current_user:
             )
             
         # Stop orchestrator if running
-        if room_id in active_orchestrators:
-            active_orchestrators[room_id].stop()
-            del active_orchestrators[room_id]
-            
-        db.delete(room)
-        db.commit()
+        room_runtime.stop(room_id)
+        
+        # Queued messages of the room are deleted with it
+        await message_writer.flush()
+        await db.delete(room)
+        await db.commit()
         
         logger.info(f"Deleted room {room_id}")
         
@@ -401,7 +427,7 @@ async def delete_room(room_id: int, db: Session = Depends(get_db), current_user:
         raise
     except Exception as e:
         logger.error(f"Error deleting room {room_id}: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete room: {str(e)}"
@@ -414,7 +440,7 @@ async def get_messages(
     skip: int = 0, 
     limit: int = 100, 
     session_id: int = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -423,25 +449,26 @@ async def get_messages(
     try:
         from app.models import Message
         
-        room = db.query(Room).filter(Room.id == room_id, Room.creator_id == current_user.id).first()
+        room = await db.scalar(select(Room).where(Room.id == room_id, Room.creator_id == current_user.id))
         if not room:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Room {room_id} not found"
             )
         
-        query = db.query(Message).filter(Message.room_id == room_id)
+        # Messages already broadcast may still be waiting for their batch
+        await message_writer.flush()
+        query = select(Message).where(Message.room_id == room_id)
         
         if session_id is not None:
-            query = query.filter(Message.session_id == session_id)
+            query = query.where(Message.session_id == session_id)
             
-        messages = (
+        messages = (await db.scalars(
             query
             .order_by(Message.created_at)
             .offset(skip)
             .limit(limit)
-            .all()
-        )
+        )).all()
         
         return messages
         
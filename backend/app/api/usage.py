@@ -0,0 +1,131 @@
+"""
+API endpoints for aggregated LLM usage (tokens and latency) per room, agent and user.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.database import get_db
+from app.models import Agent, ChatSession, ChatSessionMessage, Message, Room, User
+from app.schemas import UsageBreakdown, UsageSummary
+from app.api.deps import get_current_user
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/usage", tags=["usage"])
+
+
+def _usage_rows(db: Session, model, criteria: List[Any], join: Optional[Tuple[Any, Any]] = None) -> List[Tuple]:
+    """Per provider/model sums of the usage columns of assistant messages."""
+    query = db.query(
+        model.provider,
+        model.model_name,
+        func.count(model.id),
+        func.sum(model.prompt_tokens),
+        func.sum(model.completion_tokens),
+        func.sum(model.cached_tokens),
+        func.sum(model.ttft_ms),
+        func.count(model.ttft_ms),
+        func.sum(model.latency_ms),
+        func.count(model.latency_ms)
+    )
+    if join is not None:
+        query = query.join(*join)
+    return (
+        query
+        .filter(model.role == "assistant", *criteria)
+        .group_by(model.provider, model.model_name)
+        .all()
+    )
+
+
+def _average(total: float, count: int) -> Optional[float]:
+    return round(total / count, 1) if count else None
+
+
+def _summarize(scope: str, scope_id: int, rows: List[Tuple]) -> UsageSummary:
+    """Merge usage rows (possibly from several tables) into a summary."""
+    merged: Dict[Tuple[Optional[str], Optional[str]], List[float]] = {}
+    for provider, model_name, *values in rows:
+        sums = merged.setdefault((provider, model_name), [0] * 8)
+        for index, value in enumerate(values):
+            sums[index] += value or 0
+
+    breakdown = []
+    totals = [0] * 8
+    for (provider, model_name), sums in merged.items():
+        totals = [total + value for total, value in zip(totals, sums)]
+        messages, prompt, completion, cached, ttft, ttft_count, latency, latency_count = sums
+        breakdown.append(UsageBreakdown(
+            provider=provider,
+            model_name=model_name,
+            messages=messages,
+            prompt_tokens=prompt,
+            completion_tokens=completion,
+            cached_tokens=cached,
+            avg_ttft_ms=_average(ttft, ttft_count),
+            avg_latency_ms=_average(latency, latency_count)
+        ))
+
+    messages, prompt, completion, cached, ttft, ttft_count, latency, latency_count = totals
+    return UsageSummary(
+        scope=scope,
+        scope_id=scope_id,
+        messages=messages,
+        prompt_tokens=prompt,
+        completion_tokens=completion,
+        cached_tokens=cached,
+        avg_ttft_ms=_average(ttft, ttft_count),
+        avg_latency_ms=_average(latency, latency_count),
+        by_model=sorted(breakdown, key=lambda item: item.messages, reverse=True)
+    )
+
+
+@router.get("/rooms/{room_id}", response_model=UsageSummary)
+def get_room_usage(room_id: int, session_id: Optional[int] = None, db: Session = Depends(get_db),
+                   current_user: User = Depends(get_current_user)):
+    """
+    Get LLM usage for a room, optionally limited to one conversation session.
+    """
+    room = db.query(Room).filter(Room.id == room_id, Room.creator_id == current_user.id).first()
+    if not room:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Room {room_id} not found")
+
+    criteria = [Message.room_id == room_id]
+    if session_id is not None:
+        criteria.append(Message.session_id == session_id)
+    return _summarize("room", room_id, _usage_rows(db, Message, criteria))
+
+
+@router.get("/agents/{agent_id}", response_model=UsageSummary)
+def get_agent_usage(agent_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Get LLM usage for an agent across rooms and playground sessions.
+    """
+    agent = db.query(Agent).filter(Agent.id == agent_id, Agent.user_id == current_user.id).first()
+    if not agent:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Agent {agent_id} not found")
+
+    rows = _usage_rows(db, Message, [Message.agent_id == agent_id])
+    rows += _usage_rows(
+        db, ChatSessionMessage, [ChatSession.agent_id == agent_id],
+        join=(ChatSession, ChatSession.id == ChatSessionMessage.session_id)
+    )
+    return _summarize("agent", agent_id, rows)
+
+
+@router.get("/users/me", response_model=UsageSummary)
+def get_my_usage(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Get LLM usage for the current user's rooms and playground sessions.
+    """
+    rows = _usage_rows(
+        db, Message, [Room.creator_id == current_user.id],
+        join=(Room, Room.id == Message.room_id)
+    )
+    rows += _usage_rows(
+        db, ChatSessionMessage, [ChatSession.user_id == current_user.id],
+        join=(ChatSession, ChatSession.id == ChatSessionMessage.session_id)
+    )
+    return _summarize("user", current_user.id, rows)
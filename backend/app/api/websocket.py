@@ -4,10 +4,9 @@ WebSocket endpoint for real-time messaging.
 import logging
 import json
 from typing import Dict, Set
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
-from app.core.database import get_db
+from app.core.database import AsyncSessionLocal
 from app.models import Room
 
 logger = logging.getLogger(__name__)
@@ -73,17 +72,15 @@ async def websocket_endpoint(websocket: WebSocket, room_id: int):
         room_id: Room ID to connect to
     """
     # Note: Can't use Depends(get_db) directly in WebSocket endpoints
-    # We'll validate the room exists before accepting the connection
-    from app.core.database import SessionLocal
+    # We'll validate the room exists before accepting the connection; the
+    # session is closed right away instead of holding a connection for the socket's lifetime
+    async with AsyncSessionLocal() as db:
+        room = await db.get(Room, room_id)
+    if not room:
+        await websocket.close(code=4004, reason="Room not found")
+        return
     
-    db = SessionLocal()
     try:
-        # Validate room exists
-        room = db.query(Room).filter(Room.id == room_id).first()
-        if not room:
-            await websocket.close(code=4004, reason="Room not found")
-            return
-        
         # Accept connection
         await manager.connect(websocket, room_id)
         
@@ -111,8 +108,6 @@ async def websocket_endpoint(websocket: WebSocket, room_id: int):
     except Exception as e:
         logger.error(f"WebSocket error: {str(e)}")
         manager.disconnect(websocket, room_id)
-    finally:
-        db.close()
 
 
 def get_connection_manager() -> ConnectionManager:
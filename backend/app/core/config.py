@@ -3,7 +3,7 @@ Configuration module for the AI Group Chat system.
 Handles environment variables and application settings.
 """
 import os
-from typing import Optional
+from typing import Optional, Dict, Any
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
@@ -36,6 +36,146 @@ class Settings(BaseSettings):
         description="Optional proxy URL for LLM API calls"
     )
     
+    # Provider endpoints (overridable, e.g. to point at a local fake server)
+    openai_base_url: str = Field(default="https://api.openai.com/v1", description="OpenAI API base URL")
+    deepseek_base_url: str = Field(default="https://api.deepseek.com", description="DeepSeek API base URL")
+    chatanywhere_base_url: str = Field(default="https://api.chatanywhere.tech/v1", description="ChatAnywhere API base URL")
+    dashscope_base_url: str = Field(
+        default="https://dashscope.aliyuncs.com/compatible-mode/v1",
+        description="Aliyun DashScope OpenAI-compatible API base URL"
+    )
+    ollama_base_url: str = Field(default="http://localhost:11434", description="Ollama server base URL")
+    ollama_keep_alive: str = Field(
+        default="30m",
+        description="How long Ollama keeps a model loaded after a request (e.g. '30m', '-1' to keep forever)"
+    )
+    
+    # Mock provider (offline load and resilience testing)
+    mock_llm_seed: int = Field(default=0, description="Seed for the mock provider's generated text, latency and faults")
+    mock_llm_profiles: Dict[str, Dict[str, Any]] = Field(
+        default={
+            "default": {"ttft_ms": 300.0, "ttft_sigma": 0.3, "tokens_per_second": 40.0, "tps_sigma": 0.2},
+            "fast": {"ttft_ms": 5.0, "ttft_sigma": 0.0, "tokens_per_second": 5000.0, "tps_sigma": 0.0},
+            "flaky": {"error_rate_429": 0.1, "error_rate_5xx": 0.1, "timeout_rate": 0.05},
+        },
+        description="Mock provider profiles selected by model name; they override the 'default' profile"
+    )
+    
+    # LLM HTTP connection pools (shared per provider endpoint)
+    llm_max_connections: int = Field(default=100, description="Maximum connections per provider endpoint pool")
+    llm_max_keepalive_connections: int = Field(default=20, description="Maximum idle keep-alive connections per pool")
+    llm_keepalive_expiry: float = Field(default=30.0, description="Seconds an idle keep-alive connection is kept open")
+    llm_http2: bool = Field(default=True, description="Use HTTP/2 multiplexing when the 'h2' package is installed")
+    llm_connect_timeout: float = Field(default=10.0, description="Connect timeout for LLM API calls in seconds")
+    llm_read_timeout: float = Field(default=120.0, description="Read timeout for LLM API calls in seconds")
+    
+    # LLM concurrency and rate limits (per provider and API key)
+    llm_max_concurrency: int = Field(default=8, description="Maximum in-flight requests per provider and API key (0 = unlimited)")
+    llm_rpm_limit: int = Field(default=0, description="Requests per minute per provider and API key (0 = unlimited)")
+    llm_tpm_limit: int = Field(default=0, description="Tokens per minute per provider and API key (0 = unlimited)")
+    llm_provider_limits: Dict[str, Dict[str, Any]] = Field(
+        default_factory=dict,
+        description='Per-provider overrides as JSON, e.g. {"dashscope": {"max_concurrency": 4, "rpm": 60, "tpm": 100000}}'
+    )
+    
+    # LLM retries and circuit breaking
+    llm_retry_max_attempts: int = Field(default=3, description="Maximum attempts per LLM call for retryable errors (1 = no retry)")
+    llm_retry_base_delay: float = Field(default=0.5, description="Base delay in seconds for exponential backoff")
+    llm_retry_max_delay: float = Field(default=20.0, description="Maximum delay in seconds between retries")
+    llm_breaker_failure_threshold: int = Field(default=5, description="Consecutive retryable failures that open a provider's circuit")
+    llm_breaker_recovery_timeout: float = Field(default=30.0, description="Seconds a circuit stays open before a probe is allowed")
+    
+    # LLM fallback hedging
+    llm_hedge_percentile: float = Field(
+        default=95.0,
+        description="Observed first-token latency percentile after which a hedged request is fired"
+    )
+    llm_hedge_default_delay: float = Field(
+        default=3.0,
+        description="Hedging delay in seconds used until enough latency samples are collected"
+    )
+    
+    # LLM response cache
+    llm_cache_enabled: bool = Field(default=True, description="Enable the LLM response cache")
+    llm_cache_max_entries: int = Field(default=1024, description="Maximum entries in the in-memory response cache")
+    llm_cache_ttl: float = Field(default=3600.0, description="Seconds a cached response stays valid")
+    llm_cache_disk_path: Optional[str] = Field(default=None, description="Optional SQLite file for a persistent cache tier")
+    
+    # LLM traffic cassettes (record/replay for regression and load tests)
+    llm_cassette_mode: Optional[str] = Field(
+        default=None,
+        description="'record' to save LLM traffic to llm_cassette_path, 'replay' to serve it from there without network"
+    )
+    llm_cassette_path: str = Field(default="llm_cassette.jsonl", description="Cassette file (JSON Lines)")
+    llm_cassette_realtime: bool = Field(
+        default=True,
+        description="Replay with the recorded time to first token and chunk timing (False = as fast as possible)"
+    )
+    
+    # LLM request coalescing
+    llm_singleflight_enabled: bool = Field(default=True, description="Share one upstream call between concurrent identical requests")
+    
+    # Generation limits
+    llm_default_max_tokens: int = Field(
+        default=1000,
+        description="max_tokens sent to providers when neither the agent nor the room mode sets one"
+    )
+    room_mode_generation: Dict[str, Dict[str, Any]] = Field(
+        default={
+            "group_chat": {"max_tokens": 200, "max_words": 40},
+            "debate": {"max_tokens": 600},
+        },
+        description="Per room mode limits: max_tokens, stop (list), max_words, max_sentences"
+    )
+    room_mode_prompts: Dict[str, str] = Field(
+        default={},
+        description="Per room mode system prompt templates ({name}, {topic}, {personality}, {gender}, {age}, {profession}, {aggressiveness}, {mode}); unset modes use the built-in role prompt"
+    )
+    prompt_cache_size: int = Field(
+        default=1024,
+        description="Maximum number of rendered persona system prompts kept in memory"
+    )
+    llm_early_stop_enabled: bool = Field(
+        default=True,
+        description="Stream room turns and stop upstream once the mode's word/sentence budget is reached"
+    )
+    room_stream_turns: bool = Field(
+        default=True,
+        description="Broadcast room turns to viewers as they are generated (message_start/delta/message_end)"
+    )
+    stream_delta_window_ms: float = Field(
+        default=50.0,
+        description="Minimum interval between two streamed delta events of a turn"
+    )
+
+    # Message persistence
+    message_write_behind: bool = Field(
+        default=True,
+        description="Persist chat messages through the batched write-behind writer instead of one commit each"
+    )
+    message_durability: str = Field(
+        default="after_broadcast",
+        description="'after_broadcast' to broadcast/respond before the batch commits, 'before_ack' to wait for the commit"
+    )
+    message_flush_window_ms: float = Field(
+        default=20.0,
+        description="Time messages are collected before a batch is written"
+    )
+    message_flush_max_batch: int = Field(
+        default=200,
+        description="Maximum number of rows written by one INSERT"
+    )
+
+    # LLM adapter registry
+    llm_adapter_cache_size: int = Field(
+        default=64,
+        description="Maximum number of LLM adapters (and their HTTP clients) kept alive"
+    )
+    llm_adapter_idle_ttl: float = Field(
+        default=600.0,
+        description="Seconds an unused LLM adapter is kept before being closed (0 disables idle eviction)"
+    )
+    
     # Server
     host: str = Field(default="0.0.0.0", description="Server host")
     port: int = Field(default=8000, description="Server port", validation_alias="APP_PORT")
@@ -49,13 +189,65 @@ class Settings(BaseSettings):
     )
     
     # Application
+    # Only a candidate cap: the token budget decides how much history is sent, and a
+    # low cap would leave it unused with short messages
     max_context_messages: int = Field(
+        default=100,
+        description="Maximum number of recent messages considered when filling the context token budget"
+    )
+    context_token_budget: int = Field(
+        default=4000,
+        description="Default token budget for the system prompt plus history (agents may override)"
+    )
+    context_token_cache_size: int = Field(
+        default=10000,
+        description="Maximum number of cached per-message token counts"
+    )
+    summary_enabled: bool = Field(
+        default=True,
+        description="Keep a rolling summary of long rooms and chat sessions"
+    )
+    summary_interval_messages: int = Field(
         default=20,
-        description="Maximum number of messages to include in context"
+        description="Number of new messages that triggers a summary update"
+    )
+    summary_keep_recent_messages: int = Field(
+        default=10,
+        description="Most recent messages always sent verbatim instead of being summarized"
+    )
+    summary_max_words: int = Field(
+        default=200,
+        description="Target maximum length of a summary in words"
+    )
+    turn_timeout_seconds: float = Field(
+        default=90.0,
+        description="Default deadline for one room turn in seconds (agents and rooms may override)"
     )
     default_sleep_between_messages: float = Field(
         default=2.0,
-        description="Default sleep time between messages in seconds (lower for dev/test)"
+        description="Default sleep time between messages in seconds (lower for dev/test; rooms may override)"
+    )
+    room_pipelined_turns: bool = Field(
+        default=True,
+        description="Generate the next room turn during the pause between messages and hold only its publishing"
+    )
+    
+    # Room runtime
+    max_running_rooms: int = Field(
+        default=20,
+        description="Maximum number of room conversations running at once (further starts are queued)"
+    )
+    room_queue_size: int = Field(
+        default=100,
+        description="Maximum number of room conversations waiting for a free slot"
+    )
+    room_run_history: int = Field(
+        default=50,
+        description="Number of ended room runs (with their outcome and errors) kept for the admin endpoint"
+    )
+    admin_usernames: str = Field(
+        default="",
+        description="Comma-separated usernames allowed to use the admin endpoints"
     )
     
     # Message templates (can be overridden for i18n)
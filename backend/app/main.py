@@ -1,6 +1,7 @@
 """
 Main FastAPI application.
 """
+import asyncio
 import logging
 import os
 from contextlib import asynccontextmanager
@@ -11,8 +12,8 @@ from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.core.database import engine, Base
-from app.api import agents, roles, rooms, websocket, auth, chat
+from app.core.database import async_engine, engine, Base
+from app.api import agents, roles, rooms, websocket, auth, chat, metrics, usage, admin
 
 # Configure logging
 logging.basicConfig(
@@ -33,24 +34,46 @@ async def lifespan(app: FastAPI):
     
     # Reset any "running" rooms to "idle" on startup (since orchestrators are in-memory)
     from app.core.database import SessionLocal
-    from app.models import Room
+    from app.models import Agent, Room
+    from app.services.context_builder import token_counter
     
     db = SessionLocal()
+    agent_models = []
     try:
         running_rooms = db.query(Room).filter(Room.status == "running").all()
         for room in running_rooms:
             room.status = "idle"
             logger.info(f"Reset room {room.id} status to idle on startup")
         db.commit()
+        agent_models = db.query(Agent.provider, Agent.model_name).distinct().all()
     except Exception as e:
         logger.error(f"Error resetting room statuses: {str(e)}")
     finally:
         db.close()
     
+    # Load the agents' tokenizers off the event loop (may download encodings)
+    tokenizer_warm_up = asyncio.create_task(token_counter.warm_up(agent_models))
+    
     yield
     
+    if not tokenizer_warm_up.done():
+        tokenizer_warm_up.cancel()
+    
     # Shutdown
     logger.info("Shutting down application...")
+    from app.services.llm_adapter import adapter_registry
+    from app.services.http_pool import http_pool
+    from app.services.summarizer import summarizer
+    from app.services.room_runtime import room_runtime
+    from app.services.message_writer import message_writer
+    await room_runtime.aclose()
+    await summarizer.aclose()
+    await message_writer.aclose()
+    # Last: everything above may still use the database
+    await async_engine.dispose()
+    engine.dispose()
+    await adapter_registry.aclose()
+    await http_pool.aclose()
 
 
 # Create FastAPI app
@@ -105,6 +128,9 @@ app.include_router(roles.router)
 app.include_router(rooms.router)
 app.include_router(websocket.router)
 app.include_router(chat.router)
+app.include_router(metrics.router)
+app.include_router(usage.router)
+app.include_router(admin.router)
 
 
 # Serve SPA if dist directory exists (Production)
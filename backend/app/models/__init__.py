@@ -2,7 +2,7 @@
 SQLAlchemy database models for the AI Group Chat system.
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, Float, ForeignKey, Table, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, Float, ForeignKey, Table, DateTime, Boolean, JSON
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
@@ -50,6 +50,13 @@ class Agent(Base):
     use_proxy = Column(Boolean, default=False, nullable=False)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     is_global = Column(Boolean, default=False)
+    fallback_chain = Column(JSON, nullable=True)  # [{"provider": ..., "model_name": ..., "api_key_config": ..., "use_proxy": ...}, ...]
+    hedge_enabled = Column(Boolean, default=False, nullable=False)
+    cache_enabled = Column(Boolean, nullable=True)  # None = cache only at temperature 0
+    context_token_budget = Column(Integer, nullable=True)  # None = settings.context_token_budget
+    max_tokens = Column(Integer, nullable=True)  # None = room mode / settings.llm_default_max_tokens
+    stop_sequences = Column(JSON, nullable=True)  # ["\nUser:", ...]
+    turn_timeout = Column(Float, nullable=True)  # Seconds; None = settings.turn_timeout_seconds
     
     # Relationships
     creator = relationship("User", back_populates="agents")
@@ -70,6 +77,8 @@ class Room(Base):
     status = Column(String(20), default='idle', nullable=False)  # idle, running, finished
     mode = Column(String(20), default='debate', nullable=False)  # debate, group_chat
     session_id = Column(Integer, default=0, nullable=False)  # For managing conversation restarts
+    turn_timeout = Column(Float, nullable=True)  # Seconds per turn; None = agent / settings default
+    pacing_seconds = Column(Float, nullable=True)  # Seconds between messages; None = settings default
     creator_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
@@ -77,6 +86,7 @@ class Room(Base):
     creator = relationship("User", back_populates="rooms")
     roles = relationship("Role", secondary=room_roles, back_populates="rooms")
     messages = relationship("Message", back_populates="room", cascade="all, delete-orphan")
+    summaries = relationship("ConversationSummary", back_populates="room", cascade="all, delete-orphan")
 
 
 class Message(Base):
@@ -93,6 +103,16 @@ class Message(Base):
     sender_name = Column(String(100), nullable=True)  # Name of the sender (Agent or Role name)
     role_id = Column(Integer, ForeignKey('roles.id'), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # LLM call metadata (assistant messages only)
+    provider = Column(String(50), nullable=True)
+    model_name = Column(String(100), nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    cached_tokens = Column(Integer, nullable=True)
+    ttft_ms = Column(Float, nullable=True)
+    latency_ms = Column(Float, nullable=True)
+    finish_reason = Column(String(50), nullable=True)
+    provider_request_id = Column(String(200), nullable=True)
     
     # Relationships
     room = relationship("Room", back_populates="messages")
@@ -138,6 +158,7 @@ class ChatSession(Base):
     
     # Relationships
     messages = relationship("ChatSessionMessage", back_populates="session", cascade="all, delete-orphan")
+    summaries = relationship("ConversationSummary", back_populates="chat_session", cascade="all, delete-orphan")
     agent = relationship("Agent")
     role = relationship("Role")
 
@@ -153,6 +174,35 @@ class ChatSessionMessage(Base):
     content = Column(Text, nullable=False)
     image_url = Column(Text, nullable=True)  # Base64 data or URL
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # LLM call metadata (assistant messages only)
+    provider = Column(String(50), nullable=True)
+    model_name = Column(String(100), nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    cached_tokens = Column(Integer, nullable=True)
+    ttft_ms = Column(Float, nullable=True)
+    latency_ms = Column(Float, nullable=True)
+    finish_reason = Column(String(50), nullable=True)
+    provider_request_id = Column(String(200), nullable=True)
     
     # Relationships
     session = relationship("ChatSession", back_populates="messages")
+
+
+class ConversationSummary(Base):
+    """Rolling summary of the older part of a room session or a chat session."""
+    
+    __tablename__ = "conversation_summaries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    room_id = Column(Integer, ForeignKey('rooms.id', ondelete='CASCADE'), nullable=True, index=True)
+    room_session_id = Column(Integer, default=0, nullable=False)  # Room.session_id the summary belongs to
+    chat_session_id = Column(Integer, ForeignKey('chat_sessions.id', ondelete='CASCADE'), nullable=True, index=True)
+    content = Column(Text, nullable=False)
+    last_message_id = Column(Integer, nullable=False)  # Newest message folded into the summary
+    message_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    # Relationships
+    room = relationship("Room", back_populates="summaries")
+    chat_session = relationship("ChatSession", back_populates="summaries")
@@ -40,6 +40,17 @@ class TokenData(BaseModel):
 
 
 # ===== Agent Schemas =====
+class FallbackTarget(BaseModel):
+    """A provider/model to fall back to when the agent's primary fails or is slow."""
+    provider: str = Field(..., min_length=1, max_length=50)
+    model_name: str = Field(..., min_length=1, max_length=100)
+    api_key_config: Optional[str] = None
+    use_proxy: bool = False
+    temperature: Optional[float] = Field(None, ge=0.0, le=2.0)
+    
+    model_config = ConfigDict(protected_namespaces=())
+
+
 class AgentBase(BaseModel):
     """Base agent schema."""
     name: str = Field(..., min_length=1, max_length=100)
@@ -50,6 +61,13 @@ class AgentBase(BaseModel):
     api_key_config: Optional[str] = None
     temperature: float = Field(default=0.7, ge=0.0, le=2.0)
     is_global: bool = False
+    fallback_chain: Optional[List[FallbackTarget]] = None
+    hedge_enabled: bool = False
+    cache_enabled: Optional[bool] = None
+    context_token_budget: Optional[int] = Field(None, gt=0)
+    max_tokens: Optional[int] = Field(None, gt=0)
+    stop_sequences: Optional[List[str]] = Field(None, max_length=4)
+    turn_timeout: Optional[float] = Field(None, gt=0)
     
     model_config = ConfigDict(protected_namespaces=())
 
@@ -70,6 +88,13 @@ class AgentUpdate(BaseModel):
     temperature: Optional[float] = Field(None, ge=0.0, le=2.0)
     use_proxy: Optional[bool] = None
     is_global: Optional[bool] = None
+    fallback_chain: Optional[List[FallbackTarget]] = None
+    hedge_enabled: Optional[bool] = None
+    cache_enabled: Optional[bool] = None
+    context_token_budget: Optional[int] = Field(None, gt=0)
+    max_tokens: Optional[int] = Field(None, gt=0)
+    stop_sequences: Optional[List[str]] = Field(None, max_length=4)
+    turn_timeout: Optional[float] = Field(None, gt=0)
     
     model_config = ConfigDict(protected_namespaces=())
 
@@ -127,6 +152,8 @@ class RoomBase(BaseModel):
     topic: str = Field(..., min_length=1)
     max_rounds: int = Field(default=20, ge=1, le=100)
     mode: str = Field(default='debate')  # debate, group_chat
+    turn_timeout: Optional[float] = Field(None, gt=0)  # Seconds per turn
+    pacing_seconds: Optional[float] = Field(None, ge=0)  # Seconds between messages
 
 
 class RoomCreate(RoomBase):
@@ -169,7 +196,22 @@ class MessageCreate(MessageBase):
     role_id: Optional[int] = None
 
 
-class MessageResponse(MessageBase):
+class LLMUsageFields(BaseModel):
+    """Usage and timing recorded for LLM-generated messages."""
+    provider: Optional[str] = None
+    model_name: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    ttft_ms: Optional[float] = None
+    latency_ms: Optional[float] = None
+    finish_reason: Optional[str] = None
+    provider_request_id: Optional[str] = None
+    
+    model_config = ConfigDict(protected_namespaces=())
+
+
+class MessageResponse(MessageBase, LLMUsageFields):
     """Schema for message response."""
     id: int
     room_id: int
@@ -178,7 +220,7 @@ class MessageResponse(MessageBase):
     role_id: Optional[int] = None
     created_at: datetime
     
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, protected_namespaces=())
 
 
 # ===== Chat Session Schemas =====
@@ -192,12 +234,12 @@ class ChatSessionMessageCreate(ChatSessionMessageBase):
     pass
 
 
-class ChatSessionMessageResponse(ChatSessionMessageBase):
+class ChatSessionMessageResponse(ChatSessionMessageBase, LLMUsageFields):
     id: int
     session_id: int
     created_at: datetime
     
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, protected_namespaces=())
 
 
 class ChatSessionBase(BaseModel):
@@ -234,3 +276,31 @@ class ChatRequest(BaseModel):
 class ChatCompletionResponse(BaseModel):
     """Schema for direct chat response."""
     content: str
+
+
+# ===== Usage Schemas =====
+class UsageBreakdown(BaseModel):
+    """Aggregated LLM usage for one provider/model."""
+    provider: Optional[str] = None
+    model_name: Optional[str] = None
+    messages: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    avg_ttft_ms: Optional[float] = None
+    avg_latency_ms: Optional[float] = None
+    
+    model_config = ConfigDict(protected_namespaces=())
+
+
+class UsageSummary(BaseModel):
+    """Aggregated LLM usage for a room, agent or user."""
+    scope: str  # room, agent, user
+    scope_id: int
+    messages: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    avg_ttft_ms: Optional[float] = None
+    avg_latency_ms: Optional[float] = None
+    by_model: List[UsageBreakdown] = []
@@ -0,0 +1,237 @@
+"""
+Agent-level LLM adapter: provider fallback chains and hedged requests.
+
+An agent can list fallback targets (e.g. DeepSeek -> DashScope qwen-plus ->
+local Ollama). Targets are tried in order when a call fails. With hedging
+enabled, if the primary has not produced its first token within the observed
+latency percentile, the next target is fired as well and whichever answers
+first wins; the loser is cancelled.
+"""
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from app.core.config import settings
+from app.models import Agent
+from app.services.latency import latency_tracker
+from app.services.llm_adapter import BaseLLMAdapter, get_llm_adapter
+from app.services.llm_result import GenerationOptions, LLMResult
+
+logger = logging.getLogger(__name__)
+
+# Process-wide fallback/hedging counters
+fallback_stats: Dict[str, int] = {"fallbacks_used": 0, "hedges_fired": 0}
+
+
+class AgentAdapter(BaseLLMAdapter):
+    """
+    Adapter that routes a call across an agent's primary and fallback targets.
+
+    The targets are regular registry adapters, so each one still applies its own
+    cache, limits, retries and circuit breaker; this class only decides which
+    target(s) to call and passes on the agent's per-call options.
+    """
+
+    def __init__(self, targets: List[BaseLLMAdapter], hedge: bool = False, cache: Optional[bool] = None,
+                 options: Optional[GenerationOptions] = None):
+        """
+        Initialize the adapter.
+
+        Args:
+            targets: Primary adapter followed by fallbacks, in order
+            hedge: Whether to hedge the primary with the next target on slow first tokens
+            cache: Agent's response cache opt-in/opt-out (None = default policy)
+            options: Agent's generation limits (max_tokens, stop sequences)
+        """
+        primary = targets[0]
+        super().__init__(primary.model_name, primary.temperature, primary.api_key, primary.use_proxy)
+        self.provider = primary.provider
+        self.targets = targets
+        self.hedge = hedge
+        self.cache = cache
+        self.options = options or GenerationOptions()
+
+    async def aclose(self):
+        """Targets belong to the adapter registry, which closes them."""
+        return None
+
+    async def warm_up(self):
+        await asyncio.gather(*(target.warm_up() for target in self.targets), return_exceptions=True)
+
+    def _stages(self) -> List[Tuple[BaseLLMAdapter, ...]]:
+        """Group targets into stages: hedged pairs when hedging, otherwise one target per stage."""
+        if not self.hedge:
+            return [(target,) for target in self.targets]
+        return [tuple(self.targets[i:i + 2]) for i in range(0, len(self.targets), 2)]
+
+    @staticmethod
+    def _hedge_delay(adapter: BaseLLMAdapter, kind: str) -> float:
+        observed = latency_tracker.percentile((adapter.provider, adapter.model_name, kind), settings.llm_hedge_percentile)
+        return observed if observed is not None else settings.llm_hedge_default_delay
+
+    async def _race(self, primary: Callable[[], Awaitable[Any]], backup: Callable[[], Awaitable[Any]],
+                    delay: float, discard: Optional[Callable[[Any], Awaitable[None]]] = None) -> Any:
+        """
+        Run `primary`, firing `backup` if it is still pending after `delay` seconds
+        (or as soon as it fails). Returns the first successful result and cancels the other.
+        """
+        tasks = [asyncio.create_task(primary())]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done and tasks[0].exception() is None:
+                winner = tasks[0]
+                return winner.result()
+            if not done:
+                fallback_stats["hedges_fired"] += 1
+                logger.info(f"Hedging {self.provider}/{self.model_name} after {delay:.2f}s without a first token")
+            tasks.append(asyncio.create_task(backup()))
+
+            last_error = tasks[0].exception() if tasks[0].done() else None
+            pending = {task for task in tasks if not task.done()}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # A loser may have completed successfully in the same tick; release what it holds
+            if discard:
+                for task in tasks:
+                    if task is not winner and not task.cancelled() and task.exception() is None:
+                        await discard(task.result())
+
+    async def complete(self, messages: List[Dict[str, str]], system_prompt: str, cache: Optional[bool] = None,
+                       options: Optional[GenerationOptions] = None) -> LLMResult:
+        # Policies are applied by each target adapter, not here
+        cache = self.cache if cache is None else cache
+        options = self.options.merge(options)
+        last_error: Optional[Exception] = None
+        for index, stage in enumerate(self._stages()):
+            if index > 0:
+                fallback_stats["fallbacks_used"] += 1
+                logger.warning(f"Falling back to {stage[0].provider}/{stage[0].model_name} after error: {str(last_error)}")
+            try:
+                if len(stage) == 1:
+                    return await stage[0].complete(messages, system_prompt, cache=cache, options=options)
+                primary, backup = stage
+                return await self._race(
+                    lambda: primary.complete(messages, system_prompt, cache=cache, options=options),
+                    lambda: backup.complete(messages, system_prompt, cache=cache, options=options),
+                    self._hedge_delay(primary, "latency")
+                )
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+    async def _generate(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions) -> LLMResult:
+        return await self.complete(messages, system_prompt, options=options)
+
+    @staticmethod
+    async def _open_stream(adapter: BaseLLMAdapter, messages: List[Dict[str, str]], system_prompt: str,
+                           cache: Optional[bool], options: GenerationOptions
+                           ) -> Tuple[Optional[Union[str, LLMResult]], AsyncIterator]:
+        """Start a stream and wait for its first item."""
+        stream = adapter._stream_items(messages, system_prompt, cache, options)
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            return None, stream
+        except BaseException:
+            await stream.aclose()
+            raise
+        return first, stream
+
+    @staticmethod
+    async def _close_opened(opened: Tuple[Any, AsyncIterator]):
+        await opened[1].aclose()
+
+    async def _stream_items(self, messages: List[Dict[str, str]], system_prompt: str, cache: Optional[bool],
+                            options: Optional[GenerationOptions] = None):
+        cache = self.cache if cache is None else cache
+        options = self.options.merge(options)
+        last_error: Optional[Exception] = None
+        for index, stage in enumerate(self._stages()):
+            if index > 0:
+                fallback_stats["fallbacks_used"] += 1
+                logger.warning(f"Falling back to {stage[0].provider}/{stage[0].model_name} after error: {str(last_error)}")
+            try:
+                if len(stage) == 1:
+                    first, stream = await self._open_stream(stage[0], messages, system_prompt, cache, options)
+                else:
+                    primary, backup = stage
+                    first, stream = await self._race(
+                        lambda: self._open_stream(primary, messages, system_prompt, cache, options),
+                        lambda: self._open_stream(backup, messages, system_prompt, cache, options),
+                        self._hedge_delay(primary, "ttft"),
+                        discard=self._close_opened
+                    )
+            except Exception as e:
+                last_error = e
+                continue
+
+            # Output has started; mid-stream failures propagate instead of falling back
+            try:
+                if first is not None:
+                    yield first
+                async for item in stream:
+                    yield item
+            finally:
+                await stream.aclose()
+            return
+        raise last_error
+
+
+def agent_generation_options(agent: Agent) -> GenerationOptions:
+    """The agent's own max_tokens cap and stop sequences (unset values are ignored)."""
+    max_tokens = getattr(agent, "max_tokens", None)
+    stop = getattr(agent, "stop_sequences", None)
+    return GenerationOptions(
+        max_tokens=max_tokens if isinstance(max_tokens, int) and max_tokens > 0 else None,
+        stop=tuple(item for item in stop if isinstance(item, str) and item) if isinstance(stop, list) else ()
+    )
+
+
+def get_agent_adapter(agent: Agent) -> BaseLLMAdapter:
+    """
+    Build the adapter for an agent, including its fallback chain.
+
+    Args:
+        agent: Agent row
+
+    Returns:
+        AgentAdapter applying the agent's fallback, hedging, cache and generation settings
+    """
+    primary = get_llm_adapter(
+        provider=agent.provider,
+        model_name=agent.model_name,
+        temperature=agent.temperature,
+        api_key=agent.api_key_config,
+        use_proxy=agent.use_proxy
+    )
+    targets = [primary]
+    for spec in agent.fallback_chain or []:
+        try:
+            targets.append(get_llm_adapter(
+                provider=spec["provider"],
+                model_name=spec["model_name"],
+                temperature=spec.get("temperature", agent.temperature),
+                api_key=spec.get("api_key_config"),
+                use_proxy=spec.get("use_proxy", False)
+            ))
+        except (KeyError, ValueError) as e:
+            logger.warning(f"Skipping invalid fallback target for agent {agent.id}: {str(e)}")
+
+    return AgentAdapter(
+        targets,
+        hedge=bool(agent.hedge_enabled),
+        cache=agent.cache_enabled,
+        options=agent_generation_options(agent)
+    )
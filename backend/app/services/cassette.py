@@ -0,0 +1,262 @@
+"""
+Record/replay cassettes for LLM traffic.
+
+With `llm_cassette_mode` set, `get_llm_adapter` hands out CassetteAdapters.
+In record mode every provider call is written to a JSON Lines cassette: the
+canonical request fingerprint, the streamed chunks with their delays, the usage
+result, or the classified error. In replay mode the cassette answers instead of
+the provider, so whole orchestrator runs can be reproduced without network or
+API keys, either with the recorded timing or as fast as possible.
+
+Cassettes sit below the adapter-layer policies, so cache, coalescing, limits
+and retries behave in replay exactly as they do against a live provider.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.llm_adapter import BaseLLMAdapter
+from app.services.llm_result import GenerationOptions, LLMResult
+from app.services.resilience import LLMError
+
+logger = logging.getLogger(__name__)
+
+RESULT_FIELDS = ("prompt_tokens", "completion_tokens", "cached_tokens", "finish_reason", "request_id")
+
+
+class Cassette:
+    """Recorded calls grouped by request fingerprint, replayed in recording order."""
+
+    def __init__(self, path: str):
+        """
+        Initialize the cassette, loading existing entries from `path`.
+
+        Args:
+            path: JSON Lines file; created on the first recorded call
+        """
+        self.path = path
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursors: Dict[str, int] = {}
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as handle:
+                for line in handle:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    async def record(self, entry: Dict[str, Any]):
+        """Add a call; its line is appended to the file in a worker thread, off the event loop."""
+        self._entries.setdefault(entry["key"], []).append(entry)
+        self.recorded += 1
+        await asyncio.to_thread(self._append, json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def _append(self, line: str):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One write per line in append mode: concurrent recordings never interleave within a line
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(line)
+
+    def next(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the next recorded call for `key`.
+
+        Repeated requests get the recorded answers in order (sampled outputs
+        differ between calls), cycling once they run out.
+        """
+        entries = self._entries.get(key)
+        if not entries:
+            self.misses += 1
+            return None
+        cursor = self._cursors.get(key, 0)
+        self._cursors[key] = cursor + 1
+        self.replayed += 1
+        return entries[cursor % len(entries)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "entries": len(self),
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses,
+        }
+
+
+_cassettes: Dict[str, Cassette] = {}
+
+
+def get_cassette(path: Optional[str] = None) -> Cassette:
+    """Process-wide cassette for `path` (defaults to settings.llm_cassette_path)."""
+    path = path or settings.llm_cassette_path
+    cassette = _cassettes.get(path)
+    if cassette is None:
+        cassette = _cassettes[path] = Cassette(path)
+    return cassette
+
+
+def _error_fields(error: LLMError) -> Dict[str, Any]:
+    return {
+        "message": str(error),
+        "status_code": error.status_code,
+        "retryable": error.retryable,
+        "retry_after": error.retry_after,
+    }
+
+
+class CassetteAdapter(BaseLLMAdapter):
+    """
+    Adapter recording the provider calls of `inner` to a cassette, or replaying
+    them from it when there is no inner adapter.
+    """
+
+    def __init__(self, provider: str, model_name: str, temperature: float, cassette: Cassette,
+                 inner: Optional[BaseLLMAdapter] = None, realtime: bool = True, api_key: Optional[str] = None,
+                 use_proxy: bool = False):
+        """
+        Initialize the adapter.
+
+        Args:
+            provider: Provider name (part of the request fingerprint)
+            model_name: Model name
+            temperature: Temperature (part of the request fingerprint)
+            cassette: Cassette to record to / replay from
+            inner: Real adapter to record; None replays
+            realtime: Replay with the recorded timing
+            api_key: API key of the wrapped configuration (defaults to inner's); keeps
+                     per-key rate limits and request coalescing apart
+            use_proxy: Proxy setting of the wrapped configuration (defaults to inner's)
+        """
+        if inner is not None:
+            api_key = api_key if api_key is not None else inner.api_key
+            use_proxy = use_proxy or inner.use_proxy
+        super().__init__(model_name, temperature, api_key, use_proxy)
+        self.provider = provider
+        self.cassette = cassette
+        self.inner = inner
+        self.realtime = realtime
+
+    async def aclose(self):
+        if self.inner is not None:
+            await self.inner.aclose()
+
+    async def warm_up(self):
+        if self.inner is not None:
+            await self.inner.warm_up()
+
+    def _entry(self, key: str, stream: bool) -> Dict[str, Any]:
+        return {"key": key, "provider": self.provider, "model_name": self.model_name, "stream": stream}
+
+    def _replay_entry(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions) -> Dict[str, Any]:
+        key = self._request_key(messages, system_prompt, options)
+        entry = self.cassette.next(key)
+        if entry is None:
+            raise LLMError(f"No cassette entry for {self.provider}/{self.model_name} request {key[:12]}",
+                           provider=self.provider)
+        if "error" in entry:
+            error = entry["error"]
+            raise LLMError(error["message"], provider=self.provider, status_code=error.get("status_code"),
+                           retryable=bool(error.get("retryable")), retry_after=error.get("retry_after"))
+        return entry
+
+    def _replayed_result(self, entry: Dict[str, Any]) -> LLMResult:
+        fields = {name: entry.get("result", {}).get(name) for name in RESULT_FIELDS}
+        return LLMResult(content="".join(text for _, text in entry["chunks"]), **fields)
+
+    async def _pause(self, delay_ms: float):
+        if self.realtime and delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000)
+
+    async def _generate(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions) -> LLMResult:
+        if self.inner is None:
+            entry = self._replay_entry(messages, system_prompt, options)
+            # A non-streamed answer arrives all at once after the whole latency
+            await self._pause(sum(delay for delay, _ in entry["chunks"]))
+            return self._replayed_result(entry)
+
+        entry = self._entry(self._request_key(messages, system_prompt, options), stream=False)
+        start = time.perf_counter()
+        try:
+            result = self.inner._as_result(await self.inner._generate(messages, system_prompt, options))
+        except LLMError as e:
+            await self.cassette.record({**entry, "error": _error_fields(e)})
+            raise
+        entry["chunks"] = [[round((time.perf_counter() - start) * 1000, 1), result.content]]
+        entry["result"] = {name: getattr(result, name) for name in RESULT_FIELDS}
+        await self.cassette.record(entry)
+        return result
+
+    async def _generate_stream(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions):
+        if self.inner is None:
+            entry = self._replay_entry(messages, system_prompt, options)
+            for delay, text in entry["chunks"]:
+                await self._pause(delay)
+                yield text
+            yield self._replayed_result(entry)
+            return
+
+        entry = self._entry(self._request_key(messages, system_prompt, options), stream=True)
+        chunks: List[List[Any]] = []
+        result = LLMResult()
+        last = time.perf_counter()
+        try:
+            async for item in self.inner._generate_stream(messages, system_prompt, options):
+                if isinstance(item, LLMResult):
+                    result.merge_usage(item)
+                else:
+                    now = time.perf_counter()
+                    chunks.append([round((now - last) * 1000, 1), item])
+                    last = now
+                yield item
+        except LLMError as e:
+            # Errors after output has started cannot be replayed faithfully as a single entry
+            if not chunks:
+                await self.cassette.record({**entry, "error": _error_fields(e)})
+            raise
+        # Only complete streams are recorded (an abandoned stream never gets here)
+        entry["chunks"] = chunks
+        entry["result"] = {name: getattr(result, name) for name in RESULT_FIELDS}
+        await self.cassette.record(entry)
+
+
+def cassette_adapter(provider: str, model_name: str, temperature: float,
+                     inner: Optional[BaseLLMAdapter] = None, api_key: Optional[str] = None,
+                     use_proxy: bool = False) -> CassetteAdapter:
+    """
+    Wrap `inner` for the configured cassette mode.
+
+    Args:
+        provider: Provider name
+        model_name: Model name
+        temperature: Temperature
+        inner: Real adapter (required when recording, unused when replaying)
+        api_key: API key of the agent configuration
+        use_proxy: Proxy setting of the agent configuration
+
+    Returns:
+        CassetteAdapter recording `inner`, or replaying without it
+    """
+    mode = settings.llm_cassette_mode
+    if mode not in ("record", "replay"):
+        raise ValueError(f"Unsupported cassette mode: {mode}")
+    return CassetteAdapter(
+        provider,
+        model_name,
+        temperature,
+        get_cassette(),
+        inner=inner if mode == "record" else None,
+        realtime=settings.llm_cassette_realtime,
+        api_key=api_key,
+        use_proxy=use_proxy
+    )
@@ -0,0 +1,195 @@
+"""
+Token-aware context building for LLM calls.
+
+Instead of sending a fixed number of messages, the history is filled from the
+newest message backwards until the agent's token budget is spent. Tokens are
+counted with the model's tokenizer when one is available (tiktoken for
+OpenAI-compatible models) and with the fast local estimator otherwise. Counts
+are cached per message text, so a message is counted once no matter how many
+turns it stays in context.
+
+Loading a tokenizer can download its encoding, so it never happens on the
+event loop: the models of existing agents are loaded in a worker thread at
+startup, and a model first seen while the loop runs is counted with the
+estimator until its tokenizer has been loaded in the background.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.rate_limit import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Per-message framing overhead (role markers, separators) added by chat formats
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Providers serving OpenAI models, whose tokenizers tiktoken knows
+TIKTOKEN_PROVIDERS = {"openai", "chatanywhere"}
+
+ESTIMATOR = "estimate"
+
+
+class TokenCounter:
+    """Counts tokens per provider/model and caches the count of every message text."""
+
+    def __init__(self, max_entries: int = 10000):
+        """
+        Initialize the counter.
+
+        Args:
+            max_entries: Maximum cached message counts
+        """
+        self.max_entries = max_entries
+        # (tokenizer name, text) -> token count
+        self._counts: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        # (provider, model) -> (tokenizer name, encoding or None)
+        self._tokenizers: Dict[Tuple[str, str], Tuple[str, Any]] = {}
+        # (provider, model) -> background load in progress
+        self._loading: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _load_tokenizer(self, provider: str, model_name: str) -> Tuple[str, Any]:
+        if provider not in TIKTOKEN_PROVIDERS:
+            return ESTIMATOR, None
+        try:
+            import tiktoken
+        except ImportError:
+            return ESTIMATOR, None
+        try:
+            try:
+                encoding = tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # Encodings are downloaded on first use; offline hosts fall back to the estimator
+            logger.warning(f"Tokenizer unavailable for {provider}/{model_name}, using estimator: {str(e)}")
+            return ESTIMATOR, None
+        return encoding.name, encoding
+
+    def _tokenizer(self, provider: str, model_name: str) -> Tuple[str, Any]:
+        key = (provider, model_name)
+        tokenizer = self._tokenizers.get(key)
+        if tokenizer is not None:
+            return tokenizer
+        if provider not in TIKTOKEN_PROVIDERS:
+            tokenizer = self._tokenizers[key] = (ESTIMATOR, None)
+            return tokenizer
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop to stall (scripts, worker threads): load in place
+            tokenizer = self._tokenizers[key] = self._load_tokenizer(provider, model_name)
+            return tokenizer
+        self._start_loading(provider, model_name)
+        return ESTIMATOR, None
+
+    def _start_loading(self, provider: str, model_name: str) -> asyncio.Task:
+        key = (provider, model_name)
+        task = self._loading.get(key)
+        if task is None:
+            task = self._loading[key] = asyncio.create_task(self._load_in_thread(provider, model_name))
+        return task
+
+    async def _load_in_thread(self, provider: str, model_name: str):
+        key = (provider, model_name)
+        try:
+            self._tokenizers[key] = await asyncio.to_thread(self._load_tokenizer, provider, model_name)
+        finally:
+            self._loading.pop(key, None)
+
+    async def warm_up(self, models: Iterable[Tuple[str, str]]):
+        """Load the tokenizers of (provider, model) pairs in a worker thread (called at startup)."""
+        tasks = []
+        for provider, model_name in models:
+            provider = (provider or "").lower()
+            if (provider, model_name) in self._tokenizers or provider not in TIKTOKEN_PROVIDERS:
+                continue
+            tasks.append(self._start_loading(provider, model_name))
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def count(self, provider: str, model_name: str, text: str) -> int:
+        """
+        Count the tokens of a text for a provider/model.
+
+        Args:
+            provider: Provider name
+            model_name: Model name
+            text: Text to count
+
+        Returns:
+            Number of tokens
+        """
+        if not text:
+            return 0
+        name, encoding = self._tokenizer(provider, model_name)
+        key = (name, text)
+        cached = self._counts.get(key)
+        if cached is not None:
+            self._counts.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        tokens = len(encoding.encode(text, disallowed_special=())) if encoding else estimate_tokens(text)
+        self._counts[key] = tokens
+        if len(self._counts) > self.max_entries:
+            self._counts.popitem(last=False)
+        return tokens
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "cached_counts": len(self._counts),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "tokenizers": {f"{provider}/{model}": name for (provider, model), (name, _) in self._tokenizers.items()},
+        }
+
+
+# Global token counter
+token_counter = TokenCounter(max_entries=settings.context_token_cache_size)
+
+
+def fit_to_budget(messages: List[Dict[str, Any]], budget: int, provider: str, model_name: str,
+                  system_prompt: str = "") -> List[Dict[str, Any]]:
+    """
+    Keep the newest messages that fit in a token budget.
+
+    The system prompt is charged first, then messages are added from newest to
+    oldest until the next one would overflow the budget. The newest message is
+    always kept so the model has something to answer.
+
+    Args:
+        messages: Messages in chronological order ('role' and 'content')
+        budget: Total token budget for the system prompt and history
+        provider: Provider name, selects the tokenizer
+        model_name: Model name, selects the tokenizer
+        system_prompt: System prompt sent with the messages
+
+    Returns:
+        The kept messages, in chronological order
+    """
+    provider = provider.lower()
+    remaining = budget - token_counter.count(provider, model_name, system_prompt)
+    kept: List[Dict[str, Any]] = []
+    for message in reversed(messages):
+        cost = token_counter.count(provider, model_name, message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+        if cost > remaining and kept:
+            break
+        kept.append(message)
+        remaining -= cost
+    kept.reverse()
+    return kept
+
+
+def agent_token_budget(agent: Optional[Any]) -> int:
+    """Return the agent's context token budget, or the configured default."""
+    budget = getattr(agent, "context_token_budget", None) if agent is not None else None
+    if isinstance(budget, int) and budget > 0:
+        return budget
+    return settings.context_token_budget
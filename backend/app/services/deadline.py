@@ -0,0 +1,38 @@
+"""
+End-to-end deadlines for LLM calls.
+
+A deadline is set once per unit of work (e.g. one room turn) and carried in a
+context variable, so every layer below it (retries, fallbacks, hedges) sees how
+much time is left without threading it through each call. Tasks started inside
+the scope inherit it.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline (None if there is none)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """Set a deadline `seconds` from now; an enclosing, earlier deadline still applies."""
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
@@ -0,0 +1,101 @@
+"""
+Shared HTTP connection pools for upstream LLM providers.
+
+One pooled httpx.AsyncClient is kept per (base URL, proxy) pair and shared by
+every adapter that targets that endpoint, so concurrent rooms reuse a few warm
+keep-alive (or HTTP/2 multiplexed) connections instead of opening their own.
+"""
+import logging
+from typing import Dict, Optional, Tuple, Any
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    """HTTP/2 support in httpx requires the optional 'h2' package."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HTTPClientPool:
+    """Registry of pooled HTTP clients keyed by upstream base URL and proxy."""
+
+    def __init__(self):
+        self._clients: Dict[Tuple[str, Optional[str]], httpx.AsyncClient] = {}
+        self._http2_warned = False
+
+    def _build_client(self, proxy: Optional[str]) -> httpx.AsyncClient:
+        """Create a new pooled client using the limits and timeouts from settings."""
+        http2 = settings.llm_http2
+        if http2 and not _http2_available():
+            if not self._http2_warned:
+                logger.warning("LLM_HTTP2 is enabled but the 'h2' package is not installed; falling back to HTTP/1.1")
+                self._http2_warned = True
+            http2 = False
+
+        limits = httpx.Limits(
+            max_connections=settings.llm_max_connections,
+            max_keepalive_connections=settings.llm_max_keepalive_connections,
+            keepalive_expiry=settings.llm_keepalive_expiry
+        )
+        timeout = httpx.Timeout(
+            settings.llm_read_timeout,
+            connect=settings.llm_connect_timeout
+        )
+        if proxy:
+            return httpx.AsyncClient(proxies=proxy, limits=limits, timeout=timeout, http2=http2)
+        # Force direct connection, ignoring environment proxy variables to prevent accidental usage of global HTTP_PROXY
+        return httpx.AsyncClient(trust_env=False, limits=limits, timeout=timeout, http2=http2)
+
+    def get(self, base_url: str, use_proxy: bool = False) -> httpx.AsyncClient:
+        """
+        Get the shared client for an upstream endpoint.
+
+        Args:
+            base_url: Base URL of the provider API
+            use_proxy: Whether requests should go through settings.llm_proxy_url
+
+        Returns:
+            Pooled httpx.AsyncClient
+        """
+        proxy = settings.llm_proxy_url if use_proxy and settings.llm_proxy_url else None
+        key = (base_url.rstrip("/"), proxy)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            if proxy:
+                logger.info(f"Creating pooled HTTP client for {key[0]} via proxy {proxy}")
+            else:
+                logger.info(f"Creating pooled HTTP client for {key[0]}")
+            client = self._build_client(proxy)
+            self._clients[key] = client
+        return client
+
+    async def aclose(self):
+        """Close every pooled client (used on application shutdown)."""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing pooled HTTP client: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the pooled endpoints."""
+        return {
+            "pools": len(self._clients),
+            "endpoints": [
+                {"base_url": base_url, "proxy": bool(proxy)}
+                for base_url, proxy in self._clients
+            ],
+        }
+
+
+# Global HTTP client pool
+http_pool = HTTPClientPool()
@@ -0,0 +1,46 @@
+"""
+Rolling latency statistics per provider and model.
+
+Used to pick hedging delays from observed time-to-first-token percentiles.
+"""
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+
+class LatencyTracker:
+    """Keeps a bounded window of latency samples per key."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """
+        Initialize the tracker.
+
+        Args:
+            window: Number of most recent samples kept per key
+            min_samples: Samples required before a percentile is reported
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[Tuple[str, ...], Deque[float]] = {}
+
+    def record(self, key: Tuple[str, ...], seconds: float):
+        """Record one latency sample."""
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = deque(maxlen=self.window)
+            self._samples[key] = samples
+        samples.append(seconds)
+
+    def percentile(self, key: Tuple[str, ...], pct: float) -> Optional[float]:
+        """
+        Return the `pct` percentile (0-100) for a key, or None if there are too few samples.
+        """
+        samples = self._samples.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+        return ordered[index]
+
+
+# Global tracker of time-to-first-token ("ttft") and full-response ("latency") samples
+latency_tracker = LatencyTracker()
@@ -0,0 +1,129 @@
+"""
+Per room mode output limits and early stopping of streamed turns.
+
+A room mode can cap a turn by tokens (sent to the provider as max_tokens), by
+stop sequences, and by words or sentences. Word and sentence budgets cannot be
+expressed to providers, so those turns are streamed and the stream is closed as
+soon as the budget is reached, which cancels the upstream request instead of
+paying for text that would be thrown away.
+"""
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.llm_adapter import BaseLLMAdapter
+from app.services.llm_result import GenerationOptions, LLMResult
+
+# CJK scripts have no spaces between words, so each character counts as a word
+_CJK = "぀-ヿ㐀-䶿一-鿿가-힯豈-﫿"
+_WORD_RE = re.compile(rf"[{_CJK}]|[^\s{_CJK}]+")
+# ASCII terminators only end a sentence once whitespace follows ("3.14", "e.g.x")
+_SENTENCE_END_RE = re.compile(r"[.!?]+(?=\s)|[。！？]+")
+
+
+class LengthBudget:
+    """Word and/or sentence limit for one generated message."""
+
+    def __init__(self, max_words: Optional[int] = None, max_sentences: Optional[int] = None):
+        """
+        Initialize the budget.
+
+        Args:
+            max_words: Maximum number of words (None = unlimited)
+            max_sentences: Maximum number of sentences (None = unlimited)
+        """
+        self.max_words = max_words if max_words and max_words > 0 else None
+        self.max_sentences = max_sentences if max_sentences and max_sentences > 0 else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_words is not None or self.max_sentences is not None
+
+    def cut(self, text: str) -> Optional[int]:
+        """
+        Return the offset to truncate `text` at once the budget is used up, else None.
+
+        A word is only known to be complete when the next one starts, so the
+        word budget triggers on the first word past the limit.
+        """
+        cuts: List[int] = []
+        if self.max_words is not None:
+            for index, match in enumerate(_WORD_RE.finditer(text)):
+                if index == self.max_words:
+                    cuts.append(match.start())
+                    break
+        if self.max_sentences is not None:
+            for index, match in enumerate(_SENTENCE_END_RE.finditer(text)):
+                if index + 1 == self.max_sentences:
+                    cuts.append(match.end())
+                    break
+        return min(cuts) if cuts else None
+
+
+def room_mode_limits(mode: str) -> Tuple[GenerationOptions, LengthBudget]:
+    """Generation options and length budget configured for a room mode."""
+    config: Dict[str, Any] = settings.room_mode_generation.get(mode) or {}
+    options = GenerationOptions(
+        max_tokens=config.get("max_tokens"),
+        stop=tuple(config.get("stop") or ())
+    )
+    budget = LengthBudget(config.get("max_words"), config.get("max_sentences"))
+    return options, budget
+
+
+async def complete_within_budget(adapter: BaseLLMAdapter, messages: List[Dict[str, str]], system_prompt: str,
+                                 budget: LengthBudget, options: Optional[GenerationOptions] = None,
+                                 on_text: Optional[Callable[[str], Awaitable[None]]] = None) -> LLMResult:
+    """
+    Stream a completion and stop it as soon as `budget` is reached.
+
+    With a disabled budget the whole completion is streamed (used to relay
+    turns to viewers as they are generated).
+
+    Args:
+        adapter: Adapter to stream from
+        messages: Conversation history
+        system_prompt: System prompt
+        budget: Word/sentence budget
+        options: Generation limits passed to the provider
+        on_text: Optional callback receiving the text as it streams (never past the budget)
+
+    Returns:
+        LLMResult; a cut stream has finish_reason "length_budget" and no
+        provider-reported usage (the final usage chunk never arrives)
+    """
+    started = time.perf_counter()
+    ttft_ms: Optional[float] = None
+    text = ""
+    emitted = 0
+    truncated = False
+    stream = adapter.stream(messages, system_prompt, options=options)
+    try:
+        async for chunk in stream:
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - started) * 1000
+            text += chunk
+            cut = budget.cut(text)
+            if cut is not None:
+                text = text[:cut].rstrip()
+                truncated = True
+            if on_text is not None and len(text) > emitted:
+                await on_text(text[emitted:])
+                emitted = len(text)
+            if truncated:
+                break
+    finally:
+        # Closing the stream cancels the upstream request
+        await stream.aclose()
+
+    if not truncated and stream.result is not None:
+        return stream.result
+    return LLMResult(
+        content=text,
+        provider=adapter.provider,
+        model_name=adapter.model_name,
+        ttft_ms=ttft_ms,
+        latency_ms=(time.perf_counter() - started) * 1000,
+        finish_reason="length_budget" if truncated else None
+    )
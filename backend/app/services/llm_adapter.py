@@ -3,12 +3,29 @@ LLM Adapter Pattern for unified API calls to different providers.
 """
 import logging
 import asyncio
+import json
+import hashlib
+import random
+import time
+from dataclasses import dataclass, fields, replace
 from abc import ABC, abstractmethod
-from typing import List, Dict, Optional, Any
+from collections import OrderedDict
+from typing import List, Dict, Optional, Any, Set, Tuple, Union
 import httpx
 from openai import AsyncOpenAI
 from google import genai
+from google.genai import types as genai_types
 from app.core.config import settings
+from app.services.http_pool import http_pool
+from app.services.latency import latency_tracker
+from app.services.llm_cache import request_fingerprint, response_cache, should_cache
+from app.services.llm_result import GenerationOptions, LLMResult, LLMStream, as_int, as_str
+from app.services.singleflight import singleflight
+from app.services.rate_limit import ProviderLimiter, limiter_registry, estimate_tokens
+from app.services.resilience import (
+    breaker_registry, call_with_retries, default_retry_policy,
+    stream_with_retries, wrap_provider_error
+)
 
 logger = logging.getLogger(__name__)
 
@@ -30,75 +47,386 @@ class BaseLLMAdapter(ABC):
         self.temperature = temperature
         self.api_key = api_key
         self.use_proxy = use_proxy
+        # Provider calls currently using the adapter's client
+        self.in_flight = 0
+        self._idle: Optional[asyncio.Event] = None
     
-    @abstractmethod
-    async def generate(self, messages: List[Dict[str, str]], system_prompt: str) -> str:
+    # Provider name used for per-provider policies (rate limits, metrics)
+    provider = "generic"
+
+    async def complete(self, messages: List[Dict[str, str]], system_prompt: str, cache: Optional[bool] = None,
+                       options: Optional[GenerationOptions] = None) -> LLMResult:
         """
-        Generate a response from the LLM.
+        Generate a response from the LLM, with its usage and timing.
+        
+        Applies the shared adapter-layer policies around the provider-specific
+        `_generate`: response cache, coalescing of identical in-flight requests,
+        circuit breaker, retries with backoff, and concurrency/rate limits.
         
         Args:
             messages: List of message dictionaries with 'role' and 'content'
             system_prompt: System prompt to set the agent's personality
+            cache: Per-agent cache opt-in (True) / opt-out (False); None caches only at temperature 0
+            options: Per-call generation limits (max_tokens, stop sequences)
             
         Returns:
-            Generated response text
+            LLMResult with the generated text, token usage, latency and finish reason
             
         Raises:
-            Exception: If generation fails
+            LLMError: If generation fails after retries, or the circuit is open
         """
-        raise NotImplementedError
+        options = options or GenerationOptions()
+        key = self._request_key(messages, system_prompt, options)
+        cache_key = key if should_cache(self.temperature, cache) else None
+        if cache_key:
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                return self._cached_result("".join(cached).strip())
+        
+        if not settings.llm_singleflight_enabled:
+            return await self._generate_upstream(messages, system_prompt, options, cache_key)
+        
+        leader = False
+        
+        def call():
+            # Only invoked for the caller that starts the upstream call
+            nonlocal leader
+            leader = True
+            return self._generate_upstream(messages, system_prompt, options, cache_key)
+        
+        result = await singleflight.do(self._flight_key(key), call)
+        return result if leader else self._coalesced_result(result)
 
-    async def generate_stream(self, messages: List[Dict[str, str]], system_prompt: str):
+    async def generate(self, messages: List[Dict[str, str]], system_prompt: str, cache: Optional[bool] = None,
+                       options: Optional[GenerationOptions] = None) -> str:
         """
-        Generate a streaming response from the LLM.
+        Generate a response from the LLM.
+        
+        Same as `complete` but returns only the generated text.
+        """
+        return (await self.complete(messages, system_prompt, cache, options)).content
+
+    def stream(self, messages: List[Dict[str, str]], system_prompt: str, cache: Optional[bool] = None,
+               options: Optional[GenerationOptions] = None) -> LLMStream:
+        """
+        Stream a response from the LLM.
+        
+        Cached responses are replayed chunk by chunk, and concurrent identical
+        streams share one upstream stream. Failures before the first chunk are
+        retried; the limiter slot is held until the stream is exhausted or closed.
         
         Args:
             messages: List of message dictionaries with 'role' and 'content'
             system_prompt: System prompt to set the agent's personality
+            cache: Per-agent cache opt-in (True) / opt-out (False); None caches only at temperature 0
+            options: Per-call generation limits (max_tokens, stop sequences)
             
+        Returns:
+            LLMStream yielding text chunks; its `result` is set once the stream completes
+        """
+        return LLMStream(self._stream_items(messages, system_prompt, cache, options))
+
+    async def generate_stream(self, messages: List[Dict[str, str]], system_prompt: str, cache: Optional[bool] = None,
+                              options: Optional[GenerationOptions] = None):
+        """
+        Generate a streaming response from the LLM.
+        
+        Same as `stream` without the final usage result.
+        
         Yields:
             Chunks of generated response text
         """
+        stream = self.stream(messages, system_prompt, cache, options)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    async def _stream_items(self, messages: List[Dict[str, str]], system_prompt: str, cache: Optional[bool],
+                            options: Optional[GenerationOptions] = None):
+        """Yield text chunks followed by a final LLMResult."""
+        options = options or GenerationOptions()
+        key = self._request_key(messages, system_prompt, options)
+        cache_key = key if should_cache(self.temperature, cache) else None
+        if cache_key:
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                for chunk in cached:
+                    yield chunk
+                yield self._cached_result("".join(cached))
+                return
+        
+        leader = True
+        if settings.llm_singleflight_enabled:
+            leader = False
+            
+            def make_stream():
+                nonlocal leader
+                leader = True
+                return self._stream_upstream(messages, system_prompt, options, cache_key)
+            
+            items = singleflight.stream(self._flight_key(key), make_stream)
+        else:
+            items = self._stream_upstream(messages, system_prompt, options, cache_key)
+        try:
+            async for item in items:
+                if isinstance(item, LLMResult) and not leader:
+                    item = self._coalesced_result(item)
+                yield item
+        finally:
+            await items.aclose()
+
+    def _request_key(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions) -> str:
+        """Fingerprint used by the response cache and the in-flight table."""
+        return request_fingerprint(self.provider, self.model_name, self.temperature, system_prompt, messages,
+                                   max_tokens=self._max_tokens(options), stop=list(options.stop) or None)
+
+    def _flight_key(self, key: str) -> str:
+        """In-flight table key: requests made with different API keys are never shared."""
+        return f"{key}:{api_key_fingerprint(self.api_key)}"
+
+    def _coalesced_result(self, result: LLMResult) -> LLMResult:
+        """A follower's copy of a shared result, without the usage the leader already records."""
+        return replace(result, prompt_tokens=None, completion_tokens=None, cached_tokens=None,
+                       request_id=None, coalesced=True)
+
+    def _cached_result(self, content: str) -> LLMResult:
+        return LLMResult(content=content, provider=self.provider, model_name=self.model_name,
+                         ttft_ms=0.0, latency_ms=0.0, cache_hit=True)
+
+    def _as_result(self, value: Union[str, LLMResult]) -> LLMResult:
+        """Normalize what `_generate` returned (plain text is accepted) into an LLMResult."""
+        result = value if isinstance(value, LLMResult) else LLMResult(content=value)
+        result.provider = result.provider or self.provider
+        result.model_name = result.model_name or self.model_name
+        return result
+
+    async def _generate_upstream(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions,
+                                 cache_key: Optional[str]) -> LLMResult:
+        start = time.monotonic()
+        result = await call_with_retries(
+            breaker_registry.get(self.provider),
+            default_retry_policy(),
+            lambda: self._limited_generate(messages, system_prompt, options)
+        )
+        elapsed = time.monotonic() - start
+        latency_tracker.record((self.provider, self.model_name, "latency"), elapsed)
+        # Without streaming the first token arrives with the whole response
+        result.latency_ms = result.ttft_ms = round(elapsed * 1000, 1)
+        if cache_key:
+            await response_cache.set(cache_key, [result.content])
+        return result
+
+    async def _stream_upstream(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions,
+                               cache_key: Optional[str]):
+        start = time.monotonic()
+        result = self._as_result(LLMResult())
+        chunks: List[str] = []
+        async for item in stream_with_retries(
+            breaker_registry.get(self.provider),
+            default_retry_policy(),
+            lambda: self._limited_stream(messages, system_prompt, options)
+        ):
+            if isinstance(item, LLMResult):
+                result.merge_usage(item)
+                continue
+            if not chunks:
+                elapsed = time.monotonic() - start
+                latency_tracker.record((self.provider, self.model_name, "ttft"), elapsed)
+                result.ttft_ms = round(elapsed * 1000, 1)
+            chunks.append(item)
+            yield item
+        
+        result.content = "".join(chunks)
+        result.latency_ms = round((time.monotonic() - start) * 1000, 1)
+        # Only complete streams are cached
+        if cache_key:
+            await response_cache.set(cache_key, chunks)
+        yield result
+
+    async def _limited_generate(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions) -> LLMResult:
+        prompt_tokens = self._estimate_prompt_tokens(messages, system_prompt)
+        self.in_flight += 1
+        try:
+            async with self._get_limiter().acquire(prompt_tokens) as settle:
+                result = self._as_result(await self._generate(messages, system_prompt, options))
+                settle(result.total_tokens or prompt_tokens + estimate_tokens(result.content))
+        finally:
+            self._call_done()
+        return result
+
+    async def _limited_stream(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions):
+        prompt_tokens = self._estimate_prompt_tokens(messages, system_prompt)
+        self.in_flight += 1
+        try:
+            async with self._get_limiter().acquire(prompt_tokens) as settle:
+                completion_tokens = 0
+                reported: Optional[int] = None
+                async for item in self._generate_stream(messages, system_prompt, options):
+                    if isinstance(item, LLMResult):
+                        reported = item.total_tokens
+                    else:
+                        completion_tokens += estimate_tokens(item)
+                    yield item
+                settle(reported or prompt_tokens + completion_tokens)
+        finally:
+            self._call_done()
+
+    def _call_done(self):
+        self.in_flight -= 1
+        if not self.in_flight and self._idle is not None:
+            self._idle.set()
+
+    async def wait_idle(self):
+        """Return once no provider call is using the adapter."""
+        while self.in_flight:
+            if self._idle is None or self._idle.is_set():
+                self._idle = asyncio.Event()
+            await self._idle.wait()
+
+    @abstractmethod
+    async def _generate(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions) -> Union[str, LLMResult]:
+        """
+        Provider-specific generation. Subclasses must implement this.
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            system_prompt: System prompt to set the agent's personality
+            options: Generation limits; use `_max_tokens(options)` for the effective max_tokens
+            
+        Returns:
+            LLMResult with the provider-reported usage, or just the generated text
+        """
+        raise NotImplementedError
+
+    async def _generate_stream(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions):
+        """
+        Provider-specific streaming generation.
+        
+        Yields:
+            Chunks of generated response text, optionally followed by an LLMResult
+            carrying the provider-reported usage and finish reason
+        """
         # Default implementation falls back to non-streaming if not overridden
-        response = await self.generate(messages, system_prompt)
-        yield response
+        result = self._as_result(await self._generate(messages, system_prompt, options))
+        yield result.content
+        yield result
 
+    @staticmethod
+    def _max_tokens(options: GenerationOptions) -> int:
+        return options.max_tokens or settings.llm_default_max_tokens
 
-class OpenAIAdapter(BaseLLMAdapter):
-    """Adapter for OpenAI API (GPT models)."""
+    def _get_limiter(self) -> ProviderLimiter:
+        return limiter_registry.get(self.provider, api_key_fingerprint(self.api_key))
+
+    @staticmethod
+    def _estimate_prompt_tokens(messages: List[Dict[str, str]], system_prompt: str) -> int:
+        return estimate_tokens(system_prompt) + sum(estimate_tokens(msg.get("content", "")) for msg in messages)
+
+    async def warm_up(self):
+        """
+        Prepare the model ahead of the first request.
+        
+        No-op by default; local providers override it to preload the model.
+        """
+        return None
+
+    async def aclose(self):
+        """
+        Release network resources held by the adapter.
+        
+        Called by the adapter registry on shutdown, and when the adapter is
+        evicted once its in-flight calls have finished (see `wait_idle`).
+        """
+        client = getattr(self, "client", None)
+        if client is not None and hasattr(client, "close"):
+            await client.close()
+
+
+class OpenAICompatibleAdapter(BaseLLMAdapter):
+    """
+    Base adapter for providers speaking the OpenAI chat completions protocol.
     
-    def __init__(self, model_name: str = "gpt-3.5-turbo", temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False):
+    Subclasses set the provider label, base URL and default API key. The
+    underlying HTTP client is shared per (base URL, proxy) via the global
+    HTTP connection pool.
+    """
+    
+    provider_label = "OpenAI"
+    base_url = "https://api.openai.com/v1"
+    # Whether a dummy key may be substituted in debug mode when no key is configured
+    allow_debug_key = True
+    # Whether the endpoint accepts stream_options.include_usage
+    stream_usage = True
+    
+    def __init__(self, model_name: str, temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False):
         super().__init__(model_name, temperature, api_key, use_proxy)
-        # Use provided API key or fall back to settings
-        key = self.api_key or settings.openai_api_key
+        key = self.api_key or self._default_api_key()
         if not key:
-            logger.warning("No OpenAI API key provided")
+            logger.warning(f"No {self.provider_label} API key provided")
             # For testing purposes only - should not be used in production
-            if settings.debug:
+            if settings.debug and self.allow_debug_key:
                 key = "dummy-key-for-testing"
             else:
-                raise ValueError("OpenAI API key is required. Set OPENAI_API_KEY environment variable or provide api_key parameter.")
+                raise ValueError(self._missing_key_message())
         
-        http_client = None
-        if self.use_proxy and settings.llm_proxy_url:
-            logger.info(f"Using proxy {settings.llm_proxy_url} for OpenAI")
-            http_client = httpx.AsyncClient(proxies=settings.llm_proxy_url)
-        else:
-            # Force direct connection, ignoring environment proxy variables to prevent accidental usage of global HTTP_PROXY
-            http_client = httpx.AsyncClient(trust_env=False)
-            
-        self.client = AsyncOpenAI(api_key=key, http_client=http_client)
+        self.client = AsyncOpenAI(
+            api_key=key,
+            base_url=self.base_url,
+            http_client=http_pool.get(self.base_url, self.use_proxy),
+            # Retries are handled by the shared resilience layer
+            max_retries=0
+        )
+    
+    def _default_api_key(self) -> Optional[str]:
+        """Return the default API key from settings, if any."""
+        return None
     
-    async def generate(self, messages: List[Dict[str, str]], system_prompt: str) -> str:
+    def _request_kwargs(self, full_messages: List[Dict[str, str]], options: GenerationOptions) -> Dict[str, Any]:
+        kwargs = {
+            "model": self.model_name,
+            "messages": full_messages,
+            "temperature": self.temperature,
+            "max_tokens": self._max_tokens(options),
+        }
+        if options.stop:
+            # The chat completions API accepts at most 4 stop sequences
+            kwargs["stop"] = list(options.stop)[:4]
+        return kwargs
+    
+    @staticmethod
+    def _usage_fields(usage: Any) -> Dict[str, Optional[int]]:
+        """Token usage fields from an OpenAI-style `usage` object (or dict, as on stream chunks)."""
+        def field(value: Any, name: str) -> Any:
+            # SDK versions without a typed chunk `usage` keep it as a plain dict
+            return value.get(name) if isinstance(value, dict) else getattr(value, name, None)
+        
+        cached = field(field(usage, "prompt_tokens_details"), "cached_tokens")
+        return {
+            "prompt_tokens": as_int(field(usage, "prompt_tokens")),
+            "completion_tokens": as_int(field(usage, "completion_tokens")),
+            # DeepSeek reports context-cache hits separately
+            "cached_tokens": as_int(cached) if as_int(cached) is not None else as_int(field(usage, "prompt_cache_hit_tokens")),
+        }
+    
+    def _missing_key_message(self) -> str:
+        return f"{self.provider_label} API key is required. Provide api_key parameter."
+    
+    async def aclose(self):
+        """The HTTP client belongs to the shared pool, so there is nothing to close per adapter."""
+        return None
+    
+    async def _generate(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions) -> LLMResult:
         """
-        Generate response using OpenAI API.
+        Generate response using the provider's chat completions API.
         
         Args:
             messages: Conversation history
             system_prompt: System prompt for the agent
             
         Returns:
-            Generated response
+            LLMResult with the generated text and provider-reported usage
             
         Raises:
             Exception: If API call fails
@@ -107,174 +435,122 @@ class OpenAIAdapter(BaseLLMAdapter):
             # Prepend system message
             full_messages = [{"role": "system", "content": system_prompt}] + messages
             
-            logger.info(f"Calling OpenAI API with model {self.model_name}")
-            response = await self.client.chat.completions.create(
-                model=self.model_name,
-                messages=full_messages,
-                temperature=self.temperature,
-                max_tokens=1000
-            )
+            logger.info(f"Calling {self.provider_label} API with model {self.model_name}")
+            response = await self.client.chat.completions.create(**self._request_kwargs(full_messages, options))
             
-            content = response.choices[0].message.content
+            choice = response.choices[0]
+            content = choice.message.content
             if not content:
-                raise ValueError("Empty response from OpenAI API")
+                raise ValueError(f"Empty response from {self.provider_label} API")
                 
-            logger.info(f"OpenAI API response received: {len(content)} characters")
-            return content.strip()
+            logger.info(f"{self.provider_label} API response received: {len(content)} characters")
+            return LLMResult(
+                content=content.strip(),
+                finish_reason=as_str(choice.finish_reason),
+                request_id=as_str(getattr(response, "id", None)),
+                **self._usage_fields(getattr(response, "usage", None))
+            )
             
         except Exception as e:
-            logger.error(f"OpenAI API error: {str(e)}")
-            raise Exception(f"Failed to generate response from OpenAI: {str(e)}")
-
-
-class DeepSeekAdapter(BaseLLMAdapter):
-    """Adapter for DeepSeek API (compatible with OpenAI format)."""
-    
-    def __init__(self, model_name: str = "deepseek-chat", temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False):
-        super().__init__(model_name, temperature, api_key, use_proxy)
-        # DeepSeek uses OpenAI-compatible API
-        key = self.api_key or settings.deepseek_api_key
-        if not key:
-            logger.warning("No DeepSeek API key provided")
-            # For testing purposes only - should not be used in production
-            if settings.debug:
-                key = "dummy-key-for-testing"
-            else:
-                raise ValueError("DeepSeek API key is required. Set DEEPSEEK_API_KEY environment variable or provide api_key parameter.")
-        
-        http_client = None
-        if self.use_proxy and settings.llm_proxy_url:
-            logger.info(f"Using proxy {settings.llm_proxy_url} for DeepSeek")
-            http_client = httpx.AsyncClient(proxies=settings.llm_proxy_url)
-        else:
-            # Force direct connection, ignoring environment proxy variables
-            http_client = httpx.AsyncClient(trust_env=False)
+            logger.error(f"{self.provider_label} API error: {str(e)}")
+            raise wrap_provider_error(self.provider_label, e) from e
 
-        self.client = AsyncOpenAI(
-            api_key=key,
-            base_url="https://api.deepseek.com",
-            http_client=http_client
-        )
-    
-    async def generate(self, messages: List[Dict[str, str]], system_prompt: str) -> str:
+    async def _generate_stream(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions):
         """
-        Generate response using DeepSeek API.
+        Generate streaming response using the provider's chat completions API.
         
         Args:
             messages: Conversation history
             system_prompt: System prompt for the agent
             
-        Returns:
-            Generated response
+        Yields:
+            Incremental content deltas as they arrive
             
         Raises:
             Exception: If API call fails
         """
         try:
-            # Prepend system message
             full_messages = [{"role": "system", "content": system_prompt}] + messages
             
-            logger.info(f"Calling DeepSeek API with model {self.model_name}")
-            response = await self.client.chat.completions.create(
-                model=self.model_name,
-                messages=full_messages,
-                temperature=self.temperature,
-                max_tokens=1000
+            logger.info(f"Calling {self.provider_label} API (stream) with model {self.model_name}")
+            stream = await self.client.chat.completions.create(
+                **self._request_kwargs(full_messages, options),
+                stream=True,
+                # Ask for a final usage chunk (older SDKs have no stream_options argument)
+                extra_body={"stream_options": {"include_usage": True}} if self.stream_usage else None
             )
             
-            content = response.choices[0].message.content
-            if not content:
-                raise ValueError("Empty response from DeepSeek API")
-                
-            logger.info(f"DeepSeek API response received: {len(content)} characters")
-            return content.strip()
-            
+            meta = LLMResult()
+            async for chunk in stream:
+                meta.request_id = meta.request_id or as_str(getattr(chunk, "id", None))
+                usage = getattr(chunk, "usage", None)
+                if usage is not None:
+                    meta.merge_usage(LLMResult(**self._usage_fields(usage)))
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                meta.finish_reason = as_str(choice.finish_reason) or meta.finish_reason
+                if choice.delta.content:
+                    yield choice.delta.content
+            yield meta
+                    
         except Exception as e:
-            logger.error(f"DeepSeek API error: {str(e)}")
-            raise Exception(f"Failed to generate response from DeepSeek: {str(e)}")
+            proxy_msg = f" [Proxy: {settings.llm_proxy_url}]" if self.use_proxy else " [No Proxy]"
+            logger.error(f"{self.provider_label} API stream error: {str(e)}{proxy_msg}")
+            raise wrap_provider_error(self.provider_label, e, action="stream") from e
 
 
-class ChatAnywhereAdapter(BaseLLMAdapter):
-    """Adapter for ChatAnywhere API (Free OpenAI-compatible)."""
+class OpenAIAdapter(OpenAICompatibleAdapter):
+    """Adapter for OpenAI API (GPT models)."""
+    
+    provider = "openai"
+    provider_label = "OpenAI"
     
     def __init__(self, model_name: str = "gpt-3.5-turbo", temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False):
+        self.base_url = settings.openai_base_url
         super().__init__(model_name, temperature, api_key, use_proxy)
-        # ChatAnywhere uses OpenAI-compatible API with a specific base URL
-        key = self.api_key
-        if not key:
-            logger.warning("No ChatAnywhere API key provided")
-            raise ValueError("ChatAnywhere API key is required. Provide api_key parameter.")
-            
-        http_client = None
-        if self.use_proxy and settings.llm_proxy_url:
-            logger.info(f"Using proxy {settings.llm_proxy_url} for ChatAnywhere")
-            http_client = httpx.AsyncClient(proxies=settings.llm_proxy_url)
-        else:
-            # Force direct connection, ignoring environment proxy variables
-            http_client = httpx.AsyncClient(trust_env=False)
+    
+    def _default_api_key(self) -> Optional[str]:
+        return settings.openai_api_key
+    
+    def _missing_key_message(self) -> str:
+        return "OpenAI API key is required. Set OPENAI_API_KEY environment variable or provide api_key parameter."
 
-        self.client = AsyncOpenAI(
-            api_key=key,
-            base_url="https://api.chatanywhere.tech/v1",
-            http_client=http_client
-        )
+
+class DeepSeekAdapter(OpenAICompatibleAdapter):
+    """Adapter for DeepSeek API (compatible with OpenAI format)."""
     
-    async def generate(self, messages: List[Dict[str, str]], system_prompt: str) -> str:
-        """
-        Generate response using ChatAnywhere API.
-        """
-        try:
-            # Prepend system message
-            full_messages = [{"role": "system", "content": system_prompt}] + messages
-            
-            logger.info(f"Calling ChatAnywhere API with model {self.model_name}")
-            response = await self.client.chat.completions.create(
-                model=self.model_name,
-                messages=full_messages,
-                temperature=self.temperature,
-                max_tokens=1000
-            )
-            
-            content = response.choices[0].message.content
-            if not content:
-                raise ValueError("Empty response from ChatAnywhere API")
-                
-            logger.info(f"ChatAnywhere API response received: {len(content)} characters")
-            return content.strip()
-            
-        except Exception as e:
-            logger.error(f"ChatAnywhere API error: {str(e)}")
-            raise Exception(f"Failed to generate response from ChatAnywhere: {str(e)}")
+    provider = "deepseek"
+    provider_label = "DeepSeek"
+    
+    def __init__(self, model_name: str = "deepseek-chat", temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False):
+        self.base_url = settings.deepseek_base_url
+        super().__init__(model_name, temperature, api_key, use_proxy)
+    
+    def _default_api_key(self) -> Optional[str]:
+        return settings.deepseek_api_key
+    
+    def _missing_key_message(self) -> str:
+        return "DeepSeek API key is required. Set DEEPSEEK_API_KEY environment variable or provide api_key parameter."
 
 
-    async def generate_stream(self, messages: List[Dict[str, str]], system_prompt: str):
-        """
-        Generate streaming response using ChatAnywhere API.
-        """
-        try:
-            full_messages = [{"role": "system", "content": system_prompt}] + messages
-            
-            logger.info(f"Calling ChatAnywhere API (stream) with model {self.model_name}")
-            stream = await self.client.chat.completions.create(
-                model=self.model_name,
-                messages=full_messages,
-                temperature=self.temperature,
-                max_tokens=1000,
-                stream=True
-            )
-            
-            async for chunk in stream:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-                    
-        except Exception as e:
-            logger.error(f"ChatAnywhere API stream error: {str(e)}")
-            yield f"[Error: {str(e)}]"
+class ChatAnywhereAdapter(OpenAICompatibleAdapter):
+    """Adapter for ChatAnywhere API (Free OpenAI-compatible)."""
+    
+    provider = "chatanywhere"
+    provider_label = "ChatAnywhere"
+    allow_debug_key = False
+    
+    def __init__(self, model_name: str = "gpt-3.5-turbo", temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False):
+        self.base_url = settings.chatanywhere_base_url
+        super().__init__(model_name, temperature, api_key, use_proxy)
 
 
 class GoogleAdapter(BaseLLMAdapter):
     """Adapter for Google Gemini API."""
     
+    provider = "google"
+    
     def __init__(self, model_name: str = "gemini-2.0-flash-exp", temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False):
         super().__init__(model_name, temperature, api_key, use_proxy)
         key = self.api_key
@@ -282,143 +558,184 @@ class GoogleAdapter(BaseLLMAdapter):
              logger.warning("No Google API key provided")
              raise ValueError("Google API key is required. Provide api_key parameter.")
         
-        # Initialize Google GenAI client
+        # Initialize Google GenAI client; requests go through its async interface (client.aio)
         # Note: Proxy support for Google GenAI SDK is limited, may need environment variables
         self.client = genai.Client(api_key=key)
 
-    async def generate(self, messages: List[Dict[str, str]], system_prompt: str) -> str:
+    async def aclose(self):
+        """The GenAI client holds no resources that need explicit closing."""
+        return None
+
+    @staticmethod
+    def _build_contents(messages: List[Dict[str, str]]) -> List[genai_types.Content]:
         """
-        Generate response using Google Gemini API (v1 SDK).
+        Convert chat messages into Gemini structured contents.
+        
+        Gemini only knows 'user' and 'model' roles, so assistant turns map to 'model'
+        and any inline system messages are sent as user context. Consecutive turns
+        from the same role are merged into one Content with several parts.
+        """
+        contents: List[genai_types.Content] = []
+        for msg in messages:
+            role = msg.get("role", "user")
+            text = msg.get("content", "")
+            if role == "system":
+                text = f"[System]: {text}"
+            gemini_role = "model" if role == "assistant" else "user"
+            if contents and contents[-1].role == gemini_role:
+                contents[-1].parts.append(genai_types.Part(text=text))
+            else:
+                contents.append(genai_types.Content(role=gemini_role, parts=[genai_types.Part(text=text)]))
+        if not contents:
+            contents.append(genai_types.Content(role="user", parts=[genai_types.Part(text="Please respond.")]))
+        return contents
+
+    def _build_config(self, system_prompt: str, options: GenerationOptions) -> genai_types.GenerateContentConfig:
+        return genai_types.GenerateContentConfig(
+            system_instruction=system_prompt or None,
+            temperature=self.temperature,
+            max_output_tokens=self._max_tokens(options),
+            stop_sequences=list(options.stop) or None
+        )
+
+    @staticmethod
+    def _result_fields(response: Any) -> LLMResult:
+        """Usage, finish reason and response id from a Gemini response or stream chunk."""
+        usage = getattr(response, "usage_metadata", None)
+        candidates = getattr(response, "candidates", None) or []
+        finish_reason = getattr(candidates[0], "finish_reason", None) if isinstance(candidates, list) and candidates else None
+        # FinishReason is an enum (STOP, MAX_TOKENS, ...)
+        finish_reason = getattr(finish_reason, "value", finish_reason)
+        return LLMResult(
+            prompt_tokens=as_int(getattr(usage, "prompt_token_count", None)),
+            completion_tokens=as_int(getattr(usage, "candidates_token_count", None)),
+            cached_tokens=as_int(getattr(usage, "cached_content_token_count", None)),
+            finish_reason=as_str(finish_reason).lower() if as_str(finish_reason) else None,
+            request_id=as_str(getattr(response, "response_id", None))
+        )
+
+    async def _generate(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions) -> LLMResult:
+        """
+        Generate response using Google Gemini API (async client).
         """
         try:
             logger.info(f"Calling Google Gemini API with model {self.model_name}")
             
-            # Construct prompt from history
-            # We combine system prompt and messages into a single string context for simplicity with generate_content
-            # Alternatively, we could use chat features if we mapped roles correctly.
-            # But based on user request "Explain how AI works in a few words" example, they used generate_content.
-            
-            prompt_parts = []
-            if system_prompt:
-                prompt_parts.append(f"System: {system_prompt}")
-            
-            for msg in messages:
-                role = msg.get("role", "user")
-                content = msg.get("content", "")
-                prompt_parts.append(f"{role}: {content}")
-            
-            prompt_parts.append("assistant: ")
-            full_prompt = "\n".join(prompt_parts)
-            
-            # Run synchronous generate_content in thread pool
-            # User example: response = client.models.generate_content(model="...", contents="...")
-            response = await asyncio.to_thread(
-                self.client.models.generate_content,
+            response = await self.client.aio.models.generate_content(
                 model=self.model_name,
-                contents=full_prompt
+                contents=self._build_contents(messages),
+                config=self._build_config(system_prompt, options)
             )
             
             if not response.text:
                  raise ValueError("Empty response from Google API")
 
             logger.info(f"Google API response received: {len(response.text)} characters")
-            return response.text.strip()
+            result = self._result_fields(response)
+            result.content = response.text.strip()
+            return result
             
         except Exception as e:
             logger.error(f"Google API error: {str(e)}")
-            raise Exception(f"Failed to generate response from Google: {str(e)}")
-
-
-class DashScopeAdapter(BaseLLMAdapter):
-    """Adapter for Aliyun DashScope (BaiLian) API."""
-    
-    def __init__(self, model_name: str = "qwen-plus", temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False):
-        super().__init__(model_name, temperature, api_key, use_proxy)
-        # DashScope uses OpenAI-compatible API
-        key = self.api_key or settings.dashscope_api_key
-        if not key:
-            logger.warning("No DashScope API key provided")
-            if settings.debug:
-                key = "dummy-key-for-testing"
-            else:
-                raise ValueError("DashScope API key is required. Set DASHSCOPE_API_KEY environment variable or provide api_key parameter.")
-        
-        http_client = None
-        if self.use_proxy and settings.llm_proxy_url:
-            logger.info(f"Using proxy {settings.llm_proxy_url} for DashScope")
-            http_client = httpx.AsyncClient(proxies=settings.llm_proxy_url)
-        else:
-            # Force direct connection, ignoring environment proxy variables
-            http_client = httpx.AsyncClient(trust_env=False)
-
-        self.client = AsyncOpenAI(
-            api_key=key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-            http_client=http_client
-        )
-    
-    async def generate(self, messages: List[Dict[str, str]], system_prompt: str) -> str:
-        """
-        Generate response using DashScope API.
-        """
-        try:
-            # Prepend system message
-            full_messages = [{"role": "system", "content": system_prompt}] + messages
-            
-            logger.info(f"Calling DashScope API with model {self.model_name}")
-            response = await self.client.chat.completions.create(
-                model=self.model_name,
-                messages=full_messages,
-                temperature=self.temperature,
-                max_tokens=1000
-            )
-            
-            content = response.choices[0].message.content
-            if not content:
-                raise ValueError("Empty response from DashScope API")
-                
-            logger.info(f"DashScope API response received: {len(content)} characters")
-            return content.strip()
-            
-        except Exception as e:
-            logger.error(f"DashScope API error: {str(e)}")
-            raise Exception(f"Failed to generate response from DashScope: {str(e)}")
+            raise wrap_provider_error("Google", e) from e
 
-
-    async def generate_stream(self, messages: List[Dict[str, str]], system_prompt: str):
+    async def _generate_stream(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions):
         """
-        Generate streaming response using DashScope API.
+        Generate streaming response using Google Gemini API (async client).
         """
         try:
-            full_messages = [{"role": "system", "content": system_prompt}] + messages
+            logger.info(f"Calling Google Gemini API (stream) with model {self.model_name}")
             
-            logger.info(f"Calling DashScope API (stream) with model {self.model_name}")
-            stream = await self.client.chat.completions.create(
+            stream = await self.client.aio.models.generate_content_stream(
                 model=self.model_name,
-                messages=full_messages,
-                temperature=self.temperature,
-                max_tokens=1000,
-                stream=True
+                contents=self._build_contents(messages),
+                config=self._build_config(system_prompt, options)
             )
             
+            meta = LLMResult()
             async for chunk in stream:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
+                meta.merge_usage(self._result_fields(chunk))
+                if chunk.text:
+                    yield chunk.text
+            yield meta
                     
         except Exception as e:
-            proxy_msg = f" [Proxy: {settings.llm_proxy_url}]" if self.use_proxy else " [No Proxy]"
-            logger.error(f"DashScope API stream error: {str(e)}{proxy_msg}")
-            yield f"[Error: {str(e)}{proxy_msg}]"
+            logger.error(f"Google API stream error: {str(e)}")
+            raise wrap_provider_error("Google", e, action="stream") from e
+
+
+class DashScopeAdapter(OpenAICompatibleAdapter):
+    """Adapter for Aliyun DashScope (BaiLian) API."""
+    
+    provider = "dashscope"
+    provider_label = "DashScope"
+    
+    def __init__(self, model_name: str = "qwen-plus", temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False):
+        self.base_url = settings.dashscope_base_url
+        super().__init__(model_name, temperature, api_key, use_proxy)
+    
+    def _default_api_key(self) -> Optional[str]:
+        return settings.dashscope_api_key
+    
+    def _missing_key_message(self) -> str:
+        return "DashScope API key is required. Set DASHSCOPE_API_KEY environment variable or provide api_key parameter."
 
 
 class OllamaAdapter(BaseLLMAdapter):
     """Adapter for local Ollama models."""
     
-    def __init__(self, model_name: str = "llama3", temperature: float = 0.7, api_key: Optional[str] = None, base_url: str = "http://localhost:11434", use_proxy: bool = False):
+    provider = "ollama"
+    
+    def __init__(self, model_name: str = "llama3", temperature: float = 0.7, api_key: Optional[str] = None, base_url: Optional[str] = None, use_proxy: bool = False):
         super().__init__(model_name, temperature, api_key, use_proxy)
-        self.base_url = base_url
+        self.base_url = (base_url or settings.ollama_base_url).rstrip("/")
+        # Long-lived pooled client shared by every adapter targeting this Ollama server
+        self.client = http_pool.get(self.base_url, self.use_proxy)
     
-    async def generate(self, messages: List[Dict[str, str]], system_prompt: str) -> str:
+    async def aclose(self):
+        """The HTTP client belongs to the shared pool, so there is nothing to close per adapter."""
+        return None
+    
+    def _build_payload(self, full_messages: List[Dict[str, str]], stream: bool,
+                       options: GenerationOptions) -> Dict[str, Any]:
+        model_options: Dict[str, Any] = {
+            "temperature": self.temperature,
+            "num_predict": self._max_tokens(options),
+        }
+        if options.stop:
+            model_options["stop"] = list(options.stop)
+        return {
+            "model": self.model_name,
+            "messages": full_messages,
+            "stream": stream,
+            "keep_alive": settings.ollama_keep_alive,
+            "options": model_options
+        }
+    
+    @staticmethod
+    def _result_fields(data: Dict[str, Any]) -> LLMResult:
+        """Usage and finish reason from a final (done) Ollama response."""
+        return LLMResult(
+            prompt_tokens=as_int(data.get("prompt_eval_count")),
+            completion_tokens=as_int(data.get("eval_count")),
+            finish_reason=as_str(data.get("done_reason"))
+        )
+    
+    async def warm_up(self):
+        """
+        Load the model into memory ahead of the first turn.
+        
+        Ollama loads a model without generating anything when /api/chat is called
+        with an empty message list; keep_alive keeps it resident afterwards.
+        """
+        logger.info(f"Warming up Ollama model {self.model_name}")
+        response = await self.client.post(
+            f"{self.base_url}/api/chat",
+            json={"model": self.model_name, "messages": [], "keep_alive": settings.ollama_keep_alive}
+        )
+        response.raise_for_status()
+    
+    async def _generate(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions) -> LLMResult:
         """
         Generate response using Ollama local API.
         
@@ -427,7 +744,7 @@ class OllamaAdapter(BaseLLMAdapter):
             system_prompt: System prompt for the agent
             
         Returns:
-            Generated response
+            LLMResult with the generated text and provider-reported usage
             
         Raises:
             Exception: If API call fails
@@ -437,66 +754,376 @@ class OllamaAdapter(BaseLLMAdapter):
             full_messages = [{"role": "system", "content": system_prompt}] + messages
             
             logger.info(f"Calling Ollama API with model {self.model_name}")
+            response = await self.client.post(
+                f"{self.base_url}/api/chat",
+                json=self._build_payload(full_messages, stream=False, options=options)
+            )
+            response.raise_for_status()
+            data = response.json()
             
-            proxies = None
-            if self.use_proxy and settings.llm_proxy_url:
-                proxies = settings.llm_proxy_url
-                
-            async with httpx.AsyncClient(timeout=60.0, proxies=proxies) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/chat",
-                    json={
-                        "model": self.model_name,
-                        "messages": full_messages,
-                        "stream": False,
-                        "options": {"temperature": self.temperature}
-                    }
-                )
-                response.raise_for_status()
-                data = response.json()
+            content = data.get("message", {}).get("content", "")
+            if not content:
+                raise ValueError("Empty response from Ollama API")
                 
-                content = data.get("message", {}).get("content", "")
-                if not content:
-                    raise ValueError("Empty response from Ollama API")
-                    
-                logger.info(f"Ollama API response received: {len(content)} characters")
-                return content.strip()
+            logger.info(f"Ollama API response received: {len(content)} characters")
+            result = self._result_fields(data)
+            result.content = content.strip()
+            return result
                 
         except Exception as e:
             logger.error(f"Ollama API error: {str(e)}")
-            raise Exception(f"Failed to generate response from Ollama: {str(e)}")
+            raise wrap_provider_error("Ollama", e) from e
 
+    async def _generate_stream(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions):
+        """
+        Generate streaming response using Ollama's NDJSON /api/chat stream.
+        
+        Args:
+            messages: Conversation history
+            system_prompt: System prompt for the agent
+            
+        Yields:
+            Incremental content deltas as they arrive
+            
+        Raises:
+            Exception: If API call fails
+        """
+        try:
+            full_messages = [{"role": "system", "content": system_prompt}] + messages
+            
+            logger.info(f"Calling Ollama API (stream) with model {self.model_name}")
+            async with self.client.stream(
+                "POST",
+                f"{self.base_url}/api/chat",
+                json=self._build_payload(full_messages, stream=True, options=options)
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise ValueError(data["error"])
+                    content = data.get("message", {}).get("content", "")
+                    if content:
+                        yield content
+                    if data.get("done"):
+                        # The final line carries the token counts
+                        yield self._result_fields(data)
+                        break
+                
+        except Exception as e:
+            logger.error(f"Ollama API stream error: {str(e)}")
+            raise wrap_provider_error("Ollama", e, action="stream") from e
 
-def get_llm_adapter(provider: str, model_name: str, temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False) -> BaseLLMAdapter:
+
+MOCK_VOCABULARY = (
+    "the", "idea", "is", "interesting", "but", "I", "think", "we", "should", "consider", "cost",
+    "and", "risk", "before", "deciding", "honestly", "that", "sounds", "reasonable", "to", "me",
+    "although", "data", "suggests", "otherwise", "maybe", "a", "small", "experiment", "first",
+)
+
+
+@dataclass
+class MockProfile:
+    """Latency and failure profile of the mock provider."""
+
+    ttft_ms: float = 300.0
+    ttft_sigma: float = 0.3
+    tokens_per_second: float = 40.0
+    tps_sigma: float = 0.2
+    output_tokens: int = 60
+    error_rate_429: float = 0.0
+    error_rate_5xx: float = 0.0
+    timeout_rate: float = 0.0
+    timeout_seconds: float = 5.0
+
+    @classmethod
+    def for_model(cls, model_name: str) -> "MockProfile":
+        """Profile named by the model name, layered over the 'default' profile."""
+        profiles = settings.mock_llm_profiles
+        values = {**profiles.get("default", {}), **profiles.get(model_name, {})}
+        known = {field.name for field in fields(cls)}
+        return cls(**{key: value for key, value in values.items() if key in known})
+
+
+class MockAdapter(BaseLLMAdapter):
     """
-    Factory function to get the appropriate LLM adapter.
+    In-process provider for offline load and resilience testing.
     
-    Args:
-        provider: Provider name (openai, deepseek, ollama, google)
-        model_name: Model name
-        temperature: Temperature parameter
-        api_key: Optional API key
-        use_proxy: Whether to use proxy
+    Text is derived deterministically from the seed and the request; time to
+    first token and tokens/sec are drawn from log-normal distributions; 429,
+    5xx and timeout failures are injected at the profile's rates and go
+    through the same error classification as real providers.
+    """
+    
+    provider = "mock"
+    
+    def __init__(self, model_name: str = "default", temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False):
+        super().__init__(model_name, temperature, api_key, use_proxy)
+        self.profile = MockProfile.for_model(model_name)
+        # Timing and faults follow one seeded sequence per adapter
+        self._rng = random.Random(settings.mock_llm_seed)
+        self.requests = 0
+    
+    def _text(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions) -> Tuple[List[str], str]:
+        """Deterministic output tokens for the request and the finish reason."""
+        key = request_fingerprint(self.provider, self.model_name, self.temperature, system_prompt, messages)
+        rng = random.Random(f"{settings.mock_llm_seed}:{key}")
+        limit = self._max_tokens(options)
+        words = [rng.choice(MOCK_VOCABULARY) for _ in range(min(self.profile.output_tokens, limit))]
+        tokens = [word if index == 0 else f" {word}" for index, word in enumerate(words)]
+        if tokens:
+            # A profile may ask for no output at all
+            tokens[-1] += "."
+        finish_reason = "length" if self.profile.output_tokens > limit else "stop"
         
-    Returns:
-        Appropriate LLM adapter instance
+        text = "".join(tokens)
+        cut = min((text.find(stop) for stop in options.stop if stop in text), default=-1)
+        if cut >= 0:
+            kept, length = [], 0
+            for token in tokens:
+                if length + len(token) > cut:
+                    if cut > length:
+                        kept.append(token[:cut - length])
+                    break
+                kept.append(token)
+                length += len(token)
+            tokens, finish_reason = kept, "stop"
+        return tokens, finish_reason
+    
+    async def _start(self) -> Tuple[float, str]:
+        """Wait out the time to first token and return the tokens/sec and request ID, or inject a failure."""
+        self.requests += 1
+        # Concurrent calls share the adapter, so the ID is taken before any await
+        request_id = f"mock-{self.requests}"
+        profile = self.profile
+        roll = self._rng.random()
+        ttft = profile.ttft_ms / 1000 * self._rng.lognormvariate(0.0, profile.ttft_sigma)
+        tps = profile.tokens_per_second * self._rng.lognormvariate(0.0, profile.tps_sigma)
         
-    Raises:
-        ValueError: If provider is not supported
-    """
-    provider = provider.lower()
+        request = httpx.Request("POST", "http://mock.invalid/v1/chat/completions")
+        if roll < profile.error_rate_429:
+            response = httpx.Response(429, headers={"Retry-After": "1"}, request=request)
+            raise httpx.HTTPStatusError("Rate limited by mock provider", request=request, response=response)
+        roll -= profile.error_rate_429
+        if roll < profile.error_rate_5xx:
+            response = httpx.Response(503, request=request)
+            raise httpx.HTTPStatusError("Mock provider unavailable", request=request, response=response)
+        roll -= profile.error_rate_5xx
+        if roll < profile.timeout_rate:
+            await asyncio.sleep(profile.timeout_seconds)
+            raise httpx.ReadTimeout("Mock provider timed out", request=request)
+        
+        await asyncio.sleep(ttft)
+        return max(tps, 1e-3), request_id
     
+    def _final_result(self, messages: List[Dict[str, str]], system_prompt: str, tokens: List[str], finish_reason: str, request_id: str) -> LLMResult:
+        return LLMResult(
+            content="".join(tokens),
+            prompt_tokens=self._estimate_prompt_tokens(messages, system_prompt),
+            completion_tokens=len(tokens),
+            finish_reason=finish_reason,
+            request_id=request_id
+        )
+    
+    async def _generate(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions) -> LLMResult:
+        try:
+            tps, request_id = await self._start()
+        except Exception as e:
+            raise wrap_provider_error("Mock", e) from e
+        tokens, finish_reason = self._text(messages, system_prompt, options)
+        await asyncio.sleep(len(tokens) / tps)
+        return self._final_result(messages, system_prompt, tokens, finish_reason, request_id)
+    
+    async def _generate_stream(self, messages: List[Dict[str, str]], system_prompt: str, options: GenerationOptions):
+        try:
+            tps, request_id = await self._start()
+        except Exception as e:
+            raise wrap_provider_error("Mock", e, action="stream") from e
+        tokens, finish_reason = self._text(messages, system_prompt, options)
+        for index, token in enumerate(tokens):
+            if index:
+                await asyncio.sleep(1 / tps)
+            yield token
+        yield self._final_result(messages, system_prompt, tokens, finish_reason, request_id)
+
+
+def _create_llm_adapter(provider: str, model_name: str, temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False) -> BaseLLMAdapter:
+    """Instantiate a new adapter for the given provider (no registry lookup)."""
+    if settings.llm_cassette_mode:
+        # Imported lazily: the cassette module builds on this one
+        from app.services.cassette import cassette_adapter
+        # Replaying needs neither network nor API keys, so no provider adapter is built
+        inner = None
+        if settings.llm_cassette_mode != "replay":
+            inner = _create_provider_adapter(provider, model_name, temperature, api_key, use_proxy)
+        return cassette_adapter(provider, model_name, temperature, inner, api_key, use_proxy)
+    return _create_provider_adapter(provider, model_name, temperature, api_key, use_proxy)
+
+
+def _create_provider_adapter(provider: str, model_name: str, temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False) -> BaseLLMAdapter:
+    """Instantiate the provider-specific adapter."""
     if provider == "openai":
         return OpenAIAdapter(model_name, temperature, api_key, use_proxy)
     elif provider == "deepseek":
         return DeepSeekAdapter(model_name, temperature, api_key, use_proxy)
     elif provider == "ollama":
-        return OllamaAdapter(model_name, temperature, api_key, base_url="http://localhost:11434", use_proxy=use_proxy)
+        return OllamaAdapter(model_name, temperature, api_key, use_proxy=use_proxy)
     elif provider == "google":
         return GoogleAdapter(model_name, temperature, api_key, use_proxy)
     elif provider == "chatanywhere":
         return ChatAnywhereAdapter(model_name, temperature, api_key, use_proxy)
     elif provider == "dashscope" or provider == "aliyun":
         return DashScopeAdapter(model_name, temperature, api_key, use_proxy)
+    elif provider == "mock":
+        return MockAdapter(model_name, temperature, api_key, use_proxy)
     else:
         raise ValueError(f"Unsupported provider: {provider}")
+
+
+def api_key_fingerprint(api_key: Optional[str]) -> str:
+    """Return a short, non-reversible fingerprint of an API key for use in cache keys and logs."""
+    if not api_key:
+        return "default"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+class AdapterRegistry:
+    """
+    Process-wide registry of LLM adapters.
+    
+    Adapters (and the HTTP clients they own) are reused across turns and requests
+    instead of being rebuilt on every call. Entries are evicted in LRU order once
+    the registry is full, or when they have been idle for longer than the idle TTL;
+    evicted adapters are closed.
+    """
+    
+    def __init__(self, max_size: int = 64, idle_ttl: float = 600.0):
+        """
+        Initialize the registry.
+        
+        Args:
+            max_size: Maximum number of live adapters
+            idle_ttl: Seconds an adapter may stay unused before it is evicted
+        """
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        # key -> (adapter, last_used monotonic timestamp)
+        self._adapters: "OrderedDict[Tuple, Tuple[BaseLLMAdapter, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Pending close tasks, referenced so they are not garbage-collected
+        self._closing: Set[asyncio.Task] = set()
+    
+    @staticmethod
+    def make_key(provider: str, model_name: str, temperature: float, api_key: Optional[str], use_proxy: bool) -> Tuple:
+        """Build the registry key. Temperature is part of the key because adapters carry it."""
+        return (provider, model_name, api_key_fingerprint(api_key), bool(use_proxy), float(temperature))
+    
+    def get(self, provider: str, model_name: str, temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False) -> BaseLLMAdapter:
+        """Return a cached adapter for the configuration, creating it on a miss."""
+        key = self.make_key(provider, model_name, temperature, api_key, use_proxy)
+        now = time.monotonic()
+        self._evict_idle(now)
+        
+        entry = self._adapters.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._adapters[key] = (entry[0], now)
+            self._adapters.move_to_end(key)
+            return entry[0]
+        
+        self.misses += 1
+        adapter = _create_llm_adapter(provider, model_name, temperature, api_key, use_proxy)
+        self._adapters[key] = (adapter, now)
+        while len(self._adapters) > self.max_size:
+            _, (evicted, _) = self._adapters.popitem(last=False)
+            self._close_later(evicted)
+        return adapter
+    
+    def _evict_idle(self, now: float):
+        """Evict adapters that have not been used within the idle TTL."""
+        if self.idle_ttl <= 0:
+            return
+        expired = [key for key, (_, last_used) in self._adapters.items() if now - last_used > self.idle_ttl]
+        for key in expired:
+            adapter, _ = self._adapters.pop(key)
+            self._close_later(adapter)
+    
+    def _close_later(self, adapter: BaseLLMAdapter):
+        """
+        Close an evicted adapter without blocking the caller.
+        
+        A turn that fetched the adapter before eviction may still be using it,
+        so the close waits for its in-flight calls to finish.
+        """
+        self.evictions += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No running loop (e.g. sync tests); resources are reclaimed by GC
+            return
+        task = loop.create_task(self._close_when_idle(adapter))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+    
+    async def _close_when_idle(self, adapter: BaseLLMAdapter):
+        await adapter.wait_idle()
+        await self._safe_close(adapter)
+    
+    @staticmethod
+    async def _safe_close(adapter: BaseLLMAdapter):
+        try:
+            await adapter.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing LLM adapter {type(adapter).__name__}: {str(e)}")
+    
+    async def aclose(self):
+        """Close and drop every registered adapter (used on application shutdown)."""
+        adapters = [adapter for adapter, _ in self._adapters.values()]
+        self._adapters.clear()
+        for adapter in adapters:
+            await self._safe_close(adapter)
+        logger.info(f"Closed {len(adapters)} LLM adapters")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return registry counters."""
+        lookups = self.hits + self.misses
+        return {
+            "live_clients": len(self._adapters),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "closing": len(self._closing),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Global adapter registry
+adapter_registry = AdapterRegistry(
+    max_size=settings.llm_adapter_cache_size,
+    idle_ttl=settings.llm_adapter_idle_ttl
+)
+
+
+def get_llm_adapter(provider: str, model_name: str, temperature: float = 0.7, api_key: Optional[str] = None, use_proxy: bool = False) -> BaseLLMAdapter:
+    """
+    Get the appropriate LLM adapter from the process-wide registry.
+    
+    Args:
+        provider: Provider name (openai, deepseek, ollama, google, chatanywhere, dashscope, mock)
+        model_name: Model name
+        temperature: Temperature parameter
+        api_key: Optional API key
+        use_proxy: Whether to use proxy
+        
+    Returns:
+        Shared LLM adapter instance
+        
+    Raises:
+        ValueError: If provider is not supported
+    """
+    provider = provider.lower()
+    return adapter_registry.get(provider, model_name, temperature, api_key, use_proxy)
@@ -0,0 +1,178 @@
+"""
+Deterministic response cache for LLM calls.
+
+Responses are keyed on a canonical hash of the request (provider, model,
+temperature, system prompt, messages) and stored as the list of streamed
+chunks, so a cached entry can serve both generate() and generate_stream().
+The in-memory tier is a bounded LRU with TTL; an optional SQLite file adds a
+persistent second tier shared across restarts.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def request_fingerprint(provider: str, model_name: str, temperature: float, system_prompt: str,
+                        messages: List[Dict[str, Any]], **options: Any) -> str:
+    """
+    Canonical hash of an LLM request.
+
+    Keys are sorted and separators fixed so that equal requests always hash the same.
+    """
+    payload = {
+        "provider": provider,
+        "model": model_name,
+        "temperature": round(float(temperature), 4),
+        "system": system_prompt,
+        "messages": messages,
+        "options": {key: value for key, value in options.items() if value is not None},
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """SQLite-backed cache tier. Calls are blocking and run in a worker thread."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, chunks TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[List[str], float]]:
+        with self._lock:
+            row = self._conn.execute("SELECT chunks, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, chunks: List[str], expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, chunks, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(chunks, ensure_ascii=False), expires_at)
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + optional SQLite) cache of LLM responses."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, disk_path: Optional[str] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum entries in the in-memory tier
+            ttl: Seconds an entry stays valid
+            disk_path: Optional SQLite file for the persistent tier
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (chunks, expires_at wall-clock timestamp)
+        self._memory: "OrderedDict[str, Tuple[List[str], float]]" = OrderedDict()
+        self._disk = _DiskTier(disk_path) if disk_path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, chunks: List[str], expires_at: float):
+        self._memory[key] = (chunks, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[List[str]]:
+        """Return the cached chunks for a key, or None on a miss."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            if entry[1] >= time.time():
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+            del self._memory[key]
+
+        if self._disk:
+            try:
+                found = await asyncio.to_thread(self._disk.get, key)
+            except Exception as e:
+                logger.warning(f"LLM cache disk read failed: {str(e)}")
+                found = None
+            if found is not None:
+                self._remember(key, found[0], found[1])
+                self.disk_hits += 1
+                return found[0]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, chunks: List[str]):
+        """Store a complete response (as its list of chunks)."""
+        if not chunks:
+            return
+        expires_at = time.time() + self.ttl
+        self._remember(key, chunks, expires_at)
+        if self._disk:
+            try:
+                await asyncio.to_thread(self._disk.set, key, chunks, expires_at)
+            except Exception as e:
+                logger.warning(f"LLM cache disk write failed: {str(e)}")
+
+    def clear(self):
+        """Drop the in-memory tier."""
+        self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "disk_enabled": self._disk is not None,
+        }
+
+
+def should_cache(temperature: float, cache: Optional[bool]) -> bool:
+    """
+    Decide whether a call is cacheable.
+
+    An explicit per-agent opt-in/opt-out wins; otherwise only deterministic
+    (temperature 0) calls are cached.
+    """
+    if not settings.llm_cache_enabled:
+        return False
+    if cache is not None:
+        return cache
+    return temperature == 0
+
+
+# Global response cache
+response_cache = ResponseCache(
+    max_entries=settings.llm_cache_max_entries,
+    ttl=settings.llm_cache_ttl,
+    disk_path=settings.llm_cache_disk_path
+)
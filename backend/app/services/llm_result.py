@@ -0,0 +1,114 @@
+"""
+Structured results of LLM calls.
+
+Adapters return the generated text together with what the provider reported
+about the call (token usage, finish reason, request id) and what we measured
+(time to first token, total latency), so costs and slow providers can be
+tracked per message.
+
+Callers pass GenerationOptions to bound a call: a max_tokens cap and stop
+sequences, set per agent and per room mode.
+"""
+from dataclasses import dataclass, fields
+from typing import Any, AsyncIterator, Dict, Optional, Tuple, Union
+
+
+@dataclass(frozen=True)
+class GenerationOptions:
+    """Limits for one LLM call; None / empty means the provider default."""
+
+    max_tokens: Optional[int] = None
+    stop: Tuple[str, ...] = ()
+
+    def merge(self, other: Optional["GenerationOptions"]) -> "GenerationOptions":
+        """Combine two sets of limits: the smaller max_tokens wins, stop sequences add up."""
+        if other is None:
+            return self
+        caps = [value for value in (self.max_tokens, other.max_tokens) if value]
+        stop = tuple(dict.fromkeys(self.stop + other.stop))
+        return GenerationOptions(max_tokens=min(caps) if caps else None, stop=stop)
+
+
+@dataclass
+class LLMResult:
+    """Generated content plus usage and timing of one LLM call."""
+
+    content: str = ""
+    provider: Optional[str] = None
+    model_name: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    ttft_ms: Optional[float] = None
+    latency_ms: Optional[float] = None
+    finish_reason: Optional[str] = None
+    request_id: Optional[str] = None
+    cache_hit: bool = False
+    # Shared another caller's upstream call: its usage is recorded by that caller only
+    coalesced: bool = False
+
+    @property
+    def total_tokens(self) -> Optional[int]:
+        if self.prompt_tokens is None and self.completion_tokens is None:
+            return None
+        return (self.prompt_tokens or 0) + (self.completion_tokens or 0)
+
+    def merge_usage(self, other: "LLMResult"):
+        """Copy the provider-reported fields that `other` knows and this result does not."""
+        for name in ("prompt_tokens", "completion_tokens", "cached_tokens", "finish_reason", "request_id"):
+            if getattr(other, name) is not None:
+                setattr(self, name, getattr(other, name))
+
+    def usage_columns(self) -> Dict[str, Any]:
+        """Keyword arguments for the usage columns of Message / ChatSessionMessage."""
+        return {
+            "provider": self.provider,
+            "model_name": self.model_name,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "ttft_ms": self.ttft_ms,
+            "latency_ms": self.latency_ms,
+            "finish_reason": self.finish_reason,
+            "provider_request_id": self.request_id,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+
+class LLMStream:
+    """
+    Async iterator over the text chunks of a streamed LLM call.
+
+    The adapter's item stream ends with an LLMResult carrying usage and timing;
+    it is kept in `result` rather than yielded, so consumers only see text.
+    """
+
+    def __init__(self, items: AsyncIterator[Union[str, LLMResult]]):
+        self._items = items
+        self.result: Optional[LLMResult] = None
+
+    def __aiter__(self) -> "LLMStream":
+        return self
+
+    async def __anext__(self) -> str:
+        while True:
+            item = await self._items.__anext__()
+            if isinstance(item, LLMResult):
+                self.result = item
+                continue
+            return item
+
+    async def aclose(self):
+        await self._items.aclose()
+
+
+def as_int(value: Any) -> Optional[int]:
+    """Return `value` if it is an int (provider usage fields may be missing or None)."""
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+
+def as_str(value: Any) -> Optional[str]:
+    """Return `value` if it is a non-empty string."""
+    return value if isinstance(value, str) and value else None
@@ -0,0 +1,202 @@
+"""
+In-memory message windows of running rooms.
+
+A running room keeps the newest messages of its session in a bounded ring
+buffer of compact records, seeded from the database once when the
+conversation starts and appended to whenever a message is saved or posted.
+Every participant gets a view of the window already formatted for the LLM
+(own messages as assistant turns, everybody else as "[Name]: ..."), which is
+brought up to date incrementally: a turn formats only the messages added since
+that participant last spoke and runs no history query.
+
+The window also holds the session's rolling summary: loaded once with the
+history and replaced by the summarizer whenever it writes a new one, so turns
+don't query it either.
+
+Messages posted by humans are counted and signalled, so a turn generated ahead
+of its publish time can notice that its context went stale.
+"""
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+
+class MessageRecord:
+    """Compact copy of the message fields needed to build context."""
+
+    __slots__ = ("id", "role", "sender_name", "content")
+
+    def __init__(self, id: int, role: str, sender_name: Optional[str], content: str):
+        self.id = id
+        self.role = role
+        self.sender_name = sender_name
+        self.content = content
+
+    @classmethod
+    def from_message(cls, message: Any) -> "MessageRecord":
+        return cls(message.id, message.role, message.sender_name, message.content)
+
+
+class SummaryRecord:
+    """Compact copy of a conversation summary."""
+
+    __slots__ = ("content", "last_message_id")
+
+    def __init__(self, content: str, last_message_id: int):
+        self.content = content
+        self.last_message_id = last_message_id
+
+    @classmethod
+    def from_summary(cls, summary: Any) -> Optional["SummaryRecord"]:
+        if summary is None:
+            return None
+        return cls(summary.content, summary.last_message_id or 0)
+
+
+def format_for(record: MessageRecord, name: str) -> Dict[str, str]:
+    """LLM message for `record` as seen by the participant called `name`."""
+    if record.role == "system":
+        # System messages as context
+        return {"role": "user", "content": f"[System]: {record.content}"}
+    if record.sender_name == name:
+        # Own messages: role is assistant, no name prefix needed
+        return {"role": "assistant", "content": record.content}
+    # Other participants' messages: role is user, add name prefix
+    return {"role": "user", "content": f"[{record.sender_name or 'Unknown'}]: {record.content}"}
+
+
+class _View:
+    """One participant's formatted copy of the window."""
+
+    __slots__ = ("messages", "seq")
+
+    def __init__(self, size: int):
+        # (message ID, formatted message), oldest first
+        self.messages: Deque[Tuple[int, Dict[str, str]]] = deque(maxlen=size)
+        # Number of window appends already applied
+        self.seq = 0
+
+
+class MessageWindow:
+    """Ring buffer of the newest messages of one room session."""
+
+    def __init__(self, room_id: int, session_id: int, size: int):
+        """
+        Initialize the window.
+
+        Args:
+            room_id: Room ID
+            session_id: Room session the messages belong to
+            size: Maximum number of messages kept
+        """
+        self.room_id = room_id
+        self.session_id = session_id
+        self.size = max(1, size)
+        self.records: Deque[MessageRecord] = deque(maxlen=self.size)
+        self._views: Dict[str, _View] = {}
+        # Total number of records ever appended
+        self._seq = 0
+        self.formatted = 0
+        # Rolling summary of the messages before the window's context
+        self.summary: Optional[SummaryRecord] = None
+        # Human messages appended so far, and a wake-up for whoever waits on the next one
+        self.user_messages = 0
+        self.user_posted = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def seed(self, messages: Iterable[Any]):
+        """Append existing messages (ORM objects or records), oldest first."""
+        for message in messages:
+            self.append(message)
+
+    def append(self, message: Any):
+        record = message if isinstance(message, MessageRecord) else MessageRecord.from_message(message)
+        if record.id is not None and self._contains(record.id):
+            # Already in the window (e.g. saved while the window was being seeded)
+            return
+        self.records.append(record)
+        self._seq += 1
+        if record.role == "user":
+            self.user_messages += 1
+            self.user_posted.set()
+
+    def _contains(self, message_id: int) -> bool:
+        last = self.records[-1].id if self.records else None
+        # IDs only grow, so anything newer than the last record is new
+        if last is None or message_id > last:
+            return False
+        return any(record.id == message_id for record in self.records)
+
+    def view(self, name: str, after_id: int = 0) -> List[Dict[str, str]]:
+        """
+        Context messages for the participant called `name`, oldest first.
+
+        Args:
+            name: Participant name (their own messages become assistant turns)
+            after_id: Only include messages newer than this ID (older ones are summarized)
+
+        Returns:
+            Formatted messages; treat them as read-only, they are shared between turns
+        """
+        view = self._views.get(name)
+        if view is None:
+            view = self._views[name] = _View(self.size)
+        new = self._seq - view.seq
+        if new > 0:
+            # Records the view has not seen; all of them if it fell out of the window
+            start = max(0, len(self.records) - new)
+            for index in range(start, len(self.records)):
+                record = self.records[index]
+                view.messages.append((record.id, format_for(record, name)))
+            self.formatted += len(self.records) - start
+            view.seq = self._seq
+
+        if not after_id:
+            return [message for _, message in view.messages]
+        return [message for message_id, message in view.messages if message_id is None or message_id > after_id]
+
+
+class MessageWindows:
+    """Message windows of the rooms currently running, by room ID."""
+
+    def __init__(self):
+        self._windows: Dict[int, MessageWindow] = {}
+
+    def open(self, room_id: int, session_id: int, size: int, messages: Iterable[Any] = ()) -> MessageWindow:
+        """Create (or replace) the window of a room session, seeded with `messages`."""
+        window = MessageWindow(room_id, session_id, size)
+        window.seed(messages)
+        self._windows[room_id] = window
+        return window
+
+    def get(self, room_id: int, session_id: int) -> Optional[MessageWindow]:
+        window = self._windows.get(room_id)
+        if window is None or window.session_id != session_id:
+            return None
+        return window
+
+    def append(self, room_id: int, session_id: int, message: Any) -> bool:
+        """Append a message to the room's window if the room is running that session."""
+        window = self.get(room_id, session_id)
+        if window is None:
+            return False
+        window.append(message)
+        return True
+
+    def close(self, room_id: int, window: Optional[MessageWindow] = None):
+        """Drop the room's window (only if it is still `window`, when given)."""
+        if window is None or self._windows.get(room_id) is window:
+            self._windows.pop(room_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "windows": len(self._windows),
+            "messages": sum(len(window) for window in self._windows.values()),
+            "formatted": sum(window.formatted for window in self._windows.values()),
+        }
+
+
+# Windows of the rooms running in this process
+message_windows = MessageWindows()
@@ -0,0 +1,292 @@
+"""
+Write-behind persistence of chat messages.
+
+Saving a message used to be an `add` + `commit` + `refresh` on the event loop,
+two or more database round trips per message. Messages now get their ID and
+timestamps up front, so they can be broadcast, appended to the message window
+and returned to the client right away. The rows go on a queue and are
+written in batches: one multi-row INSERT per table and one commit per flush
+window, through the async engine of the caller's session.
+
+Durability is configurable per writer or per call: "after_broadcast" returns
+as soon as the message is queued (a crash can lose the last window of
+messages), "before_ack" waits for the batch holding the message to commit;
+concurrent savers then share one group commit.
+
+On PostgreSQL, IDs are reserved in blocks from the table's own sequence
+(`nextval`), so they never collide with rows inserted by other workers, by
+direct commits or by scripts. SQLite has no sequence: IDs continue from the
+stored maximum, which is only safe with a single writing process (the
+development setup).
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ("after_broadcast", "before_ack")
+
+# IDs reserved from a sequence per round trip
+ID_BLOCK_SIZE = 64
+
+
+class _Pending:
+    """A row waiting for its batch."""
+
+    __slots__ = ("bind", "table", "row", "future", "queued_at")
+
+    def __init__(self, bind: Any, table: Any, row: Dict[str, Any], future: asyncio.Future):
+        self.bind = bind
+        self.table = table
+        self.row = row
+        self.future = future
+        self.queued_at = time.perf_counter()
+
+
+def _consume(future: asyncio.Future):
+    # Failures are logged by the writer; nobody has to await an "after_broadcast" save
+    if not future.cancelled():
+        future.exception()
+
+
+class MessageWriter:
+    """Batches message INSERTs into one commit per flush window."""
+
+    def __init__(self, window_ms: float = 20.0, max_batch: int = 200, durability: str = "after_broadcast",
+                 enabled: bool = True):
+        """
+        Initialize the writer.
+
+        Args:
+            window_ms: Time messages are collected before a batch is written
+            max_batch: Maximum number of rows per INSERT statement
+            durability: Default durability mode, see DURABILITY_MODES
+            enabled: False to save messages with a direct commit each (no batching)
+        """
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch = max(1, max_batch)
+        self.durability = durability
+        self.enabled = enabled
+        # (engine, table name) -> IDs reserved from the sequence, not handed out yet
+        self._reserved_ids: Dict[Tuple[Any, str], Deque[int]] = {}
+        # (engine, table name) -> next message ID, where there is no sequence
+        self._next_ids: Dict[Tuple[Any, str], int] = {}
+        # Allocators to re-seed from the table after a failed insert
+        self._reseed: Set[Tuple[Any, str]] = set()
+        self._pending: List[_Pending] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._timer: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.rows = 0
+        self.failed_rows = 0
+        self.max_batch_size = 0
+        self.total_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.last_flush_ms: Optional[float] = None
+        self.total_commit_wait_ms = 0.0
+
+    async def save(self, db: AsyncSession, message: Any, durability: Optional[str] = None) -> Any:
+        """
+        Persist a message (Message or ChatSessionMessage).
+
+        Args:
+            db: Session of the caller; its engine receives the row
+            message: New ORM object; gets its ID and defaults assigned in place
+            durability: Override of the writer's durability mode
+
+        Returns:
+            The message, with its ID and timestamps set
+
+        Raises:
+            ValueError: If the durability mode is unknown
+            Exception: With "before_ack", if the batch holding the message failed
+        """
+        durability = durability or self.durability
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unsupported message durability: {durability}")
+        if not self.enabled:
+            db.add(message)
+            await db.commit()
+            await db.refresh(message)
+            return message
+
+        future = await self.submit(db, message)
+        if durability == "before_ack":
+            await future
+        return message
+
+    async def submit(self, db: AsyncSession, message: Any) -> asyncio.Future:
+        """Queue a message; the returned future resolves once its batch is committed."""
+        self._bind_loop()
+        await self._prepare(db.bind, message)
+        return self._enqueue(db.bind, message.__table__, _row(message))
+
+    def _enqueue(self, bind: Any, table: Any, row: Dict[str, Any]) -> asyncio.Future:
+        future = self._loop.create_future()
+        future.add_done_callback(_consume)
+        self._pending.append(_Pending(bind, table, row, future))
+        if self._timer is None:
+            self._timer = self._loop.create_task(self._flush_later())
+        return future
+
+    async def flush(self):
+        """Write everything queued so far; returns once it is committed (or failed)."""
+        self._bind_loop()
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            if self._timer is not None and self._timer is not asyncio.current_task():
+                # Everything the timer was waiting for is in this batch
+                self._timer.cancel()
+                self._timer = None
+            if not batch:
+                return
+            started = time.perf_counter()
+            errors = await self._write(batch)
+            committed = time.perf_counter()
+
+            flush_ms = (committed - started) * 1000
+            self.batches += 1
+            self.rows += len(batch)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+            self.total_flush_ms += flush_ms
+            self.max_flush_ms = max(self.max_flush_ms, flush_ms)
+            self.last_flush_ms = flush_ms
+            for item, error in zip(batch, errors):
+                self.total_commit_wait_ms += (committed - item.queued_at) * 1000
+                if item.future.done():
+                    continue
+                if error is None:
+                    item.future.set_result(None)
+                else:
+                    item.future.set_exception(error)
+
+    async def aclose(self):
+        """Write the remaining messages (called on shutdown)."""
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "durability": self.durability,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "rows": self.rows,
+            "failed_rows": self.failed_rows,
+            "avg_batch_size": round(self.rows / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "last_flush_ms": round(self.last_flush_ms, 2) if self.last_flush_ms is not None else None,
+            "avg_flush_ms": round(self.total_flush_ms / self.batches, 2) if self.batches else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_commit_wait_ms": round(self.total_commit_wait_ms / self.rows, 2) if self.rows else 0.0,
+        }
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Rows queued on a loop that is gone (tests, a restarted server) move to this one
+            stranded, self._pending = self._pending, []
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._timer = None
+            for item in stranded:
+                self._enqueue(item.bind, item.table, item.row)
+        return loop
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self._timer = None
+        await self.flush()
+
+    async def _prepare(self, bind: Any, message: Any):
+        """Assign the column defaults and the ID the database would have assigned."""
+        table = message.__table__
+        for column in table.columns:
+            if column.default is None or getattr(message, column.key) is not None:
+                continue
+            if column.default.is_scalar:
+                setattr(message, column.key, column.default.arg)
+            elif column.default.is_callable:
+                setattr(message, column.key, column.default.arg(None))
+        if message.id is None:
+            message.id = await self._allocate_id(bind, table)
+
+    async def _allocate_id(self, bind: Any, table: Any) -> int:
+        key = (bind, table.name)
+        if bind.dialect.name == "postgresql":
+            reserved = self._reserved_ids.setdefault(key, deque())
+            while not reserved:
+                reserved.extend(await self._reserve_ids(bind, table))
+            return reserved.popleft()
+
+        # No sequence to draw from: continue after the stored maximum
+        if key not in self._next_ids or key in self._reseed:
+            self._reseed.discard(key)
+            # On a connection of its own: the caller's session may be busy or mid-transaction
+            async with bind.connect() as conn:
+                stored = await conn.scalar(select(func.max(table.c.id))) or 0
+            # Another save may have allocated while the query ran
+            self._next_ids[key] = max(self._next_ids.get(key, 0), stored + 1)
+        next_id = self._next_ids[key]
+        self._next_ids[key] = next_id + 1
+        return next_id
+
+    async def _reserve_ids(self, bind: Any, table: Any) -> List[int]:
+        """Draw a block of IDs from the table's sequence (the values are used up even if rolled back)."""
+        async with bind.connect() as conn:
+            rows = await conn.execute(
+                text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+                {"table": table.name, "count": ID_BLOCK_SIZE}
+            )
+            return [row[0] for row in rows]
+
+    async def _write(self, batch: List[_Pending]) -> List[Optional[Exception]]:
+        """Insert a batch: one transaction per engine and table, multi-row INSERTs."""
+        errors: List[Optional[Exception]] = [None] * len(batch)
+        groups: Dict[Tuple[Any, Any], List[int]] = {}
+        for index, item in enumerate(batch):
+            groups.setdefault((item.bind, item.table), []).append(index)
+
+        for (bind, table), indexes in groups.items():
+            rows = [batch[index].row for index in indexes]
+            try:
+                async with bind.begin() as conn:
+                    for start in range(0, len(rows), self.max_batch):
+                        await conn.execute(table.insert().values(rows[start:start + self.max_batch]))
+            except Exception as e:
+                logger.warning(f"Batched insert of {len(rows)} rows into {table.name} failed, retrying row by row: {str(e)}")
+                # Isolate the bad rows so they don't take the rest of the batch with them
+                for index in indexes:
+                    try:
+                        async with bind.begin() as conn:
+                            await conn.execute(table.insert().values(batch[index].row))
+                    except Exception as row_error:
+                        logger.error(f"Could not persist {table.name} row {batch[index].row.get('id')}: {str(row_error)}")
+                        errors[index] = row_error
+                        self.failed_rows += 1
+                        self._reseed.add((bind, table.name))
+        return errors
+
+
+def _row(message: Any) -> Dict[str, Any]:
+    """Column values of a prepared message (every column, so batched rows share one shape)."""
+    return {column.name: getattr(message, column.key) for column in message.__table__.columns}
+
+
+# Process-wide message writer
+message_writer = MessageWriter(
+    window_ms=settings.message_flush_window_ms,
+    max_batch=settings.message_flush_max_batch,
+    durability=settings.message_durability,
+    enabled=settings.message_write_behind
+)
@@ -3,13 +3,25 @@ Chat Orchestrator Engine - manages AI group conversations.
 """
 import asyncio
 import logging
-from typing import List, Dict, Optional, Union
+import time
+from typing import Any, List, Dict, Optional, Union
 from datetime import datetime
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from app.models import Room, Agent, Message, Role
-from app.services.llm_adapter import get_llm_adapter
+from app.services.agent_adapter import get_agent_adapter
+from app.services.context_builder import agent_token_budget, fit_to_budget
+from app.services.deadline import deadline_scope
+from app.services.length_budget import LengthBudget, complete_within_budget, room_mode_limits
+from app.services.llm_result import LLMResult
+from app.services.message_window import MessageRecord, MessageWindow, SummaryRecord, format_for, message_windows
+from app.services.message_writer import message_writer
+from app.services.prompts import room_role_prompt
+from app.services.resilience import DeadlineExceeded
+from app.services.summarizer import aload_room_summary, summarizer, summary_prompt_section
+from app.services.turn_stream import TurnStream
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -31,11 +43,27 @@ class ChatOrchestrator:
         self.room_id = room_id
         self.current_agent_index = 0
         self._stop_requested = False
+        self._stop_event = asyncio.Event()
+        self._turn_task: Optional[asyncio.Task] = None
+        # Viewer stream of the turn in flight, if turns are streamed
+        self._turn_stream: Optional[TurnStream] = None
+        # In-memory history of the running session
+        self._window: Optional[MessageWindow] = None
+        # Turn timing, reported by the room runtime
+        self.turns = 0
+        self.total_turn_ms = 0.0
+        self.last_turn_ms: Optional[float] = None
+        self._turn_started: Optional[float] = None
+        # Turns generated again because a human spoke before they were published
+        self.regenerated_turns = 0
     
     def stop(self):
-        """Request the orchestrator to stop."""
+        """Request the orchestrator to stop, cancelling the turn in flight."""
         logger.info(f"Stop requested for room {self.room_id}")
         self._stop_requested = True
+        self._stop_event.set()
+        if self._turn_task is not None and not self._turn_task.done():
+            self._turn_task.cancel()
     
     async def start_conversation(self, websocket_broadcast_callback=None):
         """
@@ -49,12 +77,16 @@ class ChatOrchestrator:
             ValueError: If room not found or invalid state
             Exception: If conversation fails
         """
-        from app.core.database import SessionLocal
+        from app.core.database import AsyncSessionLocal
         
-        db = SessionLocal()
+        db = AsyncSessionLocal()
         try:
-            # Load room and validate
-            room = db.query(Room).filter(Room.id == self.room_id).first()
+            # Load room and validate; roles and their agents are loaded up front (no lazy loads on an async session)
+            room = await db.scalar(
+                select(Room)
+                .options(selectinload(Room.roles).selectinload(Role.agent))
+                .where(Room.id == self.room_id)
+            )
             if not room:
                 raise ValueError(f"Room {self.room_id} not found")
             
@@ -64,13 +96,28 @@ class ChatOrchestrator:
             # Check if room has roles
             if not room.roles:
                 raise ValueError("Room has no roles")
-            participants = room.roles
+            participants = list(room.roles)
             
             # Set room status to running
             room.status = "running"
-            db.commit()
+            await db.commit()
             logger.info(f"Starting conversation for room {self.room_id} (Mode: {room.mode})")
             
+            # Load the history and the summary once; saved and posted messages are
+            # appended from here on, and the summarizer replaces the summary
+            self._window = message_windows.open(
+                room.id,
+                room.session_id,
+                settings.max_context_messages,
+                await self._get_recent_messages(db, room)
+            )
+            self._window.summary = SummaryRecord.from_summary(
+                await aload_room_summary(db, room.id, room.session_id)
+            )
+            
+            # Preload local models in the background so the first turns don't pay the load time
+            warm_up_task = asyncio.create_task(self._warm_up_participants(participants))
+            
             # Send system message announcing the topic
             if room.mode == 'group_chat':
                 start_msg = f"Welcome to the group chat! Topic: {room.topic}. Everyone, please introduce yourselves briefly."
@@ -84,10 +131,13 @@ class ChatOrchestrator:
                 session_id=room.session_id
             )
             
+            # Earliest time the next turn may be published
+            publish_at = time.monotonic()
+            
             # Main conversation loop
             while not self._stop_requested:
                 # Refresh room state
-                db.refresh(room)
+                await db.refresh(room, ["status", "current_rounds", "max_rounds", "pacing_seconds"])
                 
                 # Check if max rounds reached
                 if room.current_rounds >= room.max_rounds:
@@ -106,9 +156,6 @@ class ChatOrchestrator:
                     break
                 
                 try:
-                    # Generate response
-                    response = await self._generate_response(db, participant, room)
-                    
                     # Determine agent_id, role_id and sender_name
                     agent_id = None
                     role_id = None
@@ -122,6 +169,37 @@ class ChatOrchestrator:
                         role_id = participant.id
                         sender_name = participant.name
                     
+                    # Relay the turn to viewers as it is generated (held back until its publish time)
+                    turn_stream = None
+                    if websocket_broadcast_callback and settings.room_stream_turns:
+                        turn_stream = TurnStream(
+                            websocket_broadcast_callback,
+                            room.id,
+                            {"agent_id": agent_id, "role_id": role_id, "agent_name": sender_name},
+                            window_ms=settings.stream_delta_window_ms,
+                            held=publish_at > time.monotonic()
+                        )
+                        await turn_stream.start()
+                    
+                    # Generate response within the turn deadline, publish it at the pacing deadline
+                    self._turn_stream = turn_stream
+                    try:
+                        result = await self._paced_turn(db, participant, room, publish_at)
+                    except asyncio.CancelledError:
+                        if turn_stream:
+                            await turn_stream.abort("stopped")
+                        if self._stop_requested:
+                            logger.info(f"Room {self.room_id}: turn cancelled by stop request")
+                            break
+                        raise
+                    except Exception as e:
+                        if turn_stream:
+                            await turn_stream.abort(str(e))
+                        raise
+                    finally:
+                        self._turn_stream = None
+                    response = result.content
+                    
                     # Save message
                     message = await self._save_message(
                         db,
@@ -131,41 +209,55 @@ class ChatOrchestrator:
                         content=response,
                         role="assistant",
                         session_id=room.session_id,
-                        sender_name=sender_name
+                        sender_name=sender_name,
+                        usage=result.usage_columns()
                     )
                     
-                    # Broadcast via WebSocket
-                    if websocket_broadcast_callback:
-                        await websocket_broadcast_callback(room.id, {
-                            "type": "message",
-                            "data": {
-                                "id": message.id,
-                                "agent_id": agent_id,
-                                "role_id": role_id,
-                                "agent_name": sender_name,
-                                "content": response,
-                                "created_at": message.created_at.isoformat()
-                            }
-                        })
+                    # Broadcast via WebSocket (the end of the stream carries the saved message)
+                    message_data = {
+                        "id": message.id,
+                        "agent_id": agent_id,
+                        "role_id": role_id,
+                        "agent_name": sender_name,
+                        "content": response,
+                        "created_at": message.created_at.isoformat()
+                    }
+                    if turn_stream:
+                        await turn_stream.end(message_data)
+                    elif websocket_broadcast_callback:
+                        await websocket_broadcast_callback(room.id, {"type": "message", "data": message_data})
                     
                     # Increment round count
                     room.current_rounds += 1
-                    db.commit()
+                    await db.commit()
+                    
+                    # Fold older messages into the rolling summary in the background
+                    if isinstance(participant, Role) and participant.agent:
+                        summarizer.schedule_room(room.id, room.session_id, participant.agent)
                     
                     logger.info(f"Room {self.room_id}: {sender_name} spoke (round {room.current_rounds}/{room.max_rounds})")
                     
-                    # Sleep to avoid rapid-fire messages
-                    await asyncio.sleep(settings.default_sleep_between_messages)
+                    # Pace the messages; pipelined, the next turn is generated during the pause
+                    # and only its publishing waits (a round takes max(pacing, latency))
+                    pacing = self._pacing(room)
+                    if settings.room_pipelined_turns:
+                        publish_at = time.monotonic() + pacing
+                    else:
+                        # A stop request wakes us up
+                        await self._pause(pacing)
                     
                 except Exception as e:
                     logger.error(f"Error generating response for participant: {str(e)}")
                     # Re-raise exception to stop conversation and notify user
                     raise e
             
+            if not warm_up_task.done():
+                warm_up_task.cancel()
+            
             # Mark room as finished if not stopped manually
             if not self._stop_requested:
                 room.status = "finished"
-                db.commit()
+                await db.commit()
                 logger.info(f"Conversation finished for room {self.room_id}")
                 
                 # Send completion message
@@ -182,8 +274,8 @@ class ChatOrchestrator:
             try:
                 # Need to re-query if session was rolled back
                 if db:
-                    db.rollback()
-                    room = db.query(Room).filter(Room.id == self.room_id).first()
+                    await db.rollback()
+                    room = await db.get(Room, self.room_id, populate_existing=True)
                     if room:
                         # Send error message to frontend
                         error_msg = f"Conversation Error: {str(e)}"
@@ -195,15 +287,178 @@ class ChatOrchestrator:
                         )
                         
                         room.status = "idle"
-                        db.commit()
+                        await db.commit()
             except Exception as notify_err:
                 logger.error(f"Failed to notify frontend of error: {str(notify_err)}")
             raise
         finally:
+            if self._window is not None:
+                message_windows.close(self.room_id, self._window)
+                self._window = None
             if db:
-                db.close()
+                await db.close()
 
     
+    def _turn_deadline(self, room: Room, participant: Union[Agent, Role]) -> float:
+        """Seconds allowed for one turn: the tighter of the room's and the agent's deadline, if set."""
+        agent = participant.agent if isinstance(participant, Role) else participant
+        values = [getattr(room, "turn_timeout", None), getattr(agent, "turn_timeout", None)]
+        values = [value for value in values if isinstance(value, (int, float)) and value > 0]
+        return float(min(values)) if values else settings.turn_timeout_seconds
+    
+    def _pacing(self, room: Room) -> float:
+        """Seconds between two published messages: the room's pacing if set, else the default."""
+        value = getattr(room, "pacing_seconds", None)
+        if isinstance(value, (int, float)) and value >= 0:
+            return float(value)
+        return settings.default_sleep_between_messages
+    
+    async def _paced_turn(self, db: AsyncSession, participant: Union[Agent, Role], room: Room, publish_at: float) -> LLMResult:
+        """
+        Run a turn now and return it no earlier than `publish_at`.
+        
+        Until then the turn's viewer stream is held back, and a human message
+        posted to the room restarts the generation so the reply takes it into
+        account. Once the stream is released the turn is no longer restarted.
+        
+        Raises:
+            DeadlineExceeded: If the turn did not finish in time
+            asyncio.CancelledError: If the turn was cancelled by `stop()`
+        """
+        window = self._window
+        while True:
+            seen = window.user_messages if window is not None else 0
+            if window is not None:
+                window.user_posted.clear()
+            turn = asyncio.create_task(self._run_turn(db, participant, room))
+            try:
+                stale = await self._hold(turn, publish_at, window, seen)
+            except BaseException:
+                turn.cancel()
+                raise
+            if self._stop_requested:
+                await _cancel(turn)
+                raise asyncio.CancelledError()
+            if not stale:
+                if self._turn_stream is not None:
+                    await self._turn_stream.release()
+                return await turn
+            
+            await _cancel(turn)
+            if self._turn_stream is not None:
+                self._turn_stream.discard()
+            self.regenerated_turns += 1
+            logger.info(f"Room {self.room_id}: human message before {participant.name}'s turn was published, regenerating")
+    
+    async def _hold(self, turn: asyncio.Task, publish_at: float, window: Optional[MessageWindow], seen: int) -> bool:
+        """
+        Wait until `publish_at` while the turn is generated.
+        
+        Returns:
+            True if a human message arrived meanwhile (the turn is stale); False at
+            the publish time, on a stop request, or as soon as the turn failed
+        """
+        while True:
+            if window is not None and window.user_messages > seen:
+                return True
+            remaining = publish_at - time.monotonic()
+            if remaining <= 0 or self._stop_requested:
+                return False
+            if turn.done() and (turn.cancelled() or turn.exception() is not None):
+                return False
+            
+            waiters = [asyncio.ensure_future(self._stop_event.wait())]
+            if window is not None:
+                waiters.append(asyncio.ensure_future(window.user_posted.wait()))
+            if not turn.done():
+                waiters.append(turn)
+            try:
+                await asyncio.wait(waiters, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for waiter in waiters:
+                    if waiter is not turn:
+                        waiter.cancel()
+    
+    async def _run_turn(self, db: AsyncSession, participant: Union[Agent, Role], room: Room) -> LLMResult:
+        """
+        Generate a response as a cancellable task bounded by the turn deadline.
+        
+        The deadline is also visible to the adapters below (retries stop early),
+        and `stop()` cancels the task so room control takes effect immediately.
+        
+        Raises:
+            DeadlineExceeded: If the turn did not finish in time
+            asyncio.CancelledError: If the turn was cancelled by `stop()`
+        """
+        seconds = self._turn_deadline(room, participant)
+        with deadline_scope(seconds):
+            # Created inside the scope so the task (and tasks it starts) inherit the deadline
+            self._turn_task = asyncio.create_task(self._generate_response(db, participant, room))
+        self._turn_started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(self._turn_task, timeout=seconds)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"{participant.name} did not answer within {seconds:g}s")
+        finally:
+            self.last_turn_ms = (time.monotonic() - self._turn_started) * 1000
+            self._turn_started = None
+            self._turn_task = None
+        self.turns += 1
+        self.total_turn_ms += self.last_turn_ms
+        return result
+    
+    def turn_stats(self) -> Dict[str, Any]:
+        """Completed turns, their timing, and how long the turn in flight has been running."""
+        return {
+            "turns": self.turns,
+            "last_turn_ms": round(self.last_turn_ms, 1) if self.last_turn_ms is not None else None,
+            "avg_turn_ms": round(self.total_turn_ms / self.turns, 1) if self.turns else None,
+            "regenerated_turns": self.regenerated_turns,
+            "current_turn_ms": (
+                round((time.monotonic() - self._turn_started) * 1000, 1) if self._turn_started is not None else None
+            ),
+        }
+    
+    async def _pause(self, seconds: float):
+        """Sleep between turns, returning early if a stop is requested."""
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def _warm_up_participants(self, participants: List[Role]):
+        """
+        Warm up the models used by the room's participants.
+        
+        Each distinct agent configuration is warmed up once, concurrently.
+        Failures are logged and otherwise ignored; the turn itself will surface them.
+        
+        Args:
+            participants: Roles in the room
+        """
+        adapters = {}
+        for participant in participants:
+            agent = participant.agent
+            if not agent:
+                continue
+            providers = [agent.provider] + [target.get("provider", "") for target in agent.fallback_chain or []]
+            if "ollama" not in (provider.lower() for provider in providers):
+                continue
+            try:
+                adapter = get_agent_adapter(agent)
+            except Exception as e:
+                logger.warning(f"Could not create adapter for warm-up of agent {agent.id}: {str(e)}")
+                continue
+            adapters[id(adapter)] = adapter
+        
+        if not adapters:
+            return
+        
+        results = await asyncio.gather(*(adapter.warm_up() for adapter in adapters.values()), return_exceptions=True)
+        for adapter, result in zip(adapters.values(), results):
+            if isinstance(result, Exception):
+                logger.warning(f"Warm-up failed for {adapter.model_name} in room {self.room_id}: {str(result)}")
+    
     def _select_next_participant(self, participants: List[Union[Agent, Role]]) -> Optional[Union[Agent, Role]]:
         """
         Select the next participant to speak using round-robin strategy.
@@ -221,114 +476,98 @@ class ChatOrchestrator:
         self.current_agent_index += 1
         return participant
     
-    async def _generate_response(self, db: Session, participant: Union[Agent, Role], room: Room) -> str:
+    async def _generate_response(self, db: AsyncSession, participant: Union[Agent, Role], room: Room) -> LLMResult:
         """
         Generate a response from the given participant.
         
         Args:
-            db: Database session
+            db: Room's database session (not queried here: the turn task can be cancelled)
             participant: Agent or Role to generate response from
             room: Current room
             
         Returns:
-            Generated response text
+            LLMResult with the generated text, token usage and timing
             
         Raises:
             Exception: If generation fails
         """
-        # Get recent messages for context
-        messages = self._get_recent_messages(db, room)
-        
-        # Convert to format expected by LLM
-        llm_messages = []
-        current_name = participant.name
-        
-        for msg in messages:
-            content = msg.content
-            # Default logic: treat as user message (context)
-            role = "user"
-            
-            if msg.role == "system":
-                # System messages as context
-                content = f"[System]: {content}"
-            elif msg.sender_name == current_name:
-                # Own messages: role is assistant, no name prefix needed
-                role = "assistant"
-            else:
-                # Other participants' messages: role is user, add name prefix
-                sender = msg.sender_name or "Unknown"
-                content = f"[{sender}]: {content}"
-                
-            llm_messages.append({"role": role, "content": content})
+        # Recent messages for context, already formatted for the LLM in the room's window;
+        # older ones are carried by the rolling summary
+        window = self._window
+        if window is not None and window.session_id == room.session_id:
+            summary = window.summary
+            llm_messages = window.view(participant.name, summary.last_message_id if summary else 0)
+        else:
+            # On a session of its own: this runs in the turn task, which stop(), the deadline
+            # or a regeneration may cancel mid-query, and `db` is shared by the whole room
+            from app.core.database import AsyncSessionLocal
+            async with AsyncSessionLocal() as turn_db:
+                summary = await aload_room_summary(turn_db, room.id, room.session_id)
+                after_id = summary.last_message_id if summary else 0
+                messages = await self._get_recent_messages(turn_db, room, after_id=after_id)
+            llm_messages = [format_for(MessageRecord.from_message(msg), participant.name) for msg in messages]
         
         # Determine configuration
         if isinstance(participant, Role):
             agent = participant.agent
-            # Construct role-based system prompt
-            system_prompt = (
-                f"You are playing the role of {participant.name}.\n"
-                f"Current Context:\n"
-                f"- You are in a group chat room.\n"
-                f"- Topic: {room.topic}\n"
-                f"- Other participants are present.\n\n"
-                f"Your Profile:\n"
-                f"- Personal Experience / Personality: {participant.personality or 'Not specified'}\n"
-                f"- Gender: {participant.gender or 'Not specified'}\n"
-                f"- Age: {participant.age or 'Not specified'}\n"
-                f"- Profession: {participant.profession or 'Not specified'}\n"
-                f"- Aggressiveness Level (1-10): {participant.aggressiveness}.\n\n"
-                f"Instructions:\n"
-                f"1. Always stay in character as {participant.name}.\n"
-                f"2. If Gender, Age, or Profession are 'Not specified', you MUST infer them from your personality.\n"
-                f"3. Use your personality to add emotional color to your responses.\n"
-                f"4. Your responses must be SHORT, CONCISE, and mimic casual human group chat behavior.\n"
-                f"5. Do not write long paragraphs. Maximum 30 words per message.\n"
-                f"6. React to other people's messages (marked with [Name]:) based on your personality.\n"
-                f"7. Do NOT include your own name prefix in your response.\n"
-            )
+            # Role-based system prompt (compiled template, cached per role, topic and mode)
+            system_prompt = room_role_prompt(participant, room.topic, room.mode)
         else:
             # Fallback for unexpected types, though we expect only Roles
             raise ValueError(f"Invalid participant type: {type(participant)}")
+        system_prompt += summary_prompt_section(summary)
 
-        # Get LLM adapter
-        adapter = get_llm_adapter(
-            provider=agent.provider,
-            model_name=agent.model_name,
-            temperature=agent.temperature,
-            api_key=agent.api_key_config,
-            use_proxy=agent.use_proxy
+        # Keep the newest history that fits the agent's token budget
+        llm_messages = fit_to_budget(
+            llm_messages,
+            agent_token_budget(agent),
+            agent.provider,
+            agent.model_name,
+            system_prompt
         )
         
-        # Generate response
-        response = await adapter.generate(llm_messages, system_prompt)
+        # Get LLM adapter (with the agent's fallback chain, if any)
+        adapter = get_agent_adapter(agent)
         
-        return response
+        # Generate response within the room mode's limits; word/sentence budgets
+        # stream the turn and stop upstream as soon as the budget is reached
+        options, budget = room_mode_limits(room.mode)
+        if not settings.llm_early_stop_enabled:
+            budget = LengthBudget()
+        if self._turn_stream is not None:
+            return await complete_within_budget(adapter, llm_messages, system_prompt, budget, options,
+                                                on_text=self._turn_stream.push)
+        if budget.enabled:
+            return await complete_within_budget(adapter, llm_messages, system_prompt, budget, options)
+        return await adapter.complete(llm_messages, system_prompt, options=options)
     
-    def _get_recent_messages(self, db: Session, room: Room) -> List[Message]:
+    async def _get_recent_messages(self, db: AsyncSession, room: Room, after_id: int = 0) -> List[Message]:
         """
         Get recent messages from the room for context.
         
         Args:
             db: Database session
             room: Room object
+            after_id: Only return messages newer than this ID (already summarized otherwise)
             
         Returns:
-            List of recent messages (limited by max_context_messages)
+            Candidate context messages (at most max_context_messages), trimmed
+            to the token budget by the caller
         """
-        messages = (
-            db.query(Message)
-            .filter(Message.room_id == room.id)
-            .filter(Message.session_id == room.session_id)
+        messages = (await db.scalars(
+            select(Message)
+            .where(Message.room_id == room.id)
+            .where(Message.session_id == room.session_id)
+            .where(Message.id > after_id)
             .order_by(desc(Message.created_at))
             .limit(settings.max_context_messages)
-            .all()
-        )
+        )).all()
         # Reverse to chronological order
         return list(reversed(messages))
     
-    async def _save_message(self, db: Session, room_id: int, agent_id: Optional[int], role_id: Optional[int], content: str, role: str, session_id: int = 0, sender_name: Optional[str] = None) -> Message:
+    async def _save_message(self, db: AsyncSession, room_id: int, agent_id: Optional[int], role_id: Optional[int], content: str, role: str, session_id: int = 0, sender_name: Optional[str] = None, usage: Optional[Dict[str, Any]] = None) -> Message:
         """
-        Save a message to the database.
+        Save a message through the write-behind writer.
         
         Args:
             db: Database session
@@ -339,9 +578,10 @@ class ChatOrchestrator:
             role: Message role (user, assistant, system)
             session_id: Session ID for conversation restarts
             sender_name: Name of the sender
+            usage: LLM usage columns (see LLMResult.usage_columns) for generated messages
             
         Returns:
-            Created message object
+            Created message object (its ID is set, the row may be committed after it is broadcast)
         """
         message = Message(
             room_id=room_id,
@@ -351,14 +591,15 @@ class ChatOrchestrator:
             role=role,
             session_id=session_id,
             sender_name=sender_name,
-            created_at=datetime.utcnow()
+            created_at=datetime.utcnow(),
+            **(usage or {})
         )
-        db.add(message)
-        db.commit()
-        db.refresh(message)
+        await message_writer.save(db, message)
+        if self._window is not None and self._window.session_id == session_id:
+            self._window.append(message)
         return message
     
-    async def _send_system_message(self, db: Session, content: str, websocket_broadcast_callback=None, session_id: int = 0):
+    async def _send_system_message(self, db: AsyncSession, content: str, websocket_broadcast_callback=None, session_id: int = 0):
         """
         Send a system message.
         
@@ -389,3 +630,12 @@ class ChatOrchestrator:
                     "created_at": message.created_at.isoformat()
                 }
             })
+
+
+async def _cancel(task: asyncio.Task):
+    """Cancel a turn task and wait for it to finish."""
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
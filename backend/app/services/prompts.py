@@ -0,0 +1,217 @@
+"""
+Compiled, cached persona system prompts.
+
+Room and playground system prompts used to be rebuilt from Role and Agent
+fields on every turn or request. Templates are now parsed once, and the
+rendered prompt is cached per role, room topic and mode (room turns) or per
+user, agent and role (playground chat). Role and agent edits invalidate the
+affected entries; topic and mode are part of the key, so room edits never see
+a stale prompt.
+
+Rendering is deterministic and the per-turn parts (the rolling summary) are
+appended after the cached prompt, so consecutive turns send byte-identical
+prompt prefixes and provider-side prefix caching can hit.
+"""
+import string
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+NOT_SPECIFIED = "Not specified"
+
+# Placeholders available to room templates
+ROOM_TEMPLATE_FIELDS = frozenset({"name", "topic", "personality", "gender", "age", "profession", "aggressiveness", "mode"})
+
+ROOM_ROLE_TEMPLATE = (
+    "You are playing the role of {name}.\n"
+    "Current Context:\n"
+    "- You are in a group chat room.\n"
+    "- Topic: {topic}\n"
+    "- Other participants are present.\n\n"
+    "Your Profile:\n"
+    "- Personal Experience / Personality: {personality}\n"
+    "- Gender: {gender}\n"
+    "- Age: {age}\n"
+    "- Profession: {profession}\n"
+    "- Aggressiveness Level (1-10): {aggressiveness}.\n\n"
+    "Instructions:\n"
+    "1. Always stay in character as {name}.\n"
+    "2. If Gender, Age, or Profession are 'Not specified', you MUST infer them from your personality.\n"
+    "3. Use your personality to add emotional color to your responses.\n"
+    "4. Your responses must be SHORT, CONCISE, and mimic casual human group chat behavior.\n"
+    "5. Do not write long paragraphs. Maximum 30 words per message.\n"
+    "6. React to other people's messages (marked with [Name]:) based on your personality.\n"
+    "7. Do NOT include your own name prefix in your response.\n"
+)
+
+
+class PromptTemplate:
+    """A str.format-style template ("{field}" placeholders) parsed once."""
+
+    __slots__ = ("source", "fields", "_parts")
+
+    def __init__(self, source: str):
+        """
+        Compile the template.
+
+        Args:
+            source: Template text with {field} placeholders ({{ and }} for literal braces)
+
+        Raises:
+            ValueError: If a placeholder uses a conversion, format spec or attribute access
+        """
+        self.source = source
+        self._parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, format_spec, conversion in string.Formatter().parse(source):
+            if field is not None and (format_spec or conversion or not field.isidentifier()):
+                raise ValueError(f"Unsupported placeholder in prompt template: {{{field}}}")
+            self._parts.append((literal, field))
+        self.fields = frozenset(field for _, field in self._parts if field)
+
+    def render(self, values: Dict[str, Any]) -> str:
+        return "".join(literal + (str(values[field]) if field else "") for literal, field in self._parts)
+
+
+def _text(value: Any) -> str:
+    """Field value as prompt text; line endings are normalized so equal content renders equal bytes."""
+    if value is None or value == "":
+        return NOT_SPECIFIED
+    return str(value).replace("\r\n", "\n")
+
+
+class PromptCache:
+    """LRU cache of rendered prompts with invalidation by role and agent."""
+
+    def __init__(self, max_entries: int = 1024):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of rendered prompts kept
+        """
+        self.max_entries = max_entries
+        # key -> (prompt, agent ID, role ID) it was rendered from
+        self._entries: "OrderedDict[Tuple, Tuple[str, Optional[int], Optional[int]]]" = OrderedDict()
+        # mode -> compiled template
+        self._templates: Dict[str, PromptTemplate] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def template(self, mode: str) -> PromptTemplate:
+        """Compiled room template for a mode (settings.room_mode_prompts, else the default)."""
+        source = settings.room_mode_prompts.get(mode) or ROOM_ROLE_TEMPLATE
+        template = self._templates.get(mode)
+        if template is None or template.source != source:
+            template = PromptTemplate(source)
+            unknown = template.fields - ROOM_TEMPLATE_FIELDS
+            if unknown:
+                raise ValueError(f"Unknown placeholders in the {mode} prompt template: {', '.join(sorted(unknown))}")
+            self._templates[mode] = template
+        return template
+
+    def get(self, key: Tuple) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Tuple, prompt: str, agent_id: Optional[int] = None, role_id: Optional[int] = None) -> str:
+        self._entries[key] = (prompt, agent_id, role_id)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return prompt
+
+    def invalidate_role(self, role_id: int):
+        self._invalidate(lambda agent_id, entry_role_id: entry_role_id == role_id)
+
+    def invalidate_agent(self, agent_id: int):
+        self._invalidate(lambda entry_agent_id, role_id: entry_agent_id == agent_id)
+
+    def clear(self):
+        self._entries.clear()
+        self._templates.clear()
+
+    def _invalidate(self, matches):
+        stale = [key for key, (_, agent_id, role_id) in self._entries.items() if matches(agent_id, role_id)]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+# Global prompt cache
+prompt_cache = PromptCache(max_entries=settings.prompt_cache_size)
+
+
+def room_role_prompt(role: Any, topic: str, mode: str) -> str:
+    """
+    System prompt of a role speaking in a room.
+
+    Args:
+        role: Role (name and persona fields)
+        topic: Room topic
+        mode: Room mode, selects the template
+
+    Returns:
+        Rendered prompt, cached until the role is edited
+    """
+    template = prompt_cache.template(mode)
+    # The template text is part of the key so a changed template is never served stale
+    key = ("room", role.id, topic, mode, template.source)
+    prompt = prompt_cache.get(key)
+    if prompt is not None:
+        return prompt
+    prompt = template.render({
+        "name": _text(role.name),
+        "topic": _text(topic),
+        "personality": _text(role.personality),
+        "gender": _text(role.gender),
+        "age": _text(role.age),
+        "profession": _text(role.profession),
+        "aggressiveness": role.aggressiveness,
+        "mode": mode,
+    })
+    return prompt_cache.put(key, prompt, role_id=role.id)
+
+
+def chat_prompt_key(user_id: int, agent_id: int, role_id: Optional[int]) -> Tuple:
+    """Cache key of a playground chat prompt (the user is part of it: hits skip the ownership query)."""
+    return ("chat", user_id, agent_id, role_id)
+
+
+def render_chat_prompt(base_prompt: Optional[str], role: Optional[Any]) -> str:
+    """Agent system prompt, followed by the role persona if a role is used."""
+    base_prompt = (base_prompt or "").replace("\r\n", "\n")
+    if role is None:
+        return base_prompt
+
+    persona_parts = [f"Name: {_text(role.name)}"]
+    if role.gender:
+        persona_parts.append(f"Gender: {_text(role.gender)}")
+    if role.age:
+        persona_parts.append(f"Age: {_text(role.age)}")
+    if role.profession:
+        persona_parts.append(f"Profession: {_text(role.profession)}")
+    if role.personality:
+        persona_parts.append(f"Personality: {_text(role.personality)}")
+    persona_text = "\n".join(persona_parts)
+
+    # Combine agent prompt (base instruction) with role prompt (persona)
+    if base_prompt:
+        return f"{base_prompt}\n\nRole Persona:\n{persona_text}"
+    return f"Role Persona:\n{persona_text}"
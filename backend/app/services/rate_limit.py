@@ -0,0 +1,194 @@
+"""
+Per-provider concurrency and rate limiting for LLM calls.
+
+Each (provider, API key) pair gets a limiter that bounds the number of in-flight
+requests and enforces requests-per-minute and tokens-per-minute token buckets.
+Callers wait in FIFO order instead of failing, so a burst of rooms started at
+once is smoothed out rather than turned into a 429 storm.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate used for TPM accounting.
+
+    Roughly 4 characters per token for ASCII text and one token per character
+    for CJK and other non-ASCII text.
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate."""
+
+    def __init__(self, per_minute: float):
+        """
+        Initialize the bucket.
+
+        Args:
+            per_minute: Refill rate and capacity (tokens per minute)
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)."""
+        self._refill(time.monotonic())
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        """Take tokens from the bucket. The balance may go negative to account for overruns."""
+        self._refill(time.monotonic())
+        self.tokens -= amount
+
+
+class ProviderLimiter:
+    """Concurrency limit plus RPM/TPM buckets for one provider and API key."""
+
+    def __init__(self, name: str, max_concurrency: int, rpm: int = 0, tpm: int = 0):
+        """
+        Initialize the limiter.
+
+        Args:
+            name: Label used in logs and metrics
+            max_concurrency: Maximum number of in-flight requests (0 = unlimited)
+            rpm: Requests per minute (0 = unlimited)
+            tpm: Tokens per minute (0 = unlimited)
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        # asyncio primitives must not be shared across event loops
+        self.loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self._rpm = TokenBucket(rpm) if rpm > 0 else None
+        self._tpm = TokenBucket(tpm) if tpm > 0 else None
+        # Only the head of the queue may claim capacity, which keeps admission FIFO
+        self._admission = asyncio.Lock()
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def _wait_for_buckets(self, tokens: int):
+        while True:
+            delay = 0.0
+            if self._rpm:
+                delay = max(delay, self._rpm.time_until(1))
+            if self._tpm:
+                delay = max(delay, self._tpm.time_until(tokens))
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        if self._rpm:
+            self._rpm.consume(1)
+        if self._tpm:
+            self._tpm.consume(tokens)
+
+    @asynccontextmanager
+    async def acquire(self, estimated_tokens: int = 0):
+        """
+        Wait for capacity, then hold an in-flight slot for the duration of the block.
+
+        Args:
+            estimated_tokens: Tokens charged against the TPM bucket up front
+
+        Yields:
+            Callable to settle the TPM bucket once the actual token usage is known
+        """
+        start = time.monotonic()
+        self.queue_depth += 1
+        try:
+            async with self._admission:
+                if self._semaphore:
+                    await self._semaphore.acquire()
+                try:
+                    await self._wait_for_buckets(estimated_tokens)
+                except BaseException:
+                    if self._semaphore:
+                        self._semaphore.release()
+                    raise
+        finally:
+            self.queue_depth -= 1
+
+        waited = time.monotonic() - start
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        if waited > 1.0:
+            logger.info(f"LLM limiter {self.name}: request waited {waited:.2f}s for capacity")
+
+        def settle(actual_tokens: int):
+            """Charge (or refund) the difference between actual and estimated tokens."""
+            if self._tpm and actual_tokens != estimated_tokens:
+                self._tpm.consume(actual_tokens - estimated_tokens)
+
+        self.in_flight += 1
+        try:
+            yield settle
+        finally:
+            self.in_flight -= 1
+            if self._semaphore:
+                self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return limiter metrics."""
+        return {
+            "name": self.name,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "admitted": self.admitted,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+        }
+
+
+class LimiterRegistry:
+    """Registry of limiters keyed by (provider, API key fingerprint)."""
+
+    def __init__(self):
+        self._limiters: Dict[Tuple[str, str], ProviderLimiter] = {}
+
+    def get(self, provider: str, key_fingerprint: str) -> ProviderLimiter:
+        """Get (or create) the limiter for a provider and API key. Must be called from a running loop."""
+        key = (provider, key_fingerprint)
+        limiter = self._limiters.get(key)
+        if limiter is None or limiter.loop is not asyncio.get_running_loop():
+            overrides = settings.llm_provider_limits.get(provider, {})
+            limiter = ProviderLimiter(
+                name=f"{provider}:{key_fingerprint}",
+                max_concurrency=int(overrides.get("max_concurrency", settings.llm_max_concurrency)),
+                rpm=int(overrides.get("rpm", settings.llm_rpm_limit)),
+                tpm=int(overrides.get("tpm", settings.llm_tpm_limit))
+            )
+            self._limiters[key] = limiter
+        return limiter
+
+    def stats(self) -> Dict[str, Any]:
+        """Return metrics for every limiter."""
+        return {limiter.name: limiter.stats() for limiter in self._limiters.values()}
+
+
+# Global limiter registry
+limiter_registry = LimiterRegistry()
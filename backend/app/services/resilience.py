@@ -0,0 +1,343 @@
+"""
+Resilience layer for LLM calls: error classification, retries and circuit breaking.
+
+Provider errors are wrapped in LLMError and classified as retryable (429, 5xx,
+timeouts, connection resets) or not. Retryable failures are retried with
+jittered exponential backoff that honors Retry-After, and a per-provider
+circuit breaker fails fast while a provider is down. Retries never sleep past
+the caller's deadline (see app.services.deadline).
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, AsyncIterator
+
+import httpx
+import openai
+
+from app.core.config import settings
+from app.services.deadline import remaining
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Error raised by LLM adapters, carrying its retry classification."""
+
+    def __init__(self, message: str, provider: Optional[str] = None, status_code: Optional[int] = None,
+                 retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.provider = provider
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(LLMError):
+    """Raised without calling the provider while its circuit breaker is open."""
+
+
+class DeadlineExceeded(LLMError):
+    """Raised when a unit of work (e.g. a room turn) does not finish before its deadline."""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _status_and_headers(exc: BaseException):
+    """Extract an HTTP status code and response headers from known exception types."""
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code, exc.response.headers
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code, exc.response.headers
+    # google-genai APIError exposes the HTTP status as `code`
+    code = getattr(exc, "code", None)
+    if isinstance(code, int) and 100 <= code < 600:
+        response = getattr(exc, "response", None)
+        return code, getattr(response, "headers", None)
+    return None, None
+
+
+def classify_error(exc: BaseException):
+    """
+    Classify an exception raised by a provider call.
+
+    Returns:
+        Tuple of (retryable, status_code, retry_after seconds)
+    """
+    status_code, headers = _status_and_headers(exc)
+    if status_code is not None:
+        retry_after = parse_retry_after(headers.get("retry-after")) if headers else None
+        retryable = status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+        return retryable, status_code, retry_after
+
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError,
+                        httpx.TimeoutException, httpx.TransportError,
+                        asyncio.TimeoutError, ConnectionError)):
+        return True, None, None
+    return False, None, None
+
+
+def wrap_provider_error(provider_label: str, exc: Exception, action: str = "generate") -> LLMError:
+    """
+    Wrap a provider exception in a classified LLMError.
+
+    Args:
+        provider_label: Human-readable provider name used in the message
+        exc: Original exception
+        action: 'generate' or 'stream', used in the message
+
+    Returns:
+        LLMError to raise (chained from the original exception by the caller)
+    """
+    if isinstance(exc, LLMError):
+        return exc
+    retryable, status_code, retry_after = classify_error(exc)
+    return LLMError(
+        f"Failed to {action} response from {provider_label}: {str(exc)}",
+        provider=provider_label,
+        status_code=status_code,
+        retryable=retryable,
+        retry_after=retry_after
+    )
+
+
+class RetryPolicy:
+    """Jittered exponential backoff ("full jitter") honoring Retry-After."""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def compute_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Delay before retry number `attempt` (0-based)."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    closed -> open after `failure_threshold` consecutive retryable failures;
+    open -> half_open once `recovery_timeout` has elapsed; a single probe call is
+    then allowed through and closes the circuit on success or re-opens it on failure.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.transitions: Dict[str, int] = {}
+        self.rejected = 0
+        self._listeners: List[Callable[[str, str, str], None]] = []
+
+    def add_listener(self, callback: Callable[[str, str, str], None]):
+        """Register a callback invoked as callback(name, old_state, new_state) on every transition."""
+        self._listeners.append(callback)
+
+    def _transition(self, new_state: str):
+        old_state = self.state
+        if old_state == new_state:
+            return
+        self.state = new_state
+        key = f"{old_state}->{new_state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        logger.warning(f"Circuit breaker {self.name}: {old_state} -> {new_state}")
+        for listener in self._listeners:
+            try:
+                listener(self.name, old_state, new_state)
+            except Exception as e:
+                logger.error(f"Circuit breaker listener failed: {str(e)}")
+
+    def before_call(self):
+        """Raise CircuitOpenError if calls are currently not allowed."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self._transition(self.HALF_OPEN)
+            else:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit open for {self.name}; failing fast", provider=self.name)
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit half-open for {self.name}; probe in progress", provider=self.name)
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+        if self.state != self.CLOSED:
+            self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._transition(self.OPEN)
+
+    def release(self):
+        """Release a probe slot without recording an outcome (e.g. on cancellation)."""
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected,
+            "transitions": dict(self.transitions),
+        }
+
+
+class BreakerRegistry:
+    """Registry of circuit breakers keyed by provider."""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+
+    def get(self, provider: str) -> CircuitBreaker:
+        breaker = self._breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                provider,
+                failure_threshold=settings.llm_breaker_failure_threshold,
+                recovery_timeout=settings.llm_breaker_recovery_timeout
+            )
+            self._breakers[provider] = breaker
+        return breaker
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "breakers": {name: breaker.stats() for name, breaker in self._breakers.items()},
+        }
+
+
+# Global circuit breaker registry
+breaker_registry = BreakerRegistry()
+
+
+def default_retry_policy() -> RetryPolicy:
+    return RetryPolicy(
+        max_attempts=settings.llm_retry_max_attempts,
+        base_delay=settings.llm_retry_base_delay,
+        max_delay=settings.llm_retry_max_delay
+    )
+
+
+def _record_outcome(breaker: CircuitBreaker, exc: LLMError):
+    # Only provider-side failures count; client errors (400/401/...) mean the provider is up
+    if exc.retryable:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def _past_deadline(delay: float) -> bool:
+    left = remaining()
+    return left is not None and delay >= left
+
+
+async def call_with_retries(breaker: CircuitBreaker, policy: RetryPolicy, call: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run `call` behind the circuit breaker, retrying retryable LLMErrors.
+
+    Args:
+        breaker: Circuit breaker for the provider
+        policy: Retry policy
+        call: Zero-argument coroutine factory performing one attempt
+
+    Returns:
+        Result of the first successful attempt
+    """
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            result = await call()
+        except LLMError as e:
+            _record_outcome(breaker, e)
+            if not e.retryable or attempt + 1 >= policy.max_attempts:
+                raise
+            delay = policy.compute_delay(attempt, e.retry_after)
+            if _past_deadline(delay):
+                # A retry could not finish in time; fail now rather than sleeping into the deadline
+                raise
+            breaker_registry.retries += 1
+            logger.warning(f"Retrying {breaker.name} in {delay:.2f}s (attempt {attempt + 2}/{policy.max_attempts}): {str(e)}")
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success()
+        return result
+
+
+async def stream_with_retries(breaker: CircuitBreaker, policy: RetryPolicy,
+                              make_stream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+    """
+    Stream from `make_stream()` behind the circuit breaker.
+
+    A failed attempt is retried only if it failed before yielding any chunk,
+    so consumers never see duplicated output.
+    """
+    attempt = 0
+    while True:
+        breaker.before_call()
+        started = False
+        try:
+            async for chunk in make_stream():
+                started = True
+                yield chunk
+        except LLMError as e:
+            _record_outcome(breaker, e)
+            if started or not e.retryable or attempt + 1 >= policy.max_attempts:
+                raise
+            delay = policy.compute_delay(attempt, e.retry_after)
+            if _past_deadline(delay):
+                # A retry could not finish in time; fail now rather than sleeping into the deadline
+                raise
+            breaker_registry.retries += 1
+            logger.warning(f"Retrying stream from {breaker.name} in {delay:.2f}s (attempt {attempt + 2}/{policy.max_attempts}): {str(e)}")
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success()
+        return
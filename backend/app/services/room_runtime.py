@@ -0,0 +1,292 @@
+"""
+Supervised runtime for room conversations.
+
+Room orchestrators run as supervised asyncio tasks under a global limit of
+concurrently running rooms; further starts wait in a bounded FIFO queue. Each
+run's outcome (finished, stopped, cancelled or failed with its error) is
+recorded when its task ends, the run is removed from the active set and the
+next queued room is admitted.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+BroadcastCallback = Callable[[int, Dict[str, Any]], Awaitable[None]]
+
+
+class RoomAlreadyActive(Exception):
+    """Raised when a room that is already queued or running is submitted again."""
+
+
+class RuntimeFull(Exception):
+    """Raised when no room can be admitted and the wait queue is full."""
+
+
+@dataclass
+class RoomRun:
+    """One supervised run of a room's conversation."""
+
+    room_id: int
+    orchestrator: Any
+    broadcast: Optional[BroadcastCallback] = None
+    user_id: Optional[int] = None
+    state: str = "queued"
+    queued_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    ended_at: Optional[float] = None
+    error: Optional[str] = None
+    task: Optional[asyncio.Task] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serializable status of the run, with the orchestrator's turn timing."""
+        end = self.ended_at or time.time()
+        data = {
+            "room_id": self.room_id,
+            "user_id": self.user_id,
+            "state": self.state,
+            "queued_at": self.queued_at,
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+            "wait_seconds": round((self.started_at or end) - self.queued_at, 3),
+            "run_seconds": round(end - self.started_at, 3) if self.started_at else None,
+            "error": self.error,
+        }
+        turn_stats = getattr(self.orchestrator, "turn_stats", None)
+        if callable(turn_stats):
+            data.update(turn_stats())
+        return data
+
+
+class RoomRuntime:
+    """Admission-controlled pool of supervised room orchestrators."""
+
+    def __init__(self, max_running: int = 20, max_queued: int = 100, history_size: int = 50):
+        """
+        Initialize the runtime.
+
+        Args:
+            max_running: Maximum number of rooms running at once (0 = unlimited)
+            max_queued: Maximum number of rooms waiting for a slot
+            history_size: Number of ended runs kept for inspection
+        """
+        self.max_running = max_running
+        self.max_queued = max_queued
+        # Active runs (queued or running) by room ID
+        self._runs: "OrderedDict[int, RoomRun]" = OrderedDict()
+        self._queue: Deque[RoomRun] = deque()
+        # Tasks still holding a slot; a stopped run keeps its slot until its task ends
+        self._tasks: Dict[asyncio.Task, RoomRun] = {}
+        self._history: Deque[RoomRun] = deque(maxlen=history_size)
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    @property
+    def running(self) -> int:
+        return len(self._tasks)
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def is_active(self, room_id: int) -> bool:
+        return room_id in self._runs
+
+    def get(self, room_id: int) -> Optional[RoomRun]:
+        return self._runs.get(room_id)
+
+    def submit(self, orchestrator: Any, broadcast: Optional[BroadcastCallback] = None,
+               user_id: Optional[int] = None) -> RoomRun:
+        """
+        Run `orchestrator.start_conversation(broadcast)` now or once a slot frees up.
+
+        Args:
+            orchestrator: ChatOrchestrator of the room
+            broadcast: WebSocket broadcast callback passed to the orchestrator
+            user_id: User who started the room
+
+        Returns:
+            The run, in state "running" or "queued"
+
+        Raises:
+            RoomAlreadyActive: If the room is already queued or running
+            RuntimeFull: If every slot is taken and the queue is full
+        """
+        room_id = orchestrator.room_id
+        if room_id in self._runs:
+            raise RoomAlreadyActive(f"Room {room_id} is already {self._runs[room_id].state}")
+
+        run = RoomRun(room_id=room_id, orchestrator=orchestrator, broadcast=broadcast, user_id=user_id)
+        if self._has_free_slot():
+            self._runs[room_id] = run
+            self._start(run)
+        elif len(self._queue) < self.max_queued:
+            self._runs[room_id] = run
+            self._queue.append(run)
+            logger.info(f"Room {room_id} queued ({len(self._queue)} waiting, {self.running} running)")
+        else:
+            self.rejected += 1
+            raise RuntimeFull(f"{self.running} rooms running and {len(self._queue)} waiting; try again later")
+        return run
+
+    def queue_position(self, room_id: int) -> Optional[int]:
+        """1-based position of a queued room, None if it is not waiting."""
+        for position, run in enumerate(self._queue, start=1):
+            if run.room_id == room_id:
+                return position
+        return None
+
+    def stop(self, room_id: int) -> bool:
+        """
+        Stop a room gracefully: a queued room is dropped, a running one is asked
+        to stop (cancelling its turn in flight) and detached, so the room can be
+        started again while the old task winds down.
+
+        Returns:
+            True if the room was queued or running
+        """
+        run = self._runs.pop(room_id, None)
+        if run is None:
+            return False
+        if run.state == "queued":
+            self._queue.remove(run)
+            self._end(run, "cancelled")
+            return True
+        run.state = "stopping"
+        run.orchestrator.stop()
+        return True
+
+    def cancel(self, room_id: int) -> bool:
+        """
+        Cancel a room's task outright (for orchestrators that do not react to stop).
+
+        Returns:
+            True if the room was queued or running
+        """
+        # A stopped room may still be winding down outside the active set
+        winding_down = [task for task, run in self._tasks.items() if run.room_id == room_id]
+        stopped = self.stop(room_id)
+        for task in winding_down:
+            task.cancel()
+        return stopped or bool(winding_down)
+
+    def list_runs(self, user_id: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Active runs (running and queued) and recently ended runs, optionally for one user."""
+        def visible(run: RoomRun) -> bool:
+            return user_id is None or run.user_id == user_id
+
+        active = [run.snapshot() for run in self._tasks.values() if visible(run)]
+        active += [run.snapshot() for run in self._queue if visible(run)]
+        return {
+            "active": active,
+            "recent": [run.snapshot() for run in reversed(self._history) if visible(run)],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "max_running": self.max_running,
+            "max_queued": self.max_queued,
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+        }
+
+    async def aclose(self):
+        """Drop queued rooms and cancel running ones (called on shutdown)."""
+        while self._queue:
+            run = self._queue.popleft()
+            self._runs.pop(run.room_id, None)
+            self._end(run, "cancelled")
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _has_free_slot(self) -> bool:
+        return self.max_running <= 0 or self.running < self.max_running
+
+    def _start(self, run: RoomRun):
+        run.state = "running"
+        run.started_at = time.time()
+        run.task = asyncio.create_task(self._supervise(run))
+        self._tasks[run.task] = run
+        self.started += 1
+
+    async def _supervise(self, run: RoomRun):
+        """Run the conversation and record how it ended; never lets an error escape unnoticed."""
+        outcome, error = "finished", None
+        try:
+            await run.orchestrator.start_conversation(run.broadcast)
+            if getattr(run.orchestrator, "_stop_requested", False):
+                outcome = "stopped"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            await asyncio.shield(asyncio.to_thread(_reset_room_status, run.room_id))
+        except Exception as e:
+            outcome, error = "failed", str(e)
+            logger.exception(f"Room {run.room_id} conversation crashed")
+        finally:
+            self._tasks.pop(run.task, None)
+            if self._runs.get(run.room_id) is run:
+                del self._runs[run.room_id]
+            self._end(run, outcome, error)
+            self._admit_next()
+
+    def _end(self, run: RoomRun, outcome: str, error: Optional[str] = None):
+        run.state = outcome
+        run.error = error
+        run.ended_at = time.time()
+        if outcome == "failed":
+            self.failed += 1
+        elif outcome == "cancelled":
+            self.cancelled += 1
+        else:
+            self.completed += 1
+        self._history.append(run)
+        logger.info(f"Room {run.room_id} run ended: {outcome}")
+
+    def _admit_next(self):
+        while self._queue and self._has_free_slot():
+            run = self._queue.popleft()
+            logger.info(f"Room {run.room_id} admitted after {time.time() - run.queued_at:.1f}s in queue")
+            self._start(run)
+
+
+def _reset_room_status(room_id: int):
+    """Set a room left "running" by a cancelled orchestrator back to idle."""
+    from app.core.database import SessionLocal
+    from app.models import Room
+
+    db = SessionLocal()
+    try:
+        room = db.query(Room).filter(Room.id == room_id).first()
+        if room is not None and room.status == "running":
+            room.status = "idle"
+            db.commit()
+    except Exception as e:
+        logger.error(f"Could not reset status of cancelled room {room_id}: {str(e)}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+# Process-wide runtime
+room_runtime = RoomRuntime(
+    max_running=settings.max_running_rooms,
+    max_queued=settings.room_queue_size,
+    history_size=settings.room_run_history
+)
@@ -0,0 +1,156 @@
+"""
+Singleflight coalescing of identical in-flight LLM requests.
+
+Concurrent callers that issue the same request (same fingerprint) share a
+single upstream call: the first caller starts it and later callers wait on the
+same result. Streams are fanned out, so a caller joining mid-stream first
+receives the chunks already produced and then follows the live stream. The
+upstream call is cancelled only once every waiter has gone away.
+"""
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """An in-flight non-streaming call."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _Stream:
+    """An in-flight stream and the chunks it has produced so far."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self):
+        await self._changed.wait()
+
+
+class SingleFlight:
+    """In-flight request table keyed by request fingerprint."""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Stream] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `call` once for all concurrent callers with the same key.
+
+        Args:
+            key: Request fingerprint
+            call: Zero-argument coroutine factory performing the upstream call
+
+        Returns:
+            Result of the shared call
+        """
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = _Call(asyncio.create_task(call()))
+            self._calls[key] = flight
+            flight.task.add_done_callback(lambda _task: self._forget(self._calls, key, flight))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+            logger.debug(f"Coalesced LLM request {key[:12]} ({flight.waiters} already waiting)")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Forgotten right away so a new caller does not join the cancelled call
+                self._forget(self._calls, key, flight)
+                flight.task.cancel()
+
+    async def stream(self, key: str, make_stream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Fan out one upstream stream to all concurrent callers with the same key.
+
+        Args:
+            key: Request fingerprint
+            make_stream: Zero-argument factory returning the upstream async iterator
+
+        Yields:
+            Every chunk of the shared stream, from the first one
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _Stream()
+            self._streams[key] = flight
+            flight.task = asyncio.create_task(self._pump(key, flight, make_stream))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+            logger.debug(f"Coalesced LLM stream {key[:12]} ({flight.waiters} already waiting)")
+
+        flight.waiters += 1
+        try:
+            index = 0
+            while True:
+                if index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                elif flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.wait()
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.done:
+                # Forgotten right away so a new caller does not join the cancelled stream
+                self._forget(self._streams, key, flight)
+                flight.task.cancel()
+
+    async def _pump(self, key: str, flight: _Stream, make_stream: Callable[[], AsyncIterator[str]]):
+        """Consume the upstream stream into the shared buffer."""
+        try:
+            async for chunk in make_stream():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            self._forget(self._streams, key, flight)
+            flight.notify()
+
+    @staticmethod
+    def _forget(table: Dict[str, Any], key: str, flight: Any):
+        # A finished flight must not remove a newer one started under the same key
+        if table.get(key) is flight:
+            del table[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return in-flight and waiter counts."""
+        flights = list(self._calls.values()) + list(self._streams.values())
+        return {
+            "in_flight": len(flights),
+            "waiters": sum(flight.waiters for flight in flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+
+# Global in-flight request table
+singleflight = SingleFlight()
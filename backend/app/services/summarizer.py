@@ -0,0 +1,212 @@
+"""
+Rolling conversation summaries for long rooms and chat sessions.
+
+Every `summary_interval_messages` new messages, a background task folds the
+messages older than the recent window into a stored summary. Prompts then carry
+the summary plus only the messages after it, so prompt size stays flat as a
+conversation grows. Summarization never runs on the turn's hot path; the
+background task works through the async engine, so it never blocks the loop.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models import Agent, ChatSessionMessage, ConversationSummary, Message
+from app.services.llm_adapter import get_llm_adapter
+from app.services.message_window import SummaryRecord, message_windows
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation. "
+    "Keep who said what, positions taken, decisions and open questions. "
+    "Reply with the updated summary only."
+)
+
+# (kind, scope id, room session id)
+SummaryKey = Tuple[str, int, int]
+
+
+def _room_summary_query(room_id: int, session_id: int):
+    return (
+        select(ConversationSummary)
+        .where(ConversationSummary.room_id == room_id)
+        .where(ConversationSummary.room_session_id == session_id)
+        .limit(1)
+    )
+
+
+def _chat_summary_query(chat_session_id: int):
+    return select(ConversationSummary).where(ConversationSummary.chat_session_id == chat_session_id).limit(1)
+
+
+async def aload_room_summary(db: AsyncSession, room_id: int, session_id: int) -> Optional[ConversationSummary]:
+    """Return the summary of a room session, if any."""
+    return (await db.execute(_room_summary_query(room_id, session_id))).scalars().first()
+
+
+async def aload_chat_summary(db: AsyncSession, chat_session_id: int) -> Optional[ConversationSummary]:
+    """Return the summary of a playground chat session, if any."""
+    return (await db.execute(_chat_summary_query(chat_session_id))).scalars().first()
+
+
+def summary_prompt_section(summary: Optional[ConversationSummary]) -> str:
+    """Text appended to the system prompt to carry the summary (empty if none)."""
+    if summary is None or not summary.content:
+        return ""
+    return f"\n\nSummary of the earlier conversation:\n{summary.content}\n"
+
+
+class ConversationSummarizer:
+    """Schedules and runs incremental summary updates in the background."""
+
+    def __init__(self, session_factory: Optional[Callable[[], AsyncSession]] = None):
+        """
+        Initialize the summarizer.
+
+        Args:
+            session_factory: Factory for async database sessions (defaults to AsyncSessionLocal)
+        """
+        self._session_factory = session_factory
+        self._tasks: Dict[SummaryKey, asyncio.Task] = {}
+        self.runs = 0
+        self.failures = 0
+
+    def schedule_room(self, room_id: int, session_id: int, agent: Agent):
+        """Schedule a summary update for a room session, summarizing with the agent's model."""
+        self._schedule(("room", room_id, session_id), agent)
+
+    def schedule_chat_session(self, chat_session_id: int, agent: Agent):
+        """Schedule a summary update for a playground chat session."""
+        self._schedule(("chat", chat_session_id, 0), agent)
+
+    def _schedule(self, key: SummaryKey, agent: Agent):
+        if not settings.summary_enabled:
+            return
+        task = self._tasks.get(key)
+        if task is not None and not task.done():
+            return
+        # Copy what the task needs; ORM objects must not outlive their session
+        model = {
+            "provider": agent.provider,
+            "model_name": agent.model_name,
+            "api_key": agent.api_key_config,
+            "use_proxy": agent.use_proxy,
+        }
+        self._tasks[key] = asyncio.create_task(self._run(key, model))
+
+    async def _run(self, key: SummaryKey, model: Dict[str, Any]):
+        if self._session_factory is None:
+            from app.core.database import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        db = self._session_factory()
+        try:
+            await self.update(db, key, model)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Summary update failed for {key}: {str(e)}")
+        finally:
+            await db.close()
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+
+    async def _pending(self, db: AsyncSession, key: SummaryKey, after_id: int) -> List[Tuple[int, str]]:
+        """Messages not yet folded into the summary, as (id, transcript line)."""
+        kind, scope_id, session_id = key
+        if kind == "room":
+            rows = (await db.scalars(
+                select(Message)
+                .where(Message.room_id == scope_id)
+                .where(Message.session_id == session_id)
+                .where(Message.id > after_id)
+                .order_by(Message.id)
+            )).all()
+            return [(row.id, f"{row.sender_name or row.role.capitalize()}: {row.content}") for row in rows]
+        rows = (await db.scalars(
+            select(ChatSessionMessage)
+            .where(ChatSessionMessage.session_id == scope_id)
+            .where(ChatSessionMessage.id > after_id)
+            .order_by(ChatSessionMessage.id)
+        )).all()
+        return [(row.id, f"{row.role.capitalize()}: {row.content}") for row in rows]
+
+    async def update(self, db: AsyncSession, key: SummaryKey, model: Dict[str, Any]) -> bool:
+        """
+        Fold older messages into the summary if enough new ones have accumulated.
+
+        Args:
+            db: Database session
+            key: Summary key
+            model: Provider/model/API key used to summarize
+
+        Returns:
+            True if the summary was updated
+        """
+        kind, scope_id, session_id = key
+        if kind == "room":
+            summary = await aload_room_summary(db, scope_id, session_id)
+        else:
+            summary = await aload_chat_summary(db, scope_id)
+
+        pending = await self._pending(db, key, summary.last_message_id if summary else 0)
+        keep = settings.summary_keep_recent_messages
+        if len(pending) < settings.summary_interval_messages + keep:
+            return False
+        folded = pending[:-keep] if keep else pending
+
+        transcript = "\n".join(line for _, line in folded)
+        prompt = (
+            f"Current summary:\n{summary.content if summary else '(none)'}\n\n"
+            f"New messages:\n{transcript}\n\n"
+            f"Write the updated summary in at most {settings.summary_max_words} words."
+        )
+        adapter = get_llm_adapter(temperature=0.0, **model)
+        content = await adapter.generate([{"role": "user", "content": prompt}], SUMMARY_SYSTEM_PROMPT)
+
+        if summary is None:
+            summary = ConversationSummary(
+                room_id=scope_id if kind == "room" else None,
+                room_session_id=session_id,
+                chat_session_id=scope_id if kind == "chat" else None,
+                message_count=0
+            )
+            db.add(summary)
+        summary.content = content
+        summary.last_message_id = folded[-1][0]
+        summary.message_count = (summary.message_count or 0) + len(folded)
+        summary.updated_at = datetime.utcnow()
+        await db.commit()
+        if kind == "room":
+            # The running room reads its summary from the window
+            window = message_windows.get(scope_id, session_id)
+            if window is not None:
+                window.summary = SummaryRecord(content, folded[-1][0])
+        self.runs += 1
+        logger.info(f"Updated summary {key}: folded {len(folded)} messages")
+        return True
+
+    async def aclose(self):
+        """Cancel pending summary updates (used on application shutdown)."""
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": sum(1 for task in self._tasks.values() if not task.done()),
+            "runs": self.runs,
+            "failures": self.failures,
+        }
+
+
+# Global summarizer
+summarizer = ConversationSummarizer()
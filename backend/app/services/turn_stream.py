@@ -0,0 +1,135 @@
+"""
+Streaming of room turns to WebSocket viewers.
+
+A streamed turn is broadcast as `message_start`, a series of `delta` events
+and `message_end`. Deltas are coalesced on a short window: the first text goes
+out immediately (so viewers see the provider's time to first token), later
+text is buffered and sent at most once per window instead of one frame per
+token. `message_end` carries the persisted message, whose content is the
+authoritative text of the turn.
+
+A stream can be held: a turn generated ahead of its publish time buffers its
+text without broadcasting anything until `release()`, which sends
+`message_start` and the text so far; from then on it streams as usual.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+BroadcastCallback = Callable[[int, Dict[str, Any]], Awaitable[None]]
+
+
+class TurnStream:
+    """Broadcasts one streamed turn with coalesced deltas."""
+
+    def __init__(self, broadcast: BroadcastCallback, room_id: int, header: Dict[str, Any], window_ms: float = 50.0,
+                 held: bool = False):
+        """
+        Initialize the stream.
+
+        Args:
+            broadcast: Room broadcast callback, called as (room_id, event)
+            room_id: Room the turn belongs to
+            header: Speaker fields sent with message_start (agent_id, role_id, agent_name)
+            window_ms: Minimum interval between two delta events
+            held: Buffer the turn without broadcasting until release()
+        """
+        self.broadcast = broadcast
+        self.room_id = room_id
+        self.header = header
+        self.window = max(0.0, window_ms) / 1000
+        self.stream_id = uuid.uuid4().hex
+        self.deltas_sent = 0
+        self.held = held
+        self._buffer = ""
+        self._last_flush: Optional[float] = None
+        self._timer: Optional[asyncio.Task] = None
+        # Keeps delta events in order when the timer and the turn flush concurrently
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        if self.held:
+            # Sent by release()
+            return
+        await self.broadcast(self.room_id, {
+            "type": "message_start",
+            "data": {"stream_id": self.stream_id, **self.header},
+        })
+
+    async def push(self, text: str):
+        """Add generated text; it is sent now or at the end of the current window."""
+        if not text:
+            return
+        self._buffer += text
+        if self.held or self._timer is not None:
+            return
+        wait = 0.0 if self._last_flush is None else self._last_flush + self.window - time.monotonic()
+        if wait <= 0:
+            await self.flush()
+        else:
+            self._timer = asyncio.create_task(self._flush_later(wait))
+
+    async def flush(self):
+        async with self._lock:
+            if not self._buffer:
+                return
+            text, self._buffer = self._buffer, ""
+            self._last_flush = time.monotonic()
+            self.deltas_sent += 1
+            await self.broadcast(self.room_id, {
+                "type": "delta",
+                "data": {"stream_id": self.stream_id, "content": text},
+            })
+
+    async def release(self):
+        """Start broadcasting a held stream: message_start, then the text generated so far."""
+        if not self.held:
+            return
+        self.held = False
+        await self.start()
+        await self.flush()
+
+    def discard(self):
+        """Drop the buffered text of a held stream (its turn is generated again)."""
+        self._cancel_timer()
+        self._buffer = ""
+
+    async def end(self, message: Dict[str, Any]):
+        """Send the remaining text and the persisted message."""
+        await self.release()
+        self._cancel_timer()
+        await self.flush()
+        await self.broadcast(self.room_id, {
+            "type": "message_end",
+            "data": {"stream_id": self.stream_id, **message},
+        })
+
+    async def abort(self, reason: str):
+        """End a turn that produced no message; viewers drop the partial text."""
+        self._cancel_timer()
+        self._buffer = ""
+        if self.held:
+            # Viewers never saw this turn
+            return
+        try:
+            await self.broadcast(self.room_id, {
+                "type": "message_end",
+                "data": {"stream_id": self.stream_id, "aborted": True, "error": reason},
+            })
+        except Exception as e:
+            logger.warning(f"Could not broadcast end of aborted turn in room {self.room_id}: {str(e)}")
+
+    async def _flush_later(self, wait: float):
+        await asyncio.sleep(wait)
+        # Cleared before flushing so end() never cancels a send half-way through
+        self._timer = None
+        await self.flush()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
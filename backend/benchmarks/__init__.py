@@ -0,0 +1,16 @@
+"""
+Benchmarks for the LLM adapter layer.
+
+A local fake server speaks the OpenAI chat completions protocol (streaming,
+latency and error injection), and the OpenAI-compatible adapters are pointed at
+it through their configurable base URLs. The suite measures what our own code
+adds on top of the network: per-call client overhead, request serialization,
+per-chunk streaming overhead and the highest concurrency the client stack
+sustains. Results are compared with a stored baseline to catch regressions.
+
+Run from the backend directory:
+
+    python -m benchmarks                   # full suite, compare with baseline.json
+    python -m benchmarks --quick           # fewer iterations
+    python -m benchmarks --update-baseline # store the results as the new baseline
+"""
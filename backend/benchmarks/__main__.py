@@ -0,0 +1,59 @@
+"""
+Command-line entry point: python -m benchmarks [--quick] [--update-baseline].
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+from benchmarks.suite import baseline_document, compare, load_baseline, run_suite
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the LLM adapter layer against a local fake OpenAI server, and database event-loop lag")
+    parser.add_argument("--quick", action="store_true", help="Fewer iterations and concurrency levels")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file to compare with")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Allowed relative degradation (default 0.3)")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    # Adapter warnings (e.g. retries) would interleave with the report
+    logging.basicConfig(level=logging.ERROR)
+    results = asyncio.run(run_suite(quick=args.quick))
+
+    width = max(len(name) for name in results)
+    for name, metric in sorted(results.items()):
+        print(f"{name:<{width}}  {metric.value:>12.1f} {metric.unit}")
+
+    document = baseline_document(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(document, handle, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as handle:
+            json.dump(document, handle, indent=2)
+            handle.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\nRegressions against the baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\nNo regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
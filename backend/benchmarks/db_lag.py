@@ -0,0 +1,143 @@
+"""
+Event-loop lag under concurrent database load.
+
+Concurrent room turns run the database work of a turn (summary lookup, recent
+history query, message insert and commit) against a temporary SQLite database
+seeded with a long room history, once through a sync Session on the event loop
+(how handlers used to query) and once through the async engine. A 1 ms ticker
+task measures how late the loop wakes it up meanwhile: that delay is what every
+WebSocket broadcast and token stream in the process waits on.
+
+The sync numbers are a reference for the legacy path only; they are recorded
+in the baseline but not compared.
+"""
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from typing import Awaitable, Callable, List, Tuple
+
+from sqlalchemy import create_engine, desc, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from app.core.database import Base
+from app.models import ConversationSummary, Message, Room
+from app.services.summarizer import aload_room_summary
+from benchmarks.suite import Metric
+
+TICK_SECONDS = 0.001
+
+
+def _summary_query():
+    # Same query as aload_room_summary
+    return (
+        select(ConversationSummary)
+        .where(ConversationSummary.room_id == 1)
+        .where(ConversationSummary.room_session_id == 0)
+        .limit(1)
+    )
+
+
+def _recent_messages_query(limit: int = 50):
+    # Same query as ChatOrchestrator._get_recent_messages
+    return (
+        select(Message)
+        .where(Message.room_id == 1)
+        .where(Message.session_id == 0)
+        .where(Message.id > 0)
+        .order_by(desc(Message.created_at))
+        .limit(limit)
+    )
+
+
+def _new_message(worker: int, turn: int) -> Message:
+    return Message(room_id=1, session_id=0, role="assistant", sender_name=f"Speaker {worker}",
+                   content=f"turn {turn} of speaker {worker}")
+
+
+async def _loop_lag(run: Callable[[], Awaitable[None]]) -> Tuple[List[float], float]:
+    """Wake-up delays (ms) of a 1 ms ticker while `run` executes, and the run's duration."""
+    lags: List[float] = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(TICK_SECONDS)
+            lags.append(max(0.0, (time.perf_counter() - start - TICK_SECONDS) * 1000))
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    try:
+        await run()
+    finally:
+        elapsed = time.perf_counter() - start
+        done.set()
+        await task
+    return lags or [0.0], elapsed
+
+
+def _lag_metrics(mode: str, lags: List[float], elapsed: float, turns: int) -> List[Metric]:
+    p99 = statistics.quantiles(lags, n=100, method="inclusive")[-1] if len(lags) > 1 else lags[0]
+    compared = mode != "sync"
+    return [
+        Metric(f"db_loop_lag_p99_ms.{mode}", p99, "ms", compared=compared),
+        Metric(f"db_loop_lag_max_ms.{mode}", max(lags), "ms", compared=compared),
+        Metric(f"db_turns_per_s.{mode}", turns / elapsed, "rps", higher_is_better=True, compared=compared),
+    ]
+
+
+async def bench_db_loop_lag(workers: int = 16, turns: int = 5, history: int = 10000) -> List[Metric]:
+    """
+    Event-loop lag while `workers` rooms each run `turns` turns of database work,
+    with the sync session ("sync") and the async session ("async").
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        # Writers queue on SQLite's single write lock; wait for it rather than fail
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 60})
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            # Readers don't block the writer (as with PostgreSQL's MVCC)
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+            conn.execute(insert(Room.__table__).values(id=1, name="bench", topic="bench", creator_id=1))
+            conn.execute(insert(Message.__table__), [
+                {"room_id": 1, "session_id": 0, "role": "user", "sender_name": f"Speaker {index % 5}",
+                 "content": f"message number {index} about the topic"}
+                for index in range(history)
+            ])
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"timeout": 60})
+
+        async def sync_room(worker: int):
+            for turn in range(turns):
+                with Session(engine) as db:
+                    db.scalars(_summary_query()).first()
+                    db.scalars(_recent_messages_query()).all()
+                    # The read transaction ends before the write, as with the message writer
+                    db.commit()
+                    db.add(_new_message(worker, turn))
+                    db.commit()
+                await asyncio.sleep(0)
+
+        async def async_room(worker: int):
+            for turn in range(turns):
+                async with AsyncSession(async_engine, expire_on_commit=False) as db:
+                    await aload_room_summary(db, 1, 0)
+                    (await db.scalars(_recent_messages_query())).all()
+                    await db.commit()
+                    db.add(_new_message(worker, turn))
+                    await db.commit()
+                await asyncio.sleep(0)
+
+        metrics = []
+        try:
+            for mode, room in (("sync", sync_room), ("async", async_room)):
+                lags, elapsed = await _loop_lag(lambda: asyncio.gather(*(room(worker) for worker in range(workers))))
+                metrics += _lag_metrics(mode, lags, elapsed, workers * turns)
+        finally:
+            await async_engine.dispose()
+            engine.dispose()
+        return metrics
@@ -0,0 +1,226 @@
+"""
+Local fake server speaking the OpenAI chat completions protocol.
+
+Serves POST /chat/completions and /v1/chat/completions (so base URLs with and
+without /v1 both work), streamed or not, with configurable time to first token,
+inter-chunk delay, output length and injected errors. The server runs on its own
+thread and event loop so it does not compete with the client under test.
+
+It can also be started standalone, e.g. to point a dev backend at it:
+
+    python -m benchmarks.fake_openai --port 8900 --ttft-ms 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeProfile:
+    """Behaviour of the fake server; may be changed while it runs."""
+
+    ttft_ms: float = 0.0
+    chunk_interval_ms: float = 0.0
+    output_tokens: int = 20
+    # Status code -> probability of answering with it (e.g. {429: 0.05, 503: 0.01})
+    error_rates: Dict[int, float] = field(default_factory=dict)
+    seed: int = 0
+
+
+def _completion_id() -> str:
+    return f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+
+def _prompt_tokens(body: Dict[str, Any]) -> int:
+    return sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+
+
+def create_app(profile: FakeProfile) -> FastAPI:
+    """Build the fake API application serving `profile`."""
+    app = FastAPI(title="Fake OpenAI API")
+    rng = random.Random(profile.seed)
+    stats = {"requests": 0, "errors": 0}
+    app.state.stats = stats
+
+    def injected_error() -> Optional[JSONResponse]:
+        roll = rng.random()
+        for status_code, rate in profile.error_rates.items():
+            if roll < rate:
+                stats["errors"] += 1
+                headers = {"Retry-After": "1"} if status_code == 429 else None
+                return JSONResponse(
+                    status_code=status_code,
+                    content={"error": {"message": f"Injected {status_code}", "type": "fake_error"}},
+                    headers=headers
+                )
+            roll -= rate
+        return None
+
+    async def chat_completions(request: Request):
+        stats["requests"] += 1
+        body = await request.json()
+        error = injected_error()
+        if error is not None:
+            return error
+
+        model = body.get("model", "fake-model")
+        max_tokens = body.get("max_tokens") or profile.output_tokens
+        tokens = [f"token{i} " for i in range(min(profile.output_tokens, max_tokens))]
+        finish_reason = "length" if profile.output_tokens > max_tokens else "stop"
+        usage = {
+            "prompt_tokens": _prompt_tokens(body),
+            "completion_tokens": len(tokens),
+            "total_tokens": _prompt_tokens(body) + len(tokens),
+        }
+        completion_id = _completion_id()
+        created = int(time.time())
+
+        if profile.ttft_ms:
+            await asyncio.sleep(profile.ttft_ms / 1000)
+
+        if not body.get("stream"):
+            if profile.chunk_interval_ms:
+                await asyncio.sleep(profile.chunk_interval_ms * len(tokens) / 1000)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": usage,
+            }
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        def event(delta: Dict[str, Any], finish: Optional[str] = None) -> str:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        async def events() -> AsyncIterator[str]:
+            yield event({"role": "assistant", "content": ""})
+            for index, token in enumerate(tokens):
+                if index and profile.chunk_interval_ms:
+                    await asyncio.sleep(profile.chunk_interval_ms / 1000)
+                yield event({"content": token})
+            yield event({}, finish_reason)
+            if include_usage:
+                final = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": usage,
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    app.add_api_route("/chat/completions", chat_completions, methods=["POST"])
+    app.add_api_route("/v1/chat/completions", chat_completions, methods=["POST"])
+    return app
+
+
+class _ThreadServer(uvicorn.Server):
+    def install_signal_handlers(self):
+        # Signal handlers can only be installed from the main thread
+        return None
+
+
+class FakeOpenAIServer:
+    """Runs the fake API on a background thread; usable as a context manager."""
+
+    def __init__(self, profile: Optional[FakeProfile] = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Initialize the server.
+
+        Args:
+            profile: Server behaviour (defaults to instant responses)
+            host: Interface to bind
+            port: Port to bind (0 picks a free port)
+        """
+        self.profile = profile or FakeProfile()
+        self.app = create_app(self.profile)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self.host, self.port = self._socket.getsockname()
+        config = uvicorn.Config(self.app, log_level="warning", access_log=False, lifespan="off", ws="none")
+        self._server = _ThreadServer(config)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return self.app.state.stats
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("Fake OpenAI server failed to start")
+            time.sleep(0.01)
+
+    def stop(self):
+        self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self._socket.close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the fake OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--ttft-ms", type=float, default=0.0)
+    parser.add_argument("--chunk-interval-ms", type=float, default=0.0)
+    parser.add_argument("--output-tokens", type=int, default=20)
+    parser.add_argument("--error-rate-429", type=float, default=0.0)
+    parser.add_argument("--error-rate-503", type=float, default=0.0)
+    args = parser.parse_args()
+
+    profile = FakeProfile(
+        ttft_ms=args.ttft_ms,
+        chunk_interval_ms=args.chunk_interval_ms,
+        output_tokens=args.output_tokens,
+        error_rates={429: args.error_rate_429, 503: args.error_rate_503}
+    )
+    uvicorn.run(create_app(profile), host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
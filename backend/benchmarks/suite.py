@@ -0,0 +1,297 @@
+"""
+Adapter-overhead benchmarks and baseline comparison (see db_lag for the
+database event-loop-lag benchmark, which runs as part of the suite).
+
+Each benchmark returns Metrics; overheads are measured against a minimal raw
+httpx client hitting the same fake server, so the numbers isolate what the
+adapter stack (cache/singleflight checks, limiter, retries, SDK parsing,
+result building) adds per call and per streamed chunk.
+"""
+import asyncio
+import json
+import platform
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.llm_adapter import (
+    BaseLLMAdapter,
+    ChatAnywhereAdapter,
+    DashScopeAdapter,
+    DeepSeekAdapter,
+    OpenAIAdapter
+)
+from app.services.llm_cache import request_fingerprint
+from app.services.llm_result import GenerationOptions
+from benchmarks.fake_openai import FakeOpenAIServer
+
+BENCH_API_KEY = "bench-key"
+ADAPTER_CLASSES = (OpenAIAdapter, DeepSeekAdapter, DashScopeAdapter, ChatAnywhereAdapter)
+
+# Differences below these floors are treated as noise when comparing with the baseline
+NOISE_FLOORS = {"us": 25.0, "ms": 2.0}
+
+
+@dataclass
+class Metric:
+    """One benchmark result."""
+
+    name: str
+    value: float
+    unit: str
+    higher_is_better: bool = False
+    # False for reference measurements (e.g. a legacy code path) kept out of the regression check
+    compared: bool = True
+
+
+def configure_for_benchmarks(base_url: str):
+    """
+    Point the OpenAI-compatible adapters at the fake server and switch off
+    policies that would hide per-call cost (response cache, request coalescing)
+    or cap the concurrency being measured (provider limiter).
+    """
+    settings.openai_base_url = base_url
+    settings.deepseek_base_url = base_url
+    settings.dashscope_base_url = base_url
+    settings.chatanywhere_base_url = base_url
+    settings.llm_cache_enabled = False
+    settings.llm_singleflight_enabled = False
+    settings.llm_max_concurrency = 0
+    settings.llm_rpm_limit = 0
+    settings.llm_tpm_limit = 0
+    settings.llm_provider_limits = {}
+
+
+def make_adapter(adapter_class=OpenAIAdapter) -> BaseLLMAdapter:
+    return adapter_class(temperature=0.7, api_key=BENCH_API_KEY)
+
+
+def sample_context(size: int = 40) -> List[Dict[str, str]]:
+    """A room-like history of `size` short messages."""
+    return [
+        {"role": "user" if index % 3 else "assistant", "content": f"[Speaker {index % 5}]: message number {index} about the topic"}
+        for index in range(size)
+    ]
+
+
+async def _median_us(call: Callable[[int], Awaitable[Any]], iterations: int, warmup: int = 5) -> float:
+    for index in range(warmup):
+        await call(-index - 1)
+    samples = []
+    for index in range(iterations):
+        start = time.perf_counter()
+        await call(index)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+async def _raw_post(client: httpx.AsyncClient, base_url: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    response = await client.post(f"{base_url}/chat/completions", json=body,
+                                 headers={"Authorization": f"Bearer {BENCH_API_KEY}"})
+    response.raise_for_status()
+    return response.json()
+
+
+async def bench_client_overhead(server: FakeOpenAIServer, iterations: int) -> List[Metric]:
+    """Median per-call latency of each adapter minus that of a raw httpx request."""
+    server.profile.ttft_ms = server.profile.chunk_interval_ms = 0.0
+    server.profile.output_tokens = 20
+    messages = sample_context(10)
+    async with httpx.AsyncClient() as client:
+        raw = await _median_us(
+            lambda index: _raw_post(client, server.base_url, {
+                "model": "fake-model",
+                "messages": [{"role": "system", "content": "sys"}] + messages + [{"role": "user", "content": str(index)}],
+            }),
+            iterations
+        )
+    metrics = [Metric("raw_call_us", raw, "us")]
+    for adapter_class in ADAPTER_CLASSES:
+        adapter = make_adapter(adapter_class)
+        median = await _median_us(
+            lambda index: adapter.complete(messages + [{"role": "user", "content": str(index)}], "sys"),
+            iterations
+        )
+        metrics.append(Metric(f"client_overhead_us.{adapter.provider}", max(0.0, median - raw), "us"))
+    return metrics
+
+
+async def bench_serialization(iterations: int) -> List[Metric]:
+    """Cost of preparing one request: fingerprint, token estimate, kwargs and JSON encoding."""
+    adapter = make_adapter()
+    messages = sample_context(40)
+    options = GenerationOptions(max_tokens=200)
+    system_prompt = "You are playing the role of Alice. " * 20
+
+    def prepare():
+        request_fingerprint(adapter.provider, adapter.model_name, adapter.temperature, system_prompt, messages,
+                            max_tokens=200)
+        adapter._estimate_prompt_tokens(messages, system_prompt)
+        kwargs = adapter._request_kwargs([{"role": "system", "content": system_prompt}] + messages, options)
+        json.dumps(kwargs)
+
+    for _ in range(min(iterations, 50)):
+        prepare()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        prepare()
+    per_call = (time.perf_counter() - start) * 1e6 / iterations
+    return [Metric("serialization_us.request", per_call, "us")]
+
+
+async def _raw_stream(client: httpx.AsyncClient, base_url: str, body: Dict[str, Any]) -> int:
+    chunks = 0
+    async with client.stream("POST", f"{base_url}/chat/completions", json=body,
+                             headers={"Authorization": f"Bearer {BENCH_API_KEY}"}) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("data: ") and line != "data: [DONE]":
+                json.loads(line[6:])
+                chunks += 1
+    return chunks
+
+
+async def bench_stream_chunk_overhead(server: FakeOpenAIServer, iterations: int, chunks: int = 200) -> List[Metric]:
+    """Per-chunk cost of adapter streaming beyond reading and decoding the SSE lines."""
+    server.profile.ttft_ms = server.profile.chunk_interval_ms = 0.0
+    server.profile.output_tokens = chunks
+    messages = sample_context(10)
+    async with httpx.AsyncClient() as client:
+        raw = await _median_us(
+            lambda index: _raw_stream(client, server.base_url, {
+                "model": "fake-model",
+                "stream": True,
+                "messages": messages + [{"role": "user", "content": str(index)}],
+            }),
+            iterations
+        )
+
+    adapter = make_adapter()
+
+    async def consume(index: int):
+        stream = adapter.stream(messages + [{"role": "user", "content": str(index)}], "sys")
+        async for _ in stream:
+            pass
+
+    streamed = await _median_us(consume, iterations)
+    return [
+        Metric("stream_raw_us_per_chunk", raw / chunks, "us"),
+        Metric("stream_overhead_us_per_chunk", max(0.0, streamed - raw) / chunks, "us"),
+    ]
+
+
+async def bench_max_concurrency(server: FakeOpenAIServer, levels: List[int], latency_ms: float = 50.0,
+                                calls_per_worker: int = 4, slack: float = 2.0) -> List[Metric]:
+    """
+    Highest concurrency at which p95 latency stays within `slack` x the median
+    latency of sequential calls with no errors, and the throughput at that level.
+    
+    Past that point calls queue on client-side CPU (SDK request building,
+    response parsing) or on the connection pool rather than on the server.
+    """
+    server.profile.ttft_ms = latency_ms
+    server.profile.chunk_interval_ms = 0.0
+    server.profile.output_tokens = 20
+    adapter = make_adapter()
+    messages = sample_context(10)
+    sustained, throughput = 0, 0.0
+    reference = await _median_us(lambda index: adapter.complete(messages + [{"role": "user", "content": f"ref-{index}"}], "sys"),
+                                 iterations=10) / 1000
+
+    for level in levels:
+        latencies: List[float] = []
+        errors = 0
+
+        async def worker(worker_id: int):
+            nonlocal errors
+            for call in range(calls_per_worker):
+                start = time.perf_counter()
+                try:
+                    await adapter.complete(messages + [{"role": "user", "content": f"{level}-{worker_id}-{call}"}], "sys")
+                except Exception:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(worker_id) for worker_id in range(level)))
+        elapsed = time.perf_counter() - start
+        p95 = statistics.quantiles(latencies, n=20, method="inclusive")[-1]
+        if errors or p95 > reference * slack:
+            break
+        sustained, throughput = level, len(latencies) / elapsed
+
+    return [
+        Metric("sequential_call_ms", reference, "ms"),
+        Metric("max_concurrency", float(sustained), "requests", higher_is_better=True),
+        Metric("throughput_rps_at_max_concurrency", throughput, "rps", higher_is_better=True),
+    ]
+
+
+async def run_suite(quick: bool = False) -> Dict[str, Metric]:
+    """Run every benchmark against a fresh fake server."""
+    iterations = 50 if quick else 300
+    levels = [1, 2, 4, 8, 16, 32, 64] if quick else [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+    metrics: List[Metric] = []
+    with FakeOpenAIServer() as server:
+        configure_for_benchmarks(server.base_url)
+        metrics += await bench_client_overhead(server, iterations)
+        metrics += await bench_serialization(iterations * 10)
+        metrics += await bench_stream_chunk_overhead(server, max(10, iterations // 10))
+        metrics += await bench_max_concurrency(server, levels)
+
+    # Imported here: the database benchmark reports its results as Metrics of this module
+    from benchmarks.db_lag import bench_db_loop_lag
+    metrics += await bench_db_loop_lag(workers=8 if quick else 16, turns=3 if quick else 5)
+    return {metric.name: metric for metric in metrics}
+
+
+def compare(results: Dict[str, Metric], baseline: Dict[str, Any], tolerance: float = 0.3) -> List[str]:
+    """
+    Compare results with a stored baseline.
+
+    Args:
+        results: Metrics from this run
+        baseline: Parsed baseline file ({"metrics": {name: metric dict}})
+        tolerance: Allowed relative degradation (0.3 = 30% worse)
+
+    Returns:
+        Human-readable descriptions of the regressions (empty if none)
+    """
+    regressions = []
+    for name, stored in baseline.get("metrics", {}).items():
+        metric = results.get(name)
+        if metric is None or not metric.compared:
+            continue
+        before, after = float(stored["value"]), metric.value
+        if abs(after - before) <= NOISE_FLOORS.get(metric.unit, 0.0):
+            continue
+        if metric.higher_is_better:
+            worse = after < before * (1 - tolerance)
+        else:
+            worse = after > before * (1 + tolerance)
+        if worse:
+            regressions.append(f"{name}: {before:.1f} -> {after:.1f} {metric.unit}")
+    return regressions
+
+
+def baseline_document(results: Dict[str, Metric]) -> Dict[str, Any]:
+    """Serializable baseline for `results`, with the environment it was measured on."""
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+        },
+        "metrics": {name: asdict(metric) for name, metric in sorted(results.items())},
+    }
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return None
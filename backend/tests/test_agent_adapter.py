@@ -0,0 +1,185 @@
+"""
+Unit tests for agent-level fallback chains and hedging.
+"""
+import asyncio
+import pytest
+from unittest.mock import MagicMock, patch
+from app.services.agent_adapter import AgentAdapter, get_agent_adapter
+from app.services.llm_adapter import BaseLLMAdapter, DeepSeekAdapter
+from app.services.llm_result import GenerationOptions, LLMResult
+from app.services.resilience import LLMError
+
+
+class FakeAdapter(BaseLLMAdapter):
+    """Adapter returning canned output after a delay."""
+    
+    def __init__(self, name, delay=0.0, fail=False):
+        super().__init__(model_name=name)
+        self.provider = name
+        self.delay = delay
+        self.fail = fail
+        self.cancelled = False
+        self.calls = 0
+    
+    async def complete(self, messages, system_prompt, cache=None, options=None):
+        self.calls += 1
+        self.cache = cache
+        self.options = options
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise LLMError(f"{self.provider} failed", retryable=True)
+        return LLMResult(content=f"from {self.provider}", provider=self.provider)
+    
+    async def _stream_items(self, messages, system_prompt, cache, options=None):
+        result = await self.complete(messages, system_prompt, cache, options)
+        for word in result.content.split(" "):
+            yield word
+        yield result
+    
+    async def _generate(self, messages, system_prompt, options):
+        raise NotImplementedError
+
+
+@pytest.mark.asyncio
+class TestAgentAdapter:
+    """Tests for AgentAdapter."""
+    
+    async def test_falls_back_in_order(self):
+        """Test that a failing primary falls back to the next target."""
+        primary = FakeAdapter("deepseek", fail=True)
+        backup = FakeAdapter("dashscope")
+        adapter = AgentAdapter([primary, backup])
+        assert await adapter.generate([], "System") == "from dashscope"
+    
+    async def test_raises_when_all_fail(self):
+        """Test that the last error is raised when every target fails."""
+        adapter = AgentAdapter([FakeAdapter("a", fail=True), FakeAdapter("b", fail=True)])
+        with pytest.raises(LLMError, match="b failed"):
+            await adapter.generate([], "System")
+    
+    async def test_hedge_takes_faster_and_cancels_loser(self):
+        """Test that a slow primary is hedged and the loser cancelled."""
+        primary = FakeAdapter("slow", delay=1.0)
+        backup = FakeAdapter("fast", delay=0.0)
+        adapter = AgentAdapter([primary, backup], hedge=True)
+        with patch("app.services.agent_adapter.settings") as mock_settings:
+            mock_settings.llm_hedge_percentile = 95.0
+            mock_settings.llm_hedge_default_delay = 0.01
+            result = await adapter.generate([], "System")
+        assert result == "from fast"
+        assert primary.cancelled is True
+    
+    async def test_hedge_not_fired_when_primary_fast(self):
+        """Test that no hedge is sent when the primary answers in time."""
+        primary = FakeAdapter("fast")
+        backup = FakeAdapter("backup")
+        adapter = AgentAdapter([primary, backup], hedge=True)
+        assert await adapter.generate([], "System") == "from fast"
+        assert backup.calls == 0
+    
+    async def test_stream_fallback(self):
+        """Test that streams fall back before the first chunk."""
+        adapter = AgentAdapter([FakeAdapter("a", fail=True), FakeAdapter("b")])
+        chunks = [c async for c in adapter.generate_stream([], "System")]
+        assert chunks == ["from", "b"]
+
+
+class TestGetAgentAdapter:
+    """Tests for get_agent_adapter."""
+    
+    def test_builds_chain(self):
+        """Test that fallback targets are appended to the primary."""
+        agent = MagicMock()
+        agent.id = 1
+        agent.provider = "deepseek"
+        agent.model_name = "deepseek-chat"
+        agent.temperature = 0.7
+        agent.api_key_config = "test-key"
+        agent.use_proxy = False
+        agent.hedge_enabled = True
+        agent.cache_enabled = None
+        agent.fallback_chain = [{"provider": "ollama", "model_name": "llama3"}]
+        adapter = get_agent_adapter(agent)
+        assert isinstance(adapter, AgentAdapter)
+        assert isinstance(adapter.targets[0], DeepSeekAdapter)
+        assert adapter.hedge is True
+    
+    def test_no_chain_wraps_primary(self):
+        """Test that agents without fallbacks get a single-target adapter carrying their options."""
+        agent = MagicMock()
+        agent.provider = "deepseek"
+        agent.model_name = "deepseek-chat"
+        agent.temperature = 0.7
+        agent.api_key_config = "test-key"
+        agent.use_proxy = False
+        agent.hedge_enabled = False
+        agent.cache_enabled = True
+        agent.fallback_chain = None
+        adapter = get_agent_adapter(agent)
+        assert len(adapter.targets) == 1
+        assert isinstance(adapter.targets[0], DeepSeekAdapter)
+        assert adapter.cache is True
+    
+    def test_generation_options_from_agent(self):
+        """Test that the agent's max_tokens and stop sequences become adapter options."""
+        agent = MagicMock()
+        agent.provider = "deepseek"
+        agent.model_name = "deepseek-chat"
+        agent.temperature = 0.7
+        agent.api_key_config = "test-key"
+        agent.use_proxy = False
+        agent.hedge_enabled = False
+        agent.cache_enabled = None
+        agent.fallback_chain = None
+        agent.max_tokens = 300
+        agent.stop_sequences = ["\n[", ""]
+        adapter = get_agent_adapter(agent)
+        assert adapter.options == GenerationOptions(max_tokens=300, stop=("\n[",))
+
+
+@pytest.mark.asyncio
+class TestAgentCacheOption:
+    """Tests for passing the agent's cache option to its targets."""
+    
+    async def test_agent_cache_option_forwarded(self):
+        """Test that the agent-level cache setting reaches every target."""
+        primary = FakeAdapter("primary", fail=True)
+        backup = FakeAdapter("backup")
+        adapter = AgentAdapter([primary, backup], cache=False)
+        await adapter.generate([], "sys")
+        assert primary.cache is False
+        assert backup.cache is False
+    
+    async def test_call_option_overrides_agent(self):
+        """Test that an explicit per-call cache option wins."""
+        primary = FakeAdapter("primary")
+        adapter = AgentAdapter([primary], cache=False)
+        await adapter.generate([], "sys", cache=True)
+        assert primary.cache is True
+
+
+@pytest.mark.asyncio
+class TestAgentGenerationOptions:
+    """Tests for combining agent and per-call generation options."""
+    
+    async def test_options_merged_and_forwarded(self):
+        """Test that the tighter max_tokens wins and stop sequences are combined."""
+        primary = FakeAdapter("primary", fail=True)
+        backup = FakeAdapter("backup")
+        adapter = AgentAdapter([primary, backup], options=GenerationOptions(max_tokens=300, stop=("END",)))
+        await adapter.complete([], "sys", options=GenerationOptions(max_tokens=200, stop=("\n[", "END")))
+        expected = GenerationOptions(max_tokens=200, stop=("END", "\n["))
+        assert primary.options == expected
+        assert backup.options == expected
+    
+    async def test_stream_forwards_agent_options(self):
+        """Test that streamed calls carry the agent's options."""
+        primary = FakeAdapter("primary")
+        adapter = AgentAdapter([primary], options=GenerationOptions(max_tokens=100))
+        stream = adapter.stream([], "sys")
+        assert [chunk async for chunk in stream] == ["from", "primary"]
+        assert primary.options == GenerationOptions(max_tokens=100)
@@ -0,0 +1,107 @@
+"""
+Unit tests for the benchmark fake server and baseline comparison.
+"""
+import pytest
+from unittest.mock import patch
+from app.services.http_pool import HTTPClientPool
+from app.services.llm_adapter import OpenAIAdapter
+from app.services.llm_result import GenerationOptions
+from app.services.resilience import LLMError
+from benchmarks.db_lag import bench_db_loop_lag
+from benchmarks.fake_openai import FakeOpenAIServer, FakeProfile
+from benchmarks.suite import Metric, compare
+
+
+@pytest.fixture(scope="module")
+def server():
+    with FakeOpenAIServer(FakeProfile(output_tokens=5)) as fake:
+        yield fake
+
+
+@pytest.mark.asyncio
+class TestFakeOpenAIServer:
+    """Tests for the fake OpenAI-compatible server."""
+
+    @pytest.fixture(autouse=True)
+    def fresh_pool(self):
+        # Pooled clients are bound to the event loop of the test that created them
+        with patch("app.services.llm_adapter.http_pool", HTTPClientPool()) as pool:
+            yield pool
+
+    async def test_complete_with_usage(self, server):
+        """Test that the adapter parses a non-streamed completion and its usage."""
+        with patch("app.services.llm_adapter.settings.openai_base_url", server.base_url):
+            adapter = OpenAIAdapter(api_key="bench-key")
+        result = await adapter._generate([{"role": "user", "content": "hello there"}], "sys", GenerationOptions())
+        assert result.content == "token0 token1 token2 token3 token4"
+        assert result.completion_tokens == 5
+        assert result.finish_reason == "stop"
+
+    async def test_stream_with_usage(self, server):
+        """Test that streamed chunks and the final usage chunk come through."""
+        with patch("app.services.llm_adapter.settings.openai_base_url", server.base_url):
+            adapter = OpenAIAdapter(api_key="bench-key")
+        items = [item async for item in adapter._generate_stream([{"role": "user", "content": "hi"}], "sys", GenerationOptions())]
+        assert "".join(item for item in items if isinstance(item, str)) == "token0 token1 token2 token3 token4 "
+        assert items[-1].completion_tokens == 5
+
+    async def test_injected_error_is_classified(self, server):
+        """Test that injected 429s surface as retryable LLMErrors."""
+        server.profile.error_rates = {429: 1.0}
+        try:
+            with patch("app.services.llm_adapter.settings.openai_base_url", server.base_url):
+                adapter = OpenAIAdapter(api_key="bench-key")
+            with pytest.raises(LLMError) as exc_info:
+                await adapter._generate([{"role": "user", "content": "hi"}], "sys", GenerationOptions())
+            assert exc_info.value.retryable is True
+            assert exc_info.value.status_code == 429
+        finally:
+            server.profile.error_rates = {}
+
+
+class TestCompare:
+    """Tests for baseline comparison."""
+
+    def test_flags_regressions_beyond_tolerance(self):
+        """Test that only degradations beyond tolerance and noise are reported."""
+        baseline = {"metrics": {
+            "client_overhead_us.openai": {"value": 1000.0},
+            "serialization_us.request": {"value": 100.0},
+            "max_concurrency": {"value": 64.0},
+        }}
+        results = {
+            "client_overhead_us.openai": Metric("client_overhead_us.openai", 1500.0, "us"),
+            "serialization_us.request": Metric("serialization_us.request", 120.0, "us"),
+            "max_concurrency": Metric("max_concurrency", 16.0, "requests", higher_is_better=True),
+        }
+        regressions = compare(results, baseline, tolerance=0.3)
+        assert len(regressions) == 2
+        assert regressions[0].startswith("client_overhead_us.openai")
+        assert regressions[1].startswith("max_concurrency")
+
+    def test_improvements_pass(self):
+        """Test that faster results are not regressions."""
+        baseline = {"metrics": {"client_overhead_us.openai": {"value": 1000.0}}}
+        results = {"client_overhead_us.openai": Metric("client_overhead_us.openai", 200.0, "us")}
+        assert compare(results, baseline) == []
+
+    def test_reference_metrics_not_compared(self):
+        """Test that reference-only metrics never count as regressions."""
+        baseline = {"metrics": {"db_turns_per_s.sync": {"value": 54.6}}}
+        results = {"db_turns_per_s.sync": Metric("db_turns_per_s.sync", 36.5, "rps", higher_is_better=True, compared=False)}
+        assert compare(results, baseline) == []
+
+
+@pytest.mark.asyncio
+class TestDbLoopLag:
+    """Tests for the database event-loop-lag benchmark."""
+
+    async def test_reports_both_sessions(self):
+        """Test that lag and throughput are reported for the sync and the async session."""
+        metrics = {metric.name: metric for metric in await bench_db_loop_lag(workers=2, turns=2, history=100)}
+        for mode in ("sync", "async"):
+            assert metrics[f"db_loop_lag_p99_ms.{mode}"].value >= 0
+            assert metrics[f"db_loop_lag_max_ms.{mode}"].value >= metrics[f"db_loop_lag_p99_ms.{mode}"].value
+            assert metrics[f"db_turns_per_s.{mode}"].value > 0
+        assert not metrics["db_turns_per_s.sync"].compared
+        assert metrics["db_turns_per_s.async"].compared
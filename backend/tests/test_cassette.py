@@ -0,0 +1,174 @@
+"""
+Unit tests for LLM traffic record/replay cassettes.
+"""
+import asyncio
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from app.services.cassette import Cassette, CassetteAdapter
+from app.services.llm_adapter import AdapterRegistry, BaseLLMAdapter, get_llm_adapter
+from app.services.llm_result import GenerationOptions, LLMResult
+from app.services.resilience import LLMError
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+class ScriptedAdapter(BaseLLMAdapter):
+    """Adapter answering with fixed chunks and counting provider calls."""
+
+    provider = "scripted"
+
+    def __init__(self, chunks=("Hi", " there"), delay=0.0, error=None):
+        super().__init__(model_name="scripted-model", temperature=0.7)
+        self.chunks = chunks
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def _generate(self, messages, system_prompt, options):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return LLMResult(content="".join(self.chunks), completion_tokens=len(self.chunks), finish_reason="stop")
+
+    async def _generate_stream(self, messages, system_prompt, options):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        for chunk in self.chunks:
+            await asyncio.sleep(self.delay)
+            yield chunk
+        yield LLMResult(completion_tokens=len(self.chunks), finish_reason="stop")
+
+
+def recorder(path, inner):
+    return CassetteAdapter(inner.provider, inner.model_name, inner.temperature, Cassette(path), inner=inner)
+
+
+def player(path, realtime=False):
+    return CassetteAdapter("scripted", "scripted-model", 0.7, Cassette(path), realtime=realtime)
+
+
+@pytest.mark.asyncio
+class TestCassetteAdapter:
+    """Tests for CassetteAdapter."""
+
+    async def test_record_then_replay(self, tmp_path):
+        """Test that a recorded completion is replayed from a reloaded cassette."""
+        path = str(tmp_path / "llm.jsonl")
+        inner = ScriptedAdapter()
+        recorded = await recorder(path, inner).complete(MESSAGES, "sys", cache=False)
+
+        replayed = await player(path).complete(MESSAGES, "sys", cache=False)
+        assert replayed.content == recorded.content == "Hi there"
+        assert replayed.completion_tokens == 2
+        assert replayed.finish_reason == "stop"
+        assert replayed.provider == "scripted"
+        assert inner.calls == 1
+
+    async def test_recorded_off_event_loop(self, tmp_path):
+        """Test that recorded calls are written to the file from a worker thread."""
+        path = str(tmp_path / "llm.jsonl")
+        cassette = Cassette(path)
+        threads = []
+        append = cassette._append
+        cassette._append = lambda line: threads.append(threading.current_thread()) or append(line)
+        adapter = CassetteAdapter("scripted", "scripted-model", 0.7, cassette, inner=ScriptedAdapter())
+        await adapter.complete(MESSAGES, "sys", cache=False)
+
+        assert threads and threads[0] is not threading.current_thread()
+        assert len(Cassette(path)) == 1
+
+    async def test_stream_replays_chunks_and_timing(self, tmp_path):
+        """Test that streamed chunks come back in order with their recorded delays."""
+        path = str(tmp_path / "llm.jsonl")
+        options = GenerationOptions(max_tokens=50)
+        async for _ in recorder(path, ScriptedAdapter(delay=0.05)).stream(MESSAGES, "sys", cache=False, options=options):
+            pass
+
+        start = time.perf_counter()
+        chunks = [chunk async for chunk in player(path, realtime=True).generate_stream(MESSAGES, "sys", cache=False, options=options)]
+        realtime = time.perf_counter() - start
+        assert chunks == ["Hi", " there"]
+        assert realtime >= 0.09
+
+        start = time.perf_counter()
+        chunks = [chunk async for chunk in player(path).generate_stream(MESSAGES, "sys", cache=False, options=options)]
+        assert chunks == ["Hi", " there"]
+        assert time.perf_counter() - start < realtime / 2
+
+    async def test_abandoned_stream_not_recorded(self, tmp_path):
+        """Test that a stream closed before its end leaves no entry."""
+        path = str(tmp_path / "llm.jsonl")
+        cassette = Cassette(path)
+        adapter = CassetteAdapter("scripted", "scripted-model", 0.7, cassette, inner=ScriptedAdapter())
+        stream = adapter._generate_stream(MESSAGES, "sys", GenerationOptions())
+        assert await stream.__anext__() == "Hi"
+        await stream.aclose()
+        assert len(cassette) == 0
+
+    async def test_miss_raises_without_retry(self, tmp_path):
+        """Test that an unrecorded request fails fast instead of reaching a provider."""
+        with pytest.raises(LLMError) as exc_info:
+            await player(str(tmp_path / "empty.jsonl")).complete(MESSAGES, "sys", cache=False)
+        assert exc_info.value.retryable is False
+        assert "No cassette entry" in str(exc_info.value)
+
+    async def test_recorded_error_is_replayed(self, tmp_path):
+        """Test that provider errors are recorded with their classification."""
+        path = str(tmp_path / "llm.jsonl")
+        error = LLMError("Bad request", provider="scripted", status_code=400)
+        with pytest.raises(LLMError):
+            await recorder(path, ScriptedAdapter(error=error)).complete(MESSAGES, "sys", cache=False)
+
+        with pytest.raises(LLMError) as exc_info:
+            await player(path).complete(MESSAGES, "sys", cache=False)
+        assert exc_info.value.status_code == 400
+        assert str(exc_info.value) == "Bad request"
+
+    async def test_repeated_requests_replay_in_order(self, tmp_path):
+        """Test that identical requests get the recorded answers in recording order."""
+        path = str(tmp_path / "llm.jsonl")
+        await recorder(path, ScriptedAdapter(chunks=("first",))).complete(MESSAGES, "sys", cache=False)
+        await recorder(path, ScriptedAdapter(chunks=("second",))).complete(MESSAGES, "sys", cache=False)
+
+        adapter = player(path)
+        answers = [(await adapter.complete(MESSAGES, "sys", cache=False)).content for _ in range(3)]
+        assert answers == ["first", "second", "first"]
+
+
+class TestCassetteMode:
+    """Tests for the cassette setting in get_llm_adapter."""
+
+    def test_replay_needs_no_provider_adapter(self, tmp_path):
+        """Test that replay mode hands out cassette adapters without building provider clients."""
+        with patch("app.services.llm_adapter.settings.llm_cassette_mode", "replay"), \
+             patch("app.services.cassette.settings.llm_cassette_path", str(tmp_path / "llm.jsonl")), \
+             patch("app.services.llm_adapter.adapter_registry", AdapterRegistry()), \
+             patch("app.services.llm_adapter.OpenAIAdapter", side_effect=AssertionError("provider adapter built")):
+            adapter = get_llm_adapter("OpenAI", "gpt-4")
+        assert isinstance(adapter, CassetteAdapter)
+        assert adapter.inner is None
+        assert adapter.provider == "openai"
+
+    def test_record_wraps_provider_adapter(self, tmp_path):
+        """Test that record mode wraps the real provider adapter."""
+        with patch("app.services.llm_adapter.settings.llm_cassette_mode", "record"), \
+             patch("app.services.cassette.settings.llm_cassette_path", str(tmp_path / "llm.jsonl")), \
+             patch("app.services.llm_adapter.adapter_registry", AdapterRegistry()):
+            adapter = get_llm_adapter("mock", "default")
+        assert isinstance(adapter, CassetteAdapter)
+        assert adapter.inner.provider == "mock"
+
+    @pytest.mark.asyncio
+    async def test_record_keeps_api_keys_apart(self, tmp_path):
+        """Test that record-mode adapters with different API keys get their own limiter and flight key."""
+        with patch("app.services.llm_adapter.settings.llm_cassette_mode", "record"), \
+             patch("app.services.cassette.settings.llm_cassette_path", str(tmp_path / "llm.jsonl")), \
+             patch("app.services.llm_adapter.adapter_registry", AdapterRegistry()):
+            first = get_llm_adapter("mock", "default", api_key="key-A")
+            second = get_llm_adapter("mock", "default", api_key="key-B")
+        assert (first.api_key, second.api_key) == ("key-A", "key-B")
+        assert first._get_limiter() is not second._get_limiter()
+        assert first._flight_key("request") != second._flight_key("request")
@@ -0,0 +1,140 @@
+"""
+Unit tests for token-aware context building.
+"""
+import asyncio
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+from app.services.context_builder import (
+    MESSAGE_OVERHEAD_TOKENS, TokenCounter, agent_token_budget, fit_to_budget
+)
+from app.services.rate_limit import estimate_tokens
+
+
+class TestTokenCounter:
+    """Tests for TokenCounter."""
+    
+    def test_estimator_for_non_openai_providers(self):
+        """Test that providers without a known tokenizer use the estimator."""
+        counter = TokenCounter()
+        assert counter.count("deepseek", "deepseek-chat", "hello world!") == estimate_tokens("hello world!")
+        assert counter.stats()["tokenizers"] == {"deepseek/deepseek-chat": "estimate"}
+    
+    def test_counts_cached_per_text(self):
+        """Test that a message is only counted once."""
+        counter = TokenCounter()
+        with patch("app.services.context_builder.estimate_tokens", return_value=7) as estimate:
+            assert counter.count("ollama", "llama3", "same text") == 7
+            assert counter.count("ollama", "llama3", "same text") == 7
+        assert estimate.call_count == 1
+        assert counter.stats()["hits"] == 1
+    
+    def test_cache_bounded(self):
+        """Test that the count cache evicts the oldest entries."""
+        counter = TokenCounter(max_entries=2)
+        for text in ["a", "b", "c"]:
+            counter.count("ollama", "llama3", text)
+        assert counter.stats()["cached_counts"] == 2
+    
+    def test_tokenizer_used_when_available(self):
+        """Test that OpenAI models are counted with their tokenizer."""
+        encoding = MagicMock()
+        encoding.name = "fake_base"
+        encoding.encode.return_value = [1, 2, 3]
+        tiktoken = MagicMock()
+        tiktoken.encoding_for_model.return_value = encoding
+        counter = TokenCounter()
+        with patch.dict("sys.modules", {"tiktoken": tiktoken}):
+            assert counter.count("openai", "gpt-4o", "anything") == 3
+    
+    def test_tokenizer_failure_falls_back(self):
+        """Test that an unavailable tokenizer falls back to the estimator once."""
+        tiktoken = MagicMock()
+        tiktoken.encoding_for_model.side_effect = OSError("offline")
+        counter = TokenCounter()
+        with patch.dict("sys.modules", {"tiktoken": tiktoken}):
+            assert counter.count("openai", "gpt-4o", "hello") == estimate_tokens("hello")
+            counter.count("openai", "gpt-4o", "again")
+        assert tiktoken.encoding_for_model.call_count == 1
+
+
+@pytest.mark.asyncio
+class TestTokenizerLoading:
+    """Tests for loading tokenizers off the event loop."""
+    
+    @staticmethod
+    def fake_tiktoken(threads):
+        encoding = MagicMock()
+        encoding.name = "fake_base"
+        encoding.encode.return_value = [1, 2, 3]
+        tiktoken = MagicMock()
+        tiktoken.encoding_for_model.side_effect = lambda model: threads.append(threading.current_thread()) or encoding
+        return tiktoken
+    
+    async def test_estimates_until_loaded_in_thread(self):
+        """Test that a model first seen on the event loop is estimated while its tokenizer loads in a thread."""
+        threads = []
+        counter = TokenCounter()
+        with patch.dict("sys.modules", {"tiktoken": self.fake_tiktoken(threads)}):
+            assert counter.count("openai", "gpt-4o", "hello") == estimate_tokens("hello")
+            await asyncio.gather(*counter._loading.values())
+            assert counter.count("openai", "gpt-4o", "hello") == 3
+        assert threads and threads[0] is not threading.main_thread()
+    
+    async def test_warm_up(self):
+        """Test that warm_up loads the tokenizers of the given models before they are used."""
+        threads = []
+        counter = TokenCounter()
+        with patch.dict("sys.modules", {"tiktoken": self.fake_tiktoken(threads)}):
+            await counter.warm_up([("OpenAI", "gpt-4o"), ("deepseek", "deepseek-chat")])
+            assert counter.count("openai", "gpt-4o", "hello") == 3
+        assert counter.stats()["tokenizers"] == {"openai/gpt-4o": "fake_base"}
+
+
+class TestFitToBudget:
+    """Tests for fit_to_budget."""
+    
+    def _messages(self, *contents):
+        return [{"role": "user", "content": content} for content in contents]
+    
+    def test_keeps_newest_messages(self):
+        """Test that the oldest messages are dropped first."""
+        messages = self._messages("a" * 40, "b" * 40, "c" * 40)
+        per_message = estimate_tokens("a" * 40) + MESSAGE_OVERHEAD_TOKENS
+        kept = fit_to_budget(messages, per_message * 2, "ollama", "llama3")
+        assert [m["content"][0] for m in kept] == ["b", "c"]
+    
+    def test_system_prompt_charged(self):
+        """Test that the system prompt consumes budget."""
+        messages = self._messages("a" * 40, "b" * 40)
+        per_message = estimate_tokens("a" * 40) + MESSAGE_OVERHEAD_TOKENS
+        kept = fit_to_budget(messages, per_message * 2, "ollama", "llama3", system_prompt="s" * 40)
+        assert [m["content"][0] for m in kept] == ["b"]
+    
+    def test_newest_always_kept(self):
+        """Test that an oversized latest message is still sent."""
+        messages = self._messages("short", "x" * 4000)
+        kept = fit_to_budget(messages, 10, "ollama", "llama3")
+        assert kept == [messages[-1]]
+    
+    def test_short_messages_use_whole_budget(self):
+        """Test that many short messages all fit in a large budget."""
+        messages = self._messages(*["hi"] * 50)
+        assert len(fit_to_budget(messages, 4000, "ollama", "llama3")) == 50
+
+
+class TestAgentTokenBudget:
+    """Tests for agent_token_budget."""
+    
+    def test_agent_override(self):
+        """Test that an agent's own budget wins."""
+        agent = MagicMock()
+        agent.context_token_budget = 1234
+        assert agent_token_budget(agent) == 1234
+    
+    def test_default(self):
+        """Test that agents without a budget use the configured default."""
+        agent = MagicMock()
+        agent.context_token_budget = None
+        with patch("app.services.context_builder.settings.context_token_budget", 999):
+            assert agent_token_budget(agent) == 999
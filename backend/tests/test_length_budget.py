@@ -0,0 +1,144 @@
+"""
+Unit tests for room mode output limits and early stopping.
+"""
+import asyncio
+import pytest
+from unittest.mock import patch
+from app.services.length_budget import LengthBudget, complete_within_budget, room_mode_limits
+from app.services.llm_adapter import BaseLLMAdapter
+from app.services.llm_result import GenerationOptions, LLMResult
+
+
+class ChattyAdapter(BaseLLMAdapter):
+    """Adapter streaming a long answer word by word."""
+
+    provider = "chatty"
+
+    def __init__(self, words):
+        super().__init__(model_name="chatty-model", temperature=0.7)
+        self.words = words
+        self.sent = 0
+        self.closed = False
+        self.options = None
+
+    async def _generate(self, messages, system_prompt, options):
+        return " ".join(self.words)
+
+    async def _generate_stream(self, messages, system_prompt, options):
+        self.options = options
+        try:
+            for index, word in enumerate(self.words):
+                await asyncio.sleep(0)
+                self.sent += 1
+                yield word if index == 0 else f" {word}"
+            yield LLMResult(completion_tokens=len(self.words), finish_reason="stop")
+        finally:
+            self.closed = True
+
+
+class TestGenerationOptions:
+    """Tests for GenerationOptions.merge."""
+
+    def test_smaller_cap_wins(self):
+        """Test that the tighter max_tokens is kept and unset caps are ignored."""
+        assert GenerationOptions(max_tokens=300).merge(GenerationOptions(max_tokens=200)).max_tokens == 200
+        assert GenerationOptions().merge(GenerationOptions(max_tokens=200)).max_tokens == 200
+        assert GenerationOptions().merge(None) == GenerationOptions()
+
+    def test_stop_sequences_combined_in_order(self):
+        """Test that stop sequences are united without duplicates."""
+        merged = GenerationOptions(stop=("a", "b")).merge(GenerationOptions(stop=("b", "c")))
+        assert merged.stop == ("a", "b", "c")
+
+
+class TestLengthBudget:
+    """Tests for LengthBudget."""
+
+    def test_word_budget(self):
+        """Test that the cut happens once the word after the limit starts."""
+        budget = LengthBudget(max_words=3)
+        assert budget.cut("one two thr") is None
+        text = "one two three fo"
+        assert text[:budget.cut(text)].rstrip() == "one two three"
+
+    def test_cjk_characters_count_as_words(self):
+        """Test that each CJK character counts as one word."""
+        budget = LengthBudget(max_words=4)
+        text = "我觉得这个主意不错"
+        assert text[:budget.cut(text)] == "我觉得这"
+
+    def test_sentence_budget(self):
+        """Test that sentences end at terminators followed by whitespace or CJK punctuation."""
+        budget = LengthBudget(max_sentences=2)
+        assert budget.cut("Pi is 3.14. Right") is None
+        text = "Pi is 3.14. Right! And more"
+        assert text[:budget.cut(text)] == "Pi is 3.14. Right!"
+        assert LengthBudget(max_sentences=1).cut("好的。然后") == 3
+
+    def test_disabled_without_limits(self):
+        """Test that a budget without limits never cuts."""
+        budget = LengthBudget()
+        assert budget.enabled is False
+        assert budget.cut("a " * 1000) is None
+
+
+class TestRoomModeLimits:
+    """Tests for room_mode_limits."""
+
+    def test_reads_mode_settings(self):
+        """Test that room mode settings become options and a budget."""
+        config = {"group_chat": {"max_tokens": 120, "stop": ["\n["], "max_words": 30}}
+        with patch("app.services.length_budget.settings.room_mode_generation", config):
+            options, budget = room_mode_limits("group_chat")
+            assert options == GenerationOptions(max_tokens=120, stop=("\n[",))
+            assert budget.max_words == 30
+            options, budget = room_mode_limits("debate")
+            assert options == GenerationOptions()
+            assert budget.enabled is False
+
+
+@pytest.mark.asyncio
+class TestCompleteWithinBudget:
+    """Tests for complete_within_budget."""
+
+    async def test_stops_upstream_at_budget(self):
+        """Test that the stream is closed as soon as the budget is reached."""
+        adapter = ChattyAdapter([f"w{i}" for i in range(50)])
+        options = GenerationOptions(max_tokens=40)
+        result = await complete_within_budget(adapter, [], "sys", LengthBudget(max_words=5), options)
+
+        assert result.content == "w0 w1 w2 w3 w4"
+        assert result.finish_reason == "length_budget"
+        assert result.provider == "chatty"
+        assert result.latency_ms is not None
+        # Cancellation reaches the upstream generator on the next loop iterations
+        await asyncio.sleep(0.01)
+        assert adapter.closed is True
+        assert adapter.sent < 50
+        assert adapter.options == options
+
+    async def test_short_answer_keeps_provider_result(self):
+        """Test that an answer within budget keeps the provider-reported usage."""
+        adapter = ChattyAdapter(["short", "answer"])
+        result = await complete_within_budget(adapter, [], "sys", LengthBudget(max_words=5))
+
+        assert result.content == "short answer"
+        assert result.finish_reason == "stop"
+        assert result.completion_tokens == 2
+    
+    async def test_streams_text_within_budget(self):
+        """Test that on_text receives the streamed text, never past the budget."""
+        adapter = ChattyAdapter([f"w{i}" for i in range(10)])
+        pieces = []
+        
+        async def on_text(text):
+            pieces.append(text)
+        
+        result = await complete_within_budget(adapter, [], "sys", LengthBudget(max_words=3), on_text=on_text)
+        assert result.content == "w0 w1 w2"
+        assert pieces[0] == "w0"
+        assert "".join(pieces) == "w0 w1 w2"
+        
+        pieces.clear()
+        result = await complete_within_budget(ChattyAdapter(["a", "b"]), [], "sys", LengthBudget(), on_text=on_text)
+        assert "".join(pieces) == result.content == "a b"
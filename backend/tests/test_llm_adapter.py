@@ -1,15 +1,22 @@
 """
 Unit tests for LLM adapters.
 """
+import asyncio
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
+from app.services.http_pool import HTTPClientPool
 from app.services.llm_adapter import (
     BaseLLMAdapter,
     OpenAIAdapter,
     DeepSeekAdapter,
     OllamaAdapter,
+    GoogleAdapter,
+    MockAdapter,
+    AdapterRegistry,
     get_llm_adapter
 )
+from app.services.llm_result import GenerationOptions
+from app.services.resilience import LLMError
 
 
 class TestBaseLLMAdapter:
@@ -58,6 +65,23 @@ class TestOpenAIAdapter:
             assert call_args.kwargs['model'] == "gpt-3.5-turbo"
             assert call_args.kwargs['temperature'] == 0.7
             assert len(call_args.kwargs['messages']) == 2  # system + user
+            assert call_args.kwargs['max_tokens'] == 1000
+            assert 'stop' not in call_args.kwargs
+    
+    async def test_generate_passes_generation_options(self):
+        """Test that max_tokens and stop sequences reach the API call."""
+        adapter = OpenAIAdapter(model_name="gpt-3.5-turbo", api_key="test-key")
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "Short."
+        
+        with patch.object(adapter.client.chat.completions, 'create', new_callable=AsyncMock) as mock_create:
+            mock_create.return_value = mock_response
+            options = GenerationOptions(max_tokens=50, stop=("\n[", "END"))
+            await adapter.generate([{"role": "user", "content": "Hello"}], "System", options=options)
+            
+            assert mock_create.call_args.kwargs['max_tokens'] == 50
+            assert mock_create.call_args.kwargs['stop'] == ["\n[", "END"]
     
     async def test_generate_empty_response(self):
         """Test handling of empty response."""
@@ -91,6 +115,40 @@ class TestOpenAIAdapter:
                 await adapter.generate(messages, system_prompt)
 
 
+    async def test_generate_stream_yields_deltas(self):
+        """Test that streaming yields each delta as it arrives."""
+        adapter = OpenAIAdapter(model_name="gpt-3.5-turbo", api_key="test-key")
+        
+        def make_chunk(text):
+            chunk = MagicMock()
+            chunk.choices = [MagicMock()]
+            chunk.choices[0].delta.content = text
+            return chunk
+        
+        async def fake_stream():
+            for text in ["Hel", "lo", None, "!"]:
+                yield make_chunk(text)
+        
+        with patch.object(adapter.client.chat.completions, 'create', new_callable=AsyncMock) as mock_create:
+            mock_create.return_value = fake_stream()
+            
+            chunks = [c async for c in adapter.generate_stream([{"role": "user", "content": "Hi"}], "System")]
+            
+            assert chunks == ["Hel", "lo", "!"]
+            assert mock_create.call_args.kwargs['stream'] is True
+    
+    async def test_generate_stream_error(self):
+        """Test that stream errors are raised rather than yielded as text."""
+        adapter = OpenAIAdapter(model_name="gpt-3.5-turbo", api_key="test-key")
+        
+        with patch.object(adapter.client.chat.completions, 'create', new_callable=AsyncMock) as mock_create:
+            mock_create.side_effect = Exception("API Error")
+            
+            with pytest.raises(Exception, match="Failed to stream response from OpenAI"):
+                async for _ in adapter.generate_stream([{"role": "user", "content": "Hi"}], "System"):
+                    pass
+
+
 @pytest.mark.asyncio
 class TestDeepSeekAdapter:
     """Tests for DeepSeekAdapter."""
@@ -129,12 +187,8 @@ class TestOllamaAdapter:
             "message": {"content": "Ollama response"}
         }
         
-        with patch('httpx.AsyncClient') as mock_client_class:
-            mock_client = AsyncMock()
-            mock_client.__aenter__.return_value = mock_client
-            mock_client.__aexit__.return_value = None
-            mock_client.post = AsyncMock(return_value=mock_response)
-            mock_client_class.return_value = mock_client
+        with patch.object(adapter.client, 'post', new_callable=AsyncMock) as mock_post:
+            mock_post.return_value = mock_response
             
             messages = [{"role": "user", "content": "Test"}]
             system_prompt = "You are Ollama."
@@ -142,6 +196,23 @@ class TestOllamaAdapter:
             result = await adapter.generate(messages, system_prompt)
             
             assert result == "Ollama response"
+            assert "keep_alive" in mock_post.call_args.kwargs['json']
+            assert mock_post.call_args.kwargs['json']['options']['num_predict'] == 1000
+    
+    async def test_generate_passes_generation_options(self):
+        """Test that max_tokens and stop sequences map to Ollama options."""
+        adapter = OllamaAdapter(model_name="llama3")
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"message": {"content": "Short"}}
+        
+        with patch.object(adapter.client, 'post', new_callable=AsyncMock) as mock_post:
+            mock_post.return_value = mock_response
+            options = GenerationOptions(max_tokens=64, stop=("END",))
+            await adapter.generate([{"role": "user", "content": "Test"}], "System", options=options)
+            
+            model_options = mock_post.call_args.kwargs['json']['options']
+            assert model_options['num_predict'] == 64
+            assert model_options['stop'] == ["END"]
     
     async def test_generate_empty_response(self):
         """Test handling of empty response from Ollama."""
@@ -151,12 +222,8 @@ class TestOllamaAdapter:
         mock_response = MagicMock()
         mock_response.json.return_value = {"message": {}}
         
-        with patch('httpx.AsyncClient') as mock_client_class:
-            mock_client = AsyncMock()
-            mock_client.__aenter__.return_value = mock_client
-            mock_client.__aexit__.return_value = None
-            mock_client.post = AsyncMock(return_value=mock_response)
-            mock_client_class.return_value = mock_client
+        with patch.object(adapter.client, 'post', new_callable=AsyncMock) as mock_post:
+            mock_post.return_value = mock_response
             
             messages = [{"role": "user", "content": "Test"}]
             system_prompt = "You are Ollama."
@@ -165,6 +232,117 @@ class TestOllamaAdapter:
                 await adapter.generate(messages, system_prompt)
 
 
+@pytest.mark.asyncio
+class TestOllamaStreaming:
+    """Tests for Ollama streaming and warm-up."""
+    
+    async def test_generate_stream_ndjson(self):
+        """Test that NDJSON lines are yielded as content deltas."""
+        adapter = OllamaAdapter(model_name="llama3")
+        lines = [
+            '{"message": {"content": "Hel"}, "done": false}',
+            '',
+            '{"message": {"content": "lo"}, "done": false}',
+            '{"message": {"content": ""}, "done": true}',
+        ]
+        
+        async def aiter_lines():
+            for line in lines:
+                yield line
+        
+        mock_response = MagicMock()
+        mock_response.aiter_lines = aiter_lines
+        stream_ctx = MagicMock()
+        stream_ctx.__aenter__ = AsyncMock(return_value=mock_response)
+        stream_ctx.__aexit__ = AsyncMock(return_value=None)
+        
+        with patch.object(adapter.client, 'stream', MagicMock(return_value=stream_ctx)) as mock_stream:
+            chunks = [c async for c in adapter.generate_stream([{"role": "user", "content": "Hi"}], "System")]
+            
+            assert chunks == ["Hel", "lo"]
+            assert mock_stream.call_args.kwargs['json']['stream'] is True
+
+
+    async def test_warm_up_loads_model(self):
+        """Test that warm-up sends an empty chat with keep_alive."""
+        adapter = OllamaAdapter(model_name="llama3")
+        
+        with patch.object(adapter.client, 'post', new_callable=AsyncMock) as mock_post:
+            mock_post.return_value = MagicMock()
+            await adapter.warm_up()
+            
+            payload = mock_post.call_args.kwargs['json']
+            assert payload['messages'] == []
+            assert payload['model'] == "llama3"
+            assert "keep_alive" in payload
+    
+    async def test_shares_pooled_client(self):
+        """Test that Ollama adapters reuse one long-lived client."""
+        adapter1 = OllamaAdapter(model_name="llama3")
+        adapter2 = OllamaAdapter(model_name="mistral")
+        assert adapter1.client is adapter2.client
+
+
+@pytest.mark.asyncio
+class TestGoogleAdapter:
+    """Tests for GoogleAdapter."""
+    
+    async def test_generate_uses_async_client_and_structured_contents(self):
+        """Test that generation awaits the async client with system_instruction."""
+        adapter = GoogleAdapter(model_name="gemini-2.0-flash", api_key="test-key")
+        mock_response = MagicMock()
+        mock_response.text = "Gemini response "
+        
+        with patch.object(adapter.client.aio.models, 'generate_content', new_callable=AsyncMock) as mock_generate:
+            mock_generate.return_value = mock_response
+            
+            messages = [
+                {"role": "user", "content": "Hi"},
+                {"role": "user", "content": "[Bob]: Hello"},
+                {"role": "assistant", "content": "Hey"},
+            ]
+            result = await adapter.generate(messages, "You are Gemini.")
+            
+            assert result == "Gemini response"
+            kwargs = mock_generate.call_args.kwargs
+            assert kwargs['config'].system_instruction == "You are Gemini."
+            assert [c.role for c in kwargs['contents']] == ["user", "model"]
+            assert len(kwargs['contents'][0].parts) == 2
+            assert kwargs['config'].max_output_tokens == 1000
+    
+    async def test_generate_passes_generation_options(self):
+        """Test that max_tokens and stop sequences go into the generation config."""
+        adapter = GoogleAdapter(model_name="gemini-2.0-flash", api_key="test-key")
+        mock_response = MagicMock()
+        mock_response.text = "Short"
+        
+        with patch.object(adapter.client.aio.models, 'generate_content', new_callable=AsyncMock) as mock_generate:
+            mock_generate.return_value = mock_response
+            options = GenerationOptions(max_tokens=80, stop=("END",))
+            await adapter.generate([{"role": "user", "content": "Hi"}], "System", options=options)
+            
+            config = mock_generate.call_args.kwargs['config']
+            assert config.max_output_tokens == 80
+            assert config.stop_sequences == ["END"]
+    
+    async def test_generate_stream(self):
+        """Test that streamed chunks are yielded incrementally."""
+        adapter = GoogleAdapter(model_name="gemini-2.0-flash", api_key="test-key")
+        
+        async def fake_stream():
+            for text in ["Gem", "", "ini"]:
+                chunk = MagicMock()
+                chunk.text = text
+                yield chunk
+        
+        with patch.object(adapter.client.aio.models, 'generate_content_stream', new_callable=AsyncMock) as mock_stream:
+            mock_stream.return_value = fake_stream()
+            
+            chunks = [c async for c in adapter.generate_stream([{"role": "user", "content": "Hi"}], "System")]
+            
+            assert chunks == ["Gem", "ini"]
+
+
 class TestGetLLMAdapter:
     """Tests for get_llm_adapter factory function."""
     
@@ -187,6 +365,12 @@ class TestGetLLMAdapter:
         assert isinstance(adapter, OllamaAdapter)
         assert adapter.model_name == "llama3"
     
+    def test_get_mock_adapter(self):
+        """Test getting the in-process mock adapter."""
+        adapter = get_llm_adapter("mock", "fast")
+        assert isinstance(adapter, MockAdapter)
+        assert adapter.profile.ttft_ms == 5.0
+    
     def test_unsupported_provider(self):
         """Test error for unsupported provider."""
         with pytest.raises(ValueError, match="Unsupported provider"):
@@ -198,3 +382,181 @@ class TestGetLLMAdapter:
         adapter2 = get_llm_adapter("OPENAI", "gpt-4", api_key="test-key")
         assert isinstance(adapter1, OpenAIAdapter)
         assert isinstance(adapter2, OpenAIAdapter)
+
+
+@pytest.mark.asyncio
+class TestAdapterRegistry:
+    """Tests for the process-wide adapter registry."""
+    
+    async def test_reuses_adapter(self):
+        """Test that identical configurations share one adapter."""
+        registry = AdapterRegistry(max_size=4)
+        adapter1 = registry.get("openai", "gpt-4", 0.7, api_key="test-key")
+        adapter2 = registry.get("openai", "gpt-4", 0.7, api_key="test-key")
+        assert adapter1 is adapter2
+        assert registry.stats()["hits"] == 1
+        assert registry.stats()["live_clients"] == 1
+    
+    async def test_distinct_keys(self):
+        """Test that API key and proxy setting are part of the key."""
+        registry = AdapterRegistry(max_size=4)
+        adapter1 = registry.get("openai", "gpt-4", 0.7, api_key="key-a")
+        adapter2 = registry.get("openai", "gpt-4", 0.7, api_key="key-b")
+        adapter3 = registry.get("openai", "gpt-4", 0.7, api_key="key-a", use_proxy=True)
+        assert len({id(adapter1), id(adapter2), id(adapter3)}) == 3
+    
+    async def test_lru_eviction_closes_adapter(self):
+        """Test that the least recently used adapter is evicted and closed."""
+        registry = AdapterRegistry(max_size=1)
+        adapter1 = registry.get("openai", "gpt-4", 0.7, api_key="key-a")
+        adapter1.aclose = AsyncMock()
+        registry.get("openai", "gpt-4", 0.7, api_key="key-b")
+        await asyncio.sleep(0)
+        adapter1.aclose.assert_awaited_once()
+        assert registry.stats()["evictions"] == 1
+        assert registry.stats()["live_clients"] == 1
+    
+    async def test_eviction_waits_for_in_flight_call(self):
+        """Test that an evicted adapter is closed only after its running call finishes."""
+        registry = AdapterRegistry(max_size=1)
+        adapter = registry.get("mock", "default", 0.7, api_key="key-a")
+        adapter.aclose = AsyncMock()
+        release = asyncio.Event()
+        
+        async def slow_generate(messages, system_prompt, options):
+            await release.wait()
+            return "done"
+        
+        adapter._generate = slow_generate
+        call = asyncio.create_task(adapter._limited_generate([], "System", GenerationOptions()))
+        await asyncio.sleep(0)
+        assert adapter.in_flight == 1
+        
+        registry.get("mock", "default", 0.7, api_key="key-b")
+        await asyncio.sleep(0)
+        adapter.aclose.assert_not_awaited()
+        assert registry.stats()["closing"] == 1
+        
+        release.set()
+        assert (await call).content == "done"
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        adapter.aclose.assert_awaited_once()
+        assert registry.stats()["closing"] == 0
+    
+    async def test_aclose_all(self):
+        """Test closing the registry closes every adapter."""
+        registry = AdapterRegistry(max_size=4)
+        adapter = registry.get("openai", "gpt-4", 0.7, api_key="test-key")
+        adapter.aclose = AsyncMock()
+        await registry.aclose()
+        adapter.aclose.assert_awaited_once()
+        assert registry.stats()["live_clients"] == 0
+
+
+class TestHTTPClientPool:
+    """Tests for shared HTTP connection pools."""
+    
+    def test_adapters_share_pool_per_endpoint(self):
+        """Test that adapters targeting the same endpoint share one HTTP client."""
+        adapter1 = OpenAIAdapter(model_name="gpt-4", api_key="key-a")
+        adapter2 = OpenAIAdapter(model_name="gpt-3.5-turbo", api_key="key-b")
+        adapter3 = DeepSeekAdapter(model_name="deepseek-chat", api_key="key-a")
+        assert adapter1.client._client is adapter2.client._client
+        assert adapter1.client._client is not adapter3.client._client
+    
+    def test_pool_uses_settings_limits(self):
+        """Test that pooled clients are built with configured timeouts."""
+        pool = HTTPClientPool()
+        with patch("app.services.http_pool.settings") as mock_settings:
+            mock_settings.llm_proxy_url = None
+            mock_settings.llm_http2 = False
+            mock_settings.llm_max_connections = 7
+            mock_settings.llm_max_keepalive_connections = 3
+            mock_settings.llm_keepalive_expiry = 5.0
+            mock_settings.llm_connect_timeout = 1.5
+            mock_settings.llm_read_timeout = 9.0
+            client = pool.get("https://example.com/v1")
+        assert client.timeout.connect == 1.5
+        assert client.timeout.read == 9.0
+        assert pool.get("https://example.com/v1/") is client
+
+
+INSTANT_PROFILES = {"default": {"ttft_ms": 0.0, "ttft_sigma": 0.0, "tokens_per_second": 1e6, "tps_sigma": 0.0, "output_tokens": 20}}
+
+
+@pytest.mark.asyncio
+class TestMockAdapter:
+    """Tests for the mock provider."""
+    
+    @pytest.fixture(autouse=True)
+    def instant_profiles(self):
+        with patch("app.services.llm_adapter.settings.mock_llm_profiles", INSTANT_PROFILES):
+            yield
+    
+    async def test_deterministic_text(self):
+        """Test that the same seed and request produce the same text."""
+        messages = [{"role": "user", "content": "Hello"}]
+        first = await MockAdapter()._generate(messages, "System", GenerationOptions())
+        second = await MockAdapter()._generate(messages, "System", GenerationOptions())
+        other = await MockAdapter()._generate([{"role": "user", "content": "Bye"}], "System", GenerationOptions())
+        assert first.content == second.content
+        assert first.content != other.content
+        assert first.completion_tokens == 20
+        assert first.finish_reason == "stop"
+    
+    async def test_stream_matches_generate(self):
+        """Test that streaming yields the same text followed by usage."""
+        adapter = MockAdapter()
+        stream = adapter.stream([{"role": "user", "content": "Hi"}], "System")
+        chunks = [chunk async for chunk in stream]
+        assert len(chunks) == 20
+        assert "".join(chunks) == (await MockAdapter()._generate([{"role": "user", "content": "Hi"}], "System", GenerationOptions())).content
+        assert stream.result.completion_tokens == 20
+    
+    async def test_generation_limits(self):
+        """Test that max_tokens truncates and stop sequences cut the text."""
+        adapter = MockAdapter()
+        result = await adapter._generate([], "System", GenerationOptions(max_tokens=5))
+        assert result.completion_tokens == 5
+        assert result.finish_reason == "length"
+        full = (await adapter._generate([], "System", GenerationOptions())).content
+        stop = full.split(" ")[3]
+        cut = await adapter._generate([], "System", GenerationOptions(stop=(f" {stop}",)))
+        assert cut.content == full[:full.index(f" {stop}")]
+    
+    async def test_zero_output_tokens(self):
+        """Test that a profile with no output tokens yields an empty reply."""
+        profiles = {"default": {**INSTANT_PROFILES["default"], "output_tokens": 0}}
+        with patch("app.services.llm_adapter.settings.mock_llm_profiles", profiles):
+            adapter = MockAdapter()
+        result = await adapter._generate([], "System", GenerationOptions())
+        assert result.content == ""
+        assert result.completion_tokens == 0
+        assert result.finish_reason == "stop"
+    
+    async def test_concurrent_request_ids(self):
+        """Test that concurrent calls on one adapter get distinct request IDs."""
+        adapter = MockAdapter()
+        results = await asyncio.gather(*(adapter._generate([], "System", GenerationOptions()) for _ in range(3)))
+        assert sorted(result.request_id for result in results) == ["mock-1", "mock-2", "mock-3"]
+    
+    async def test_injected_rate_limit(self):
+        """Test that injected 429s are classified as retryable with Retry-After."""
+        profiles = {"default": {**INSTANT_PROFILES["default"], "error_rate_429": 1.0}}
+        with patch("app.services.llm_adapter.settings.mock_llm_profiles", profiles):
+            adapter = MockAdapter()
+        with pytest.raises(LLMError) as exc_info:
+            await adapter._generate([], "System", GenerationOptions())
+        assert exc_info.value.retryable is True
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.retry_after == 1.0
+    
+    async def test_injected_timeout(self):
+        """Test that injected timeouts hang for the configured time, then fail as retryable."""
+        profiles = {"default": {**INSTANT_PROFILES["default"], "timeout_rate": 1.0, "timeout_seconds": 0.01}}
+        with patch("app.services.llm_adapter.settings.mock_llm_profiles", profiles):
+            adapter = MockAdapter()
+        with pytest.raises(LLMError) as exc_info:
+            await adapter._generate([], "System", GenerationOptions())
+        assert exc_info.value.retryable is True
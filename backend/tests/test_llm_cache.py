@@ -0,0 +1,153 @@
+"""
+Unit tests for the LLM response cache.
+"""
+import asyncio
+import pytest
+from unittest.mock import patch
+from app.services.llm_adapter import BaseLLMAdapter
+from app.services.llm_cache import ResponseCache, request_fingerprint, should_cache
+from app.services.llm_result import GenerationOptions
+
+
+class CountingAdapter(BaseLLMAdapter):
+    """Adapter counting provider calls."""
+    
+    provider = "counting"
+    
+    def __init__(self, temperature=0.0):
+        super().__init__(model_name="counting-model", temperature=temperature)
+        self.calls = 0
+    
+    async def _generate(self, messages, system_prompt, options):
+        self.calls += 1
+        return f"answer {self.calls}"
+    
+    async def _generate_stream(self, messages, system_prompt, options):
+        self.calls += 1
+        for chunk in ["streamed ", f"answer {self.calls}"]:
+            await asyncio.sleep(0.01)
+            yield chunk
+
+
+class TestRequestFingerprint:
+    """Tests for request_fingerprint."""
+    
+    def test_stable_across_key_order(self):
+        """Test that equal requests hash the same regardless of dict order."""
+        a = request_fingerprint("openai", "gpt", 0, "sys", [{"role": "user", "content": "hi"}])
+        b = request_fingerprint("openai", "gpt", 0.0, "sys", [{"content": "hi", "role": "user"}])
+        assert a == b
+    
+    def test_differs_on_content(self):
+        """Test that any request field changes the hash."""
+        base = request_fingerprint("openai", "gpt", 0, "sys", [])
+        assert base != request_fingerprint("openai", "gpt", 0, "other", [])
+        assert base != request_fingerprint("openai", "gpt", 0.5, "sys", [])
+        assert base != request_fingerprint("deepseek", "gpt", 0, "sys", [])
+
+
+class TestShouldCache:
+    """Tests for the caching policy."""
+    
+    def test_deterministic_only_by_default(self):
+        """Test that only temperature 0 is cached without an override."""
+        assert should_cache(0.0, None) is True
+        assert should_cache(0.7, None) is False
+    
+    def test_agent_override(self):
+        """Test that the per-agent setting wins over temperature."""
+        assert should_cache(0.7, True) is True
+        assert should_cache(0.0, False) is False
+    
+    def test_globally_disabled(self):
+        """Test that the global switch disables caching."""
+        with patch("app.services.llm_cache.settings.llm_cache_enabled", False):
+            assert should_cache(0.0, True) is False
+
+
+@pytest.mark.asyncio
+class TestResponseCache:
+    """Tests for ResponseCache."""
+    
+    async def test_lru_eviction(self):
+        """Test that the memory tier is bounded."""
+        cache = ResponseCache(max_entries=2)
+        await cache.set("a", ["1"])
+        await cache.set("b", ["2"])
+        await cache.get("a")
+        await cache.set("c", ["3"])
+        assert await cache.get("b") is None
+        assert await cache.get("a") == ["1"]
+        assert cache.stats()["entries"] == 2
+    
+    async def test_ttl_expiry(self):
+        """Test that expired entries are misses."""
+        cache = ResponseCache(ttl=-1)
+        await cache.set("a", ["1"])
+        assert await cache.get("a") is None
+        assert cache.stats()["misses"] == 1
+    
+    async def test_disk_tier(self, tmp_path):
+        """Test that entries survive a new cache instance via the disk tier."""
+        path = str(tmp_path / "cache.db")
+        first = ResponseCache(disk_path=path)
+        await first.set("a", ["x", "y"])
+        second = ResponseCache(disk_path=path)
+        assert await second.get("a") == ["x", "y"]
+        stats = second.stats()
+        assert stats["disk_hits"] == 1
+        assert stats["disk_enabled"] is True
+
+
+@pytest.mark.asyncio
+class TestAdapterCaching:
+    """Tests for caching in BaseLLMAdapter."""
+    
+    @pytest.fixture(autouse=True)
+    def fresh_cache(self):
+        with patch("app.services.llm_adapter.response_cache", ResponseCache()) as cache:
+            yield cache
+    
+    async def test_generate_hits_cache_at_temperature_zero(self):
+        """Test that repeated deterministic calls reach the provider once."""
+        adapter = CountingAdapter(temperature=0.0)
+        first = await adapter.generate([{"role": "user", "content": "hi"}], "sys")
+        second = await adapter.generate([{"role": "user", "content": "hi"}], "sys")
+        assert first == second == "answer 1"
+        assert adapter.calls == 1
+    
+    async def test_sampled_calls_not_cached(self):
+        """Test that temperature > 0 bypasses the cache unless opted in."""
+        adapter = CountingAdapter(temperature=0.7)
+        await adapter.generate([], "sys")
+        await adapter.generate([], "sys")
+        assert adapter.calls == 2
+        await adapter.generate([], "sys", cache=True)
+        await adapter.generate([], "sys", cache=True)
+        assert adapter.calls == 3
+    
+    async def test_stream_replayed_from_cache(self):
+        """Test that a completed stream is replayed chunk by chunk."""
+        adapter = CountingAdapter(temperature=0.0)
+        first = [chunk async for chunk in adapter.generate_stream([], "sys")]
+        second = [chunk async for chunk in adapter.generate_stream([], "sys")]
+        assert first == second == ["streamed ", "answer 1"]
+        assert adapter.calls == 1
+        assert await adapter.generate([], "sys") == "streamed answer 1"
+    
+    async def test_generation_options_are_part_of_the_key(self):
+        """Test that calls with different limits do not share a cached response."""
+        adapter = CountingAdapter(temperature=0.0)
+        await adapter.generate([], "sys")
+        await adapter.generate([], "sys", options=GenerationOptions(max_tokens=50))
+        await adapter.generate([], "sys", options=GenerationOptions(max_tokens=50))
+        assert adapter.calls == 2
+    
+    async def test_abandoned_stream_not_cached(self):
+        """Test that a stream closed early does not populate the cache."""
+        adapter = CountingAdapter(temperature=0.0)
+        stream = adapter.generate_stream([], "sys")
+        await stream.__anext__()
+        await stream.aclose()
+        await adapter.generate([], "sys")
+        assert adapter.calls == 2
@@ -0,0 +1,90 @@
+"""
+Unit tests for in-memory room message windows.
+"""
+from app.services.message_window import MessageRecord, MessageWindow, MessageWindows
+
+
+def record(id, sender="Bob", content=None, role="assistant"):
+    return MessageRecord(id, role, sender, content or f"message {id}")
+
+
+class TestMessageWindow:
+    """Tests for MessageWindow."""
+
+    def test_views_are_formatted_per_participant(self):
+        """Test that own messages are assistant turns and others are prefixed with the sender."""
+        window = MessageWindow(room_id=1, session_id=0, size=10)
+        window.seed([record(1, role="system", sender=None, content="Topic"), record(2, "Alice"), record(3, "Bob")])
+
+        assert window.view("Alice") == [
+            {"role": "user", "content": "[System]: Topic"},
+            {"role": "assistant", "content": "message 2"},
+            {"role": "user", "content": "[Bob]: message 3"},
+        ]
+        assert window.view("Bob")[1] == {"role": "user", "content": "[Alice]: message 2"}
+
+    def test_ring_buffer_keeps_newest(self):
+        """Test that the window and its views keep only the newest messages."""
+        window = MessageWindow(room_id=1, session_id=0, size=3)
+        window.seed(record(id) for id in range(1, 5))
+        assert [message["content"] for message in window.view("Alice")] == ["[Bob]: message 2", "[Bob]: message 3", "[Bob]: message 4"]
+
+        for id in range(5, 10):
+            window.append(record(id))
+        assert [message["content"] for message in window.view("Alice")] == ["[Bob]: message 7", "[Bob]: message 8", "[Bob]: message 9"]
+
+    def test_views_are_updated_incrementally(self):
+        """Test that a view only formats the messages added since it was last read."""
+        window = MessageWindow(room_id=1, session_id=0, size=50)
+        window.seed(record(id) for id in range(1, 41))
+        window.view("Alice")
+        assert window.formatted == 40
+
+        window.append(record(41))
+        window.append(record(42, "Alice"))
+        view = window.view("Alice")
+        assert window.formatted == 42
+        assert view[-1] == {"role": "assistant", "content": "message 42"}
+        assert len(view) == 42
+
+    def test_summarized_messages_excluded(self):
+        """Test that messages up to the summary's last message are left out."""
+        window = MessageWindow(room_id=1, session_id=0, size=10)
+        window.seed(record(id) for id in range(1, 6))
+        assert [message["content"] for message in window.view("Alice", after_id=3)] == ["[Bob]: message 4", "[Bob]: message 5"]
+
+    def test_duplicates_ignored(self):
+        """Test that a message already in the window is not appended twice."""
+        window = MessageWindow(room_id=1, session_id=0, size=10)
+        window.seed([record(1), record(2)])
+        window.append(record(2))
+        assert len(window) == 2
+
+    def test_user_messages_signalled(self):
+        """Test that human messages are counted and set the wake-up event."""
+        window = MessageWindow(room_id=1, session_id=0, size=10)
+        window.append(record(1))
+        assert window.user_messages == 0
+        assert not window.user_posted.is_set()
+        window.append(record(2, "Dave", role="user"))
+        assert window.user_messages == 1
+        assert window.user_posted.is_set()
+
+
+class TestMessageWindows:
+    """Tests for MessageWindows."""
+
+    def test_append_only_to_running_session(self):
+        """Test that posts reach the window of the running session only."""
+        windows = MessageWindows()
+        assert windows.append(1, 0, record(1)) is False
+
+        window = windows.open(1, 0, size=10)
+        assert windows.append(1, 0, record(1)) is True
+        assert windows.append(1, 1, record(2)) is False
+        assert len(window) == 1
+
+        windows.close(1, MessageWindow(1, 0, 10))
+        assert windows.get(1, 0) is window
+        windows.close(1, window)
+        assert windows.get(1, 0) is None
@@ -0,0 +1,129 @@
+"""
+Unit tests for write-behind message persistence.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.core.database import Base
+from app.models import ChatSession, ChatSessionMessage, Message, Room
+from app.services.message_writer import ID_BLOCK_SIZE, MessageWriter
+
+
+@pytest.fixture
+async def db(tmp_path):
+    # A file database: the writer commits on its own connection
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'messages.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        session.add(Room(id=1, name="Room", topic="Topic", creator_id=1))
+        await session.commit()
+        yield session
+    await engine.dispose()
+
+
+def make_message(content="hello", **fields):
+    return Message(room_id=1, content=content, role="user", sender_name="bob", **fields)
+
+
+async def stored(db):
+    rows = await db.execute(select(Message.id, Message.content).order_by(Message.id))
+    return [tuple(row) for row in rows]
+
+
+@pytest.mark.asyncio
+class TestMessageWriter:
+    """Tests for MessageWriter."""
+
+    async def test_batches_messages_into_one_flush(self, db):
+        """Test that queued messages get IDs up front and are written in one batch."""
+        writer = MessageWriter(window_ms=10_000)
+        messages = [await writer.save(db, make_message(f"m{i}")) for i in range(5)]
+
+        assert [message.id for message in messages] == [1, 2, 3, 4, 5]
+        assert messages[0].created_at is not None
+        assert messages[0].session_id == 0
+        assert await stored(db) == []
+
+        await writer.flush()
+        assert await stored(db) == [(i + 1, f"m{i}") for i in range(5)]
+        stats = writer.stats()
+        assert stats["batches"] == 1
+        assert stats["rows"] == 5
+        assert stats["pending"] == 0
+
+    async def test_before_ack_shares_group_commit(self, db):
+        """Test that 'before_ack' saves wait for the commit and share one batch."""
+        writer = MessageWriter(window_ms=5, max_batch=2)
+        await asyncio.gather(*(writer.save(db, make_message(f"m{i}"), durability="before_ack") for i in range(3)))
+
+        assert len(await stored(db)) == 3
+        assert writer.stats()["batches"] == 1
+        assert writer.stats()["max_batch_size"] == 3
+
+    async def test_ids_continue_per_table(self, db):
+        """Test that IDs continue from the stored maximum of each table."""
+        db.add(make_message("old", id=41))
+        db.add(ChatSession(id=1, agent_id=1))
+        await db.commit()
+        writer = MessageWriter(window_ms=10_000)
+
+        message = await writer.save(db, make_message())
+        chat_message = await writer.save(db, ChatSessionMessage(session_id=1, role="user", content="hi"))
+        await writer.flush()
+
+        assert message.id == 42
+        assert chat_message.id == 1
+        assert await db.scalar(select(func.count()).select_from(ChatSessionMessage)) == 1
+
+    async def test_ids_reserved_from_sequence(self):
+        """Test that PostgreSQL IDs are drawn from the table's sequence one block at a time."""
+        reservations = []
+
+        class Connection:
+            async def execute(self, statement, params):
+                reservations.append(params)
+                start = 100 * len(reservations)
+                return [(start + offset,) for offset in range(params["count"])]
+
+        class Engine:
+            dialect = SimpleNamespace(name="postgresql")
+
+            @asynccontextmanager
+            async def connect(self):
+                yield Connection()
+
+        bind = Engine()
+        writer = MessageWriter()
+        ids = [await writer._allocate_id(bind, Message.__table__) for _ in range(ID_BLOCK_SIZE + 1)]
+
+        assert ids[:2] == [100, 101]
+        assert ids[-1] == 200
+        assert reservations == [{"table": "messages", "count": ID_BLOCK_SIZE}] * 2
+
+    async def test_failed_row_does_not_sink_batch(self, db):
+        """Test that a row the database rejects fails alone."""
+        writer = MessageWriter(window_ms=10_000)
+        good = await writer.save(db, make_message("good"))
+        future = await writer.submit(db, Message(room_id=1, content=None, role="user"))
+        await writer.flush()
+
+        with pytest.raises(Exception):
+            await future
+        assert await stored(db) == [(good.id, "good")]
+        assert writer.stats()["failed_rows"] == 1
+
+    async def test_disabled_commits_directly(self, db):
+        """Test that a disabled writer commits each message right away."""
+        writer = MessageWriter(enabled=False)
+        message = await writer.save(db, make_message())
+        assert await stored(db) == [(message.id, "hello")]
+        assert writer.stats()["batches"] == 0
+
+    async def test_unknown_durability(self, db):
+        """Test that an unknown durability mode is rejected."""
+        with pytest.raises(ValueError):
+            await MessageWriter().save(db, make_message(), durability="never")
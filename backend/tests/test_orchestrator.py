@@ -1,11 +1,16 @@
 """
 Unit tests for the Chat Orchestrator.
 """
+import asyncio
+import time
 import pytest
 from unittest.mock import MagicMock, AsyncMock, patch
 from datetime import datetime
 from app.services.orchestrator import ChatOrchestrator
-from app.models import Room, Agent, Message
+from app.models import Room, Agent, Message, Role
+from app.services.llm_result import LLMResult
+from app.services.message_window import MessageRecord, MessageWindow, SummaryRecord
+from app.services.resilience import DeadlineExceeded
 
 
 @pytest.fixture
@@ -242,3 +247,217 @@ class TestChatOrchestrator:
         
         # Room should be marked as finished
         assert sample_room.status == "finished"
+
+
+@pytest.mark.asyncio
+class TestTurnControl:
+    """Tests for turn deadlines and cancellation."""
+    
+    @staticmethod
+    def make_participant(turn_timeout=None):
+        participant = MagicMock()
+        participant.name = "Alice"
+        participant.turn_timeout = turn_timeout
+        return participant
+    
+    async def test_tighter_deadline_wins(self):
+        """Test that the room's and the agent's deadlines combine to the smaller one."""
+        orchestrator = ChatOrchestrator(room_id=1)
+        room = MagicMock()
+        room.turn_timeout = 30.0
+        assert orchestrator._turn_deadline(room, self.make_participant(10.0)) == 10.0
+        assert orchestrator._turn_deadline(room, self.make_participant()) == 30.0
+        room.turn_timeout = None
+        with patch("app.services.orchestrator.settings.turn_timeout_seconds", 45.0):
+            assert orchestrator._turn_deadline(room, self.make_participant()) == 45.0
+    
+    async def test_turn_deadline_cancels_generation(self):
+        """Test that a hung generation is cancelled at the deadline."""
+        orchestrator = ChatOrchestrator(room_id=1)
+        cancelled = asyncio.Event()
+        
+        async def hang(db, participant, room):
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        
+        orchestrator._generate_response = hang
+        room = MagicMock()
+        room.turn_timeout = 0.05
+        with pytest.raises(DeadlineExceeded, match="Alice"):
+            await orchestrator._run_turn(MagicMock(), self.make_participant(), room)
+        assert cancelled.is_set()
+    
+    async def test_stop_cancels_turn_in_flight(self):
+        """Test that stop() cancels the generation immediately."""
+        orchestrator = ChatOrchestrator(room_id=1)
+        started = asyncio.Event()
+        
+        async def hang(db, participant, room):
+            started.set()
+            await asyncio.sleep(60)
+            return LLMResult(content="late")
+        
+        orchestrator._generate_response = hang
+        room = MagicMock()
+        room.turn_timeout = 60.0
+        turn = asyncio.create_task(orchestrator._run_turn(MagicMock(), self.make_participant(), room))
+        await started.wait()
+        orchestrator.stop()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(turn, timeout=1.0)
+        assert orchestrator._turn_task is None
+    
+    async def test_turn_timing_recorded(self):
+        """Test that completed turns are counted and timed."""
+        orchestrator = ChatOrchestrator(room_id=1)
+        
+        async def answer(db, participant, room):
+            return LLMResult(content="hi")
+        
+        orchestrator._generate_response = answer
+        room = MagicMock()
+        room.turn_timeout = 5.0
+        await orchestrator._run_turn(MagicMock(), self.make_participant(), room)
+        stats = orchestrator.turn_stats()
+        assert stats["turns"] == 1
+        assert stats["last_turn_ms"] is not None
+        assert stats["current_turn_ms"] is None
+
+
+@pytest.mark.asyncio
+class TestTurnPacing:
+    """Tests for pipelined turn pacing."""
+    
+    @staticmethod
+    def make_room(pacing_seconds=None):
+        room = MagicMock()
+        room.turn_timeout = 5.0
+        room.pacing_seconds = pacing_seconds
+        return room
+    
+    async def test_room_pacing_overrides_default(self):
+        """Test that the room's pacing wins over the configured default."""
+        orchestrator = ChatOrchestrator(room_id=1)
+        assert orchestrator._pacing(self.make_room(0.5)) == 0.5
+        assert orchestrator._pacing(self.make_room(0)) == 0.0
+        with patch("app.services.orchestrator.settings.default_sleep_between_messages", 3.0):
+            assert orchestrator._pacing(self.make_room()) == 3.0
+    
+    async def test_generation_overlaps_pacing(self):
+        """Test that the turn is generated right away and returned at the publish time."""
+        orchestrator = ChatOrchestrator(room_id=1)
+        started = []
+        
+        async def answer(db, participant, room):
+            started.append(time.monotonic())
+            await asyncio.sleep(0.1)
+            return LLMResult(content="hi")
+        
+        orchestrator._generate_response = answer
+        begin = time.monotonic()
+        result = await orchestrator._paced_turn(MagicMock(), TestTurnControl.make_participant(), self.make_room(), begin + 0.15)
+        elapsed = time.monotonic() - begin
+        
+        assert result.content == "hi"
+        assert started[0] - begin < 0.05
+        # max(pacing, latency), not their sum
+        assert 0.15 <= elapsed < 0.24
+    
+    async def test_human_message_regenerates_turn(self):
+        """Test that a human message before the publish time restarts the generation."""
+        orchestrator = ChatOrchestrator(room_id=1)
+        orchestrator._window = MessageWindow(room_id=1, session_id=0, size=10)
+        calls = []
+        
+        async def answer(db, participant, room):
+            calls.append(len(orchestrator._window))
+            return LLMResult(content=f"reply to {len(orchestrator._window)} messages")
+        
+        orchestrator._generate_response = answer
+        publish_at = time.monotonic() + 0.1
+        turn = asyncio.create_task(
+            orchestrator._paced_turn(MagicMock(), TestTurnControl.make_participant(), self.make_room(), publish_at)
+        )
+        await asyncio.sleep(0.03)
+        orchestrator._window.append(MessageRecord(1, "user", "Dave", "wait, what about cost?"))
+        result = await turn
+        
+        assert calls == [0, 1]
+        assert result.content == "reply to 1 messages"
+        assert orchestrator.regenerated_turns == 1
+        assert time.monotonic() >= publish_at
+    
+    async def test_stop_during_hold_drops_turn(self):
+        """Test that a stop request while a finished turn waits for its publish time drops it."""
+        orchestrator = ChatOrchestrator(room_id=1)
+        
+        async def answer(db, participant, room):
+            return LLMResult(content="hi")
+        
+        orchestrator._generate_response = answer
+        turn = asyncio.create_task(
+            orchestrator._paced_turn(MagicMock(), TestTurnControl.make_participant(), self.make_room(), time.monotonic() + 60)
+        )
+        await asyncio.sleep(0.02)
+        orchestrator.stop()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(turn, timeout=1.0)
+
+
+@pytest.mark.asyncio
+class TestTurnContext:
+    """Tests for building a turn's context from the room's window."""
+    
+    async def test_summary_read_from_window(self):
+        """Test that a turn takes the summary and history from the window without querying."""
+        orchestrator = ChatOrchestrator(room_id=1)
+        window = orchestrator._window = MessageWindow(room_id=1, session_id=0, size=10)
+        window.seed([MessageRecord(1, "assistant", "Bob", "old"), MessageRecord(2, "assistant", "Bob", "new")])
+        window.summary = SummaryRecord("they argued", 1)
+        participant = MagicMock(spec=Role)
+        participant.name = "Alice"
+        room = MagicMock()
+        room.session_id = 0
+        room.mode = "debate"
+        adapter = MagicMock()
+        adapter.complete = AsyncMock(return_value=LLMResult(content="hi"))
+        
+        with patch("app.services.orchestrator.aload_room_summary", AsyncMock()) as load_summary, \
+             patch("app.services.orchestrator.room_role_prompt", return_value="persona"), \
+             patch("app.services.orchestrator.fit_to_budget", side_effect=lambda messages, *args: messages), \
+             patch("app.services.orchestrator.get_agent_adapter", return_value=adapter):
+            await orchestrator._generate_response(MagicMock(), participant, room)
+        
+        load_summary.assert_not_awaited()
+        messages, system_prompt = adapter.complete.call_args[0]
+        assert messages == [{"role": "user", "content": "[Bob]: new"}]
+        assert "they argued" in system_prompt
+    
+    async def test_without_window_uses_own_session(self):
+        """Test that the fallback queries run on a session of their own, not the room's shared one."""
+        orchestrator = ChatOrchestrator(room_id=1)
+        participant = MagicMock(spec=Role)
+        participant.name = "Alice"
+        room = MagicMock()
+        room.mode = "debate"
+        shared_db = MagicMock()
+        turn_db = MagicMock()
+        session = MagicMock()
+        session.__aenter__ = AsyncMock(return_value=turn_db)
+        session.__aexit__ = AsyncMock(return_value=False)
+        adapter = MagicMock()
+        adapter.complete = AsyncMock(return_value=LLMResult(content="hi"))
+        orchestrator._get_recent_messages = AsyncMock(return_value=[])
+        
+        with patch("app.core.database.AsyncSessionLocal", return_value=session), \
+             patch("app.services.orchestrator.aload_room_summary", AsyncMock(return_value=None)) as load_summary, \
+             patch("app.services.orchestrator.room_role_prompt", return_value="persona"), \
+             patch("app.services.orchestrator.fit_to_budget", side_effect=lambda messages, *args: messages), \
+             patch("app.services.orchestrator.get_agent_adapter", return_value=adapter):
+            await orchestrator._generate_response(shared_db, participant, room)
+        
+        assert load_summary.await_args[0][0] is turn_db
+        assert orchestrator._get_recent_messages.await_args[0][0] is turn_db
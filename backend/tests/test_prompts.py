@@ -0,0 +1,103 @@
+"""
+Unit tests for compiled, cached persona prompts.
+"""
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch
+from app.services.prompts import PromptCache, PromptTemplate, render_chat_prompt, room_role_prompt
+
+
+def make_role(**fields):
+    values = {"id": 1, "name": "Alice", "personality": "Curious", "gender": None, "age": "30",
+              "profession": "", "aggressiveness": 5}
+    values.update(fields)
+    return SimpleNamespace(**values)
+
+
+@pytest.fixture
+def cache():
+    fresh = PromptCache(max_entries=10)
+    with patch("app.services.prompts.prompt_cache", fresh):
+        yield fresh
+
+
+class TestPromptTemplate:
+    """Tests for PromptTemplate."""
+
+    def test_render_matches_str_format(self):
+        """Test that a compiled template renders like str.format."""
+        source = "Hi {name}, {{literal}} topic: {topic}."
+        template = PromptTemplate(source)
+        assert template.fields == {"name", "topic"}
+        assert template.render({"name": "A", "topic": "T"}) == source.format(name="A", topic="T")
+
+    def test_rejects_format_specs(self):
+        """Test that placeholders with format specs or attribute access are rejected."""
+        with pytest.raises(ValueError):
+            PromptTemplate("{name:>10}")
+        with pytest.raises(ValueError):
+            PromptTemplate("{role.name}")
+
+
+class TestRoomRolePrompt:
+    """Tests for room_role_prompt."""
+
+    def test_renders_persona(self, cache):
+        """Test that missing fields render as 'Not specified'."""
+        prompt = room_role_prompt(make_role(), "Cats", "debate")
+        assert prompt.startswith("You are playing the role of Alice.\n")
+        assert "- Topic: Cats\n" in prompt
+        assert "- Gender: Not specified\n" in prompt
+        assert "- Profession: Not specified\n" in prompt
+        assert "- Aggressiveness Level (1-10): 5.\n" in prompt
+
+    def test_cached_per_role_topic_and_mode(self, cache):
+        """Test that the prompt is rendered once per role, topic and mode."""
+        role = make_role()
+        first = room_role_prompt(role, "Cats", "debate")
+        role.personality = "Changed without invalidation"
+        assert room_role_prompt(role, "Cats", "debate") is first
+        assert room_role_prompt(role, "Dogs", "debate") != first
+        assert cache.stats()["hits"] == 1
+
+    def test_invalidated_by_role_edit(self, cache):
+        """Test that invalidating a role re-renders its prompts."""
+        role = make_role()
+        room_role_prompt(role, "Cats", "debate")
+        role.personality = "Grumpy"
+        cache.invalidate_role(role.id)
+        assert "Personality: Grumpy" in room_role_prompt(role, "Cats", "debate")
+
+    def test_mode_template_setting(self, cache):
+        """Test that a room mode can use its own template."""
+        with patch("app.services.prompts.settings.room_mode_prompts", {"group_chat": "{name} on {topic} ({mode})"}):
+            assert room_role_prompt(make_role(), "Cats", "group_chat") == "Alice on Cats (group_chat)"
+        with patch("app.services.prompts.settings.room_mode_prompts", {"debate": "{unknown}"}):
+            with pytest.raises(ValueError, match="unknown"):
+                room_role_prompt(make_role(), "Cats", "debate")
+
+    def test_stable_bytes(self, cache):
+        """Test that equal content renders identical bytes regardless of line endings."""
+        first = room_role_prompt(make_role(personality="Line one\r\nLine two"), "Cats", "debate")
+        cache.clear()
+        second = room_role_prompt(make_role(personality="Line one\nLine two"), "Cats", "debate")
+        assert first.encode() == second.encode()
+
+
+class TestChatPrompt:
+    """Tests for playground chat prompts."""
+
+    def test_persona_appended_to_agent_prompt(self):
+        """Test that only the role's set fields are listed after the agent prompt."""
+        prompt = render_chat_prompt("Be helpful.", make_role())
+        assert prompt == "Be helpful.\n\nRole Persona:\nName: Alice\nAge: 30\nPersonality: Curious"
+        assert render_chat_prompt(None, make_role(personality=None)).startswith("Role Persona:\nName: Alice")
+        assert render_chat_prompt("Be helpful.", None) == "Be helpful."
+
+    def test_invalidated_by_agent_edit(self, cache):
+        """Test that agent invalidation drops only that agent's entries."""
+        cache.put(("chat", 1, 7, None), "a", agent_id=7)
+        cache.put(("chat", 1, 8, 2), "b", agent_id=8, role_id=2)
+        cache.invalidate_agent(7)
+        assert cache.get(("chat", 1, 7, None)) is None
+        assert cache.get(("chat", 1, 8, 2)) == "b"
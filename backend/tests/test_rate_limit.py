@@ -0,0 +1,101 @@
+"""
+Unit tests for LLM concurrency and rate limiting.
+"""
+import asyncio
+import pytest
+from app.services.rate_limit import ProviderLimiter, TokenBucket, estimate_tokens
+
+
+class TestEstimateTokens:
+    """Tests for the token estimator."""
+    
+    def test_ascii_and_cjk(self):
+        """Test ASCII is ~4 chars/token and CJK is 1 char/token."""
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcdefgh") == 2
+        assert estimate_tokens("你好") == 2
+
+
+class TestTokenBucket:
+    """Tests for TokenBucket."""
+    
+    def test_time_until(self):
+        """Test that an exhausted bucket reports a refill delay."""
+        bucket = TokenBucket(per_minute=60)
+        assert bucket.time_until(60) == 0.0
+        bucket.consume(60)
+        assert bucket.time_until(1) == pytest.approx(1.0, abs=0.05)
+
+
+@pytest.mark.asyncio
+class TestProviderLimiter:
+    """Tests for ProviderLimiter."""
+    
+    async def test_bounds_concurrency(self):
+        """Test that no more than max_concurrency requests run at once."""
+        limiter = ProviderLimiter("test", max_concurrency=2)
+        running = 0
+        peak = 0
+        
+        async def call():
+            nonlocal running, peak
+            async with limiter.acquire():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+        
+        await asyncio.gather(*(call() for _ in range(6)))
+        assert peak == 2
+        assert limiter.stats()["admitted"] == 6
+        assert limiter.stats()["in_flight"] == 0
+    
+    async def test_fifo_admission(self):
+        """Test that waiting callers are admitted in arrival order."""
+        limiter = ProviderLimiter("test", max_concurrency=1)
+        order = []
+        
+        async def call(i):
+            async with limiter.acquire():
+                order.append(i)
+                await asyncio.sleep(0.001)
+        
+        tasks = []
+        for i in range(5):
+            tasks.append(asyncio.create_task(call(i)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        assert order == [0, 1, 2, 3, 4]
+    
+    async def test_queue_depth_reported(self):
+        """Test that queued callers are visible in metrics."""
+        limiter = ProviderLimiter("test", max_concurrency=1)
+        release = asyncio.Event()
+        
+        async def holder():
+            async with limiter.acquire():
+                await release.wait()
+        
+        async def waiter():
+            async with limiter.acquire():
+                pass
+        
+        t1 = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        t2 = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        assert limiter.stats()["queue_depth"] == 1
+        release.set()
+        await asyncio.gather(t1, t2)
+        assert limiter.stats()["queue_depth"] == 0
+    
+    async def test_rpm_bucket_delays(self):
+        """Test that the RPM bucket delays requests beyond the budget."""
+        limiter = ProviderLimiter("test", max_concurrency=0, rpm=600)
+        limiter._rpm.tokens = 1
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(2):
+            async with limiter.acquire():
+                pass
+        assert loop.time() - start >= 0.09
@@ -0,0 +1,165 @@
+"""
+Unit tests for LLM retries and circuit breaking.
+"""
+import pytest
+import httpx
+from unittest.mock import AsyncMock, patch
+from app.services.deadline import deadline_scope, remaining
+from app.services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LLMError,
+    RetryPolicy,
+    call_with_retries,
+    classify_error,
+    parse_retry_after,
+    stream_with_retries,
+    wrap_provider_error
+)
+
+
+def make_status_error(status_code, headers=None):
+    request = httpx.Request("POST", "https://example.com/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+class TestClassification:
+    """Tests for error classification."""
+    
+    def test_retryable_status_codes(self):
+        """Test that 429 and 5xx are retryable while 4xx are not."""
+        assert classify_error(make_status_error(429))[0] is True
+        assert classify_error(make_status_error(502))[0] is True
+        assert classify_error(make_status_error(401))[0] is False
+    
+    def test_timeouts_and_resets(self):
+        """Test that timeouts and connection resets are retryable."""
+        assert classify_error(httpx.ReadTimeout("timeout"))[0] is True
+        assert classify_error(ConnectionResetError())[0] is True
+        assert classify_error(ValueError("Empty response"))[0] is False
+    
+    def test_retry_after_header(self):
+        """Test that Retry-After is parsed from the response."""
+        retryable, status, retry_after = classify_error(make_status_error(429, {"Retry-After": "3"}))
+        assert (retryable, status, retry_after) == (True, 429, 3.0)
+        assert parse_retry_after("not a date") is None
+    
+    def test_wrap_keeps_message(self):
+        """Test that wrapped errors keep the provider message format."""
+        err = wrap_provider_error("OpenAI", make_status_error(503))
+        assert str(err).startswith("Failed to generate response from OpenAI")
+        assert err.retryable is True
+        assert err.status_code == 503
+
+
+class TestRetryPolicy:
+    """Tests for RetryPolicy."""
+    
+    def test_delay_bounds(self):
+        """Test jittered delays stay within the exponential cap and honor Retry-After."""
+        policy = RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=4.0)
+        for attempt in range(5):
+            assert 0 <= policy.compute_delay(attempt) <= 4.0
+        assert policy.compute_delay(0, retry_after=2.5) >= 2.5
+
+
+class TestCircuitBreaker:
+    """Tests for CircuitBreaker."""
+    
+    def test_opens_after_threshold(self):
+        """Test that consecutive failures open the circuit and calls fail fast."""
+        transitions = []
+        breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=60)
+        breaker.add_listener(lambda name, old, new: transitions.append((old, new)))
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        assert transitions == [("closed", "open")]
+    
+    def test_half_open_probe(self):
+        """Test that a successful probe closes the circuit."""
+        breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0)
+        breaker.record_failure()
+        breaker.before_call()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+class TestCallWithRetries:
+    """Tests for retry execution."""
+    
+    async def test_retries_then_succeeds(self):
+        """Test that a transient failure is retried."""
+        breaker = CircuitBreaker("test", failure_threshold=5)
+        call = AsyncMock(side_effect=[LLMError("502", retryable=True), "ok"])
+        with patch("asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+            result = await call_with_retries(breaker, RetryPolicy(max_attempts=3), call)
+        assert result == "ok"
+        assert call.await_count == 2
+        mock_sleep.assert_awaited_once()
+        assert breaker.consecutive_failures == 0
+    
+    async def test_non_retryable_raises_immediately(self):
+        """Test that non-retryable errors are not retried."""
+        breaker = CircuitBreaker("test")
+        call = AsyncMock(side_effect=LLMError("401", retryable=False))
+        with pytest.raises(LLMError):
+            await call_with_retries(breaker, RetryPolicy(max_attempts=3), call)
+        assert call.await_count == 1
+    
+    async def test_gives_up_after_max_attempts(self):
+        """Test that retries stop after max attempts."""
+        breaker = CircuitBreaker("test", failure_threshold=10)
+        call = AsyncMock(side_effect=LLMError("503", retryable=True))
+        with patch("asyncio.sleep", new_callable=AsyncMock):
+            with pytest.raises(LLMError):
+                await call_with_retries(breaker, RetryPolicy(max_attempts=3), call)
+        assert call.await_count == 3
+    
+    async def test_no_retry_past_deadline(self):
+        """Test that a retry whose backoff would outlast the deadline is not attempted."""
+        breaker = CircuitBreaker("test", failure_threshold=10)
+        call = AsyncMock(side_effect=LLMError("429", retryable=True, retry_after=5.0))
+        with deadline_scope(1.0):
+            with pytest.raises(LLMError, match="429"):
+                await call_with_retries(breaker, RetryPolicy(max_attempts=3), call)
+        assert call.await_count == 1
+    
+    async def test_stream_not_retried_after_first_chunk(self):
+        """Test that a stream failing mid-way is not replayed."""
+        breaker = CircuitBreaker("test")
+        attempts = 0
+        
+        async def make_stream():
+            nonlocal attempts
+            attempts += 1
+            yield "partial"
+            raise LLMError("reset", retryable=True)
+        
+        chunks = []
+        with pytest.raises(LLMError):
+            async for chunk in stream_with_retries(breaker, RetryPolicy(max_attempts=3), make_stream):
+                chunks.append(chunk)
+        assert chunks == ["partial"]
+        assert attempts == 1
+
+
+class TestDeadlineScope:
+    """Tests for deadline scopes."""
+    
+    def test_nested_scope_keeps_earlier_deadline(self):
+        """Test that an inner scope cannot extend an outer deadline."""
+        assert remaining() is None
+        with deadline_scope(1.0):
+            with deadline_scope(60.0):
+                assert remaining() <= 1.0
+            with deadline_scope(None):
+                assert remaining() <= 1.0
+        assert remaining() is None
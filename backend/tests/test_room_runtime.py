@@ -0,0 +1,140 @@
+"""
+Unit tests for the supervised room runtime.
+"""
+import asyncio
+import pytest
+from unittest.mock import patch
+from app.services.room_runtime import RoomAlreadyActive, RoomRuntime, RuntimeFull
+
+
+class FakeOrchestrator:
+    """Orchestrator whose conversation runs until released, stopped or failed."""
+
+    def __init__(self, room_id, error=None, ignore_stop=False):
+        self.room_id = room_id
+        self.error = error
+        self.ignore_stop = ignore_stop
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self._stop_requested = False
+
+    async def start_conversation(self, broadcast=None):
+        self.started.set()
+        await self.release.wait()
+        if self.error:
+            raise self.error
+
+    def stop(self):
+        self._stop_requested = True
+        if not self.ignore_stop:
+            self.release.set()
+
+    def turn_stats(self):
+        return {"turns": 0}
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+class TestRoomRuntime:
+    """Tests for RoomRuntime."""
+
+    async def test_admission_queue_and_cleanup(self):
+        """Test that rooms beyond the limit queue and are admitted as runs end."""
+        runtime = RoomRuntime(max_running=1, max_queued=1)
+        first, second, third = FakeOrchestrator(1), FakeOrchestrator(2), FakeOrchestrator(3)
+
+        assert runtime.submit(first).state == "running"
+        assert runtime.submit(second).state == "queued"
+        assert runtime.queue_position(2) == 1
+        with pytest.raises(RuntimeFull):
+            runtime.submit(third)
+
+        first.release.set()
+        await settle()
+        assert second.started.is_set()
+        assert runtime.is_active(1) is False
+        assert runtime.list_runs()["recent"][0]["state"] == "finished"
+
+        second.release.set()
+        await settle()
+        assert runtime.running == 0
+        assert runtime.stats()["completed"] == 2
+        assert runtime.stats()["rejected"] == 1
+
+    async def test_duplicate_room_rejected(self):
+        """Test that a room cannot be queued or running twice."""
+        runtime = RoomRuntime(max_running=1)
+        orchestrator = FakeOrchestrator(1)
+        runtime.submit(orchestrator)
+        with pytest.raises(RoomAlreadyActive):
+            runtime.submit(FakeOrchestrator(1))
+        orchestrator.release.set()
+        await settle()
+
+    async def test_crash_is_recorded(self):
+        """Test that a failing conversation is recorded with its error and frees its slot."""
+        runtime = RoomRuntime(max_running=1)
+        orchestrator = FakeOrchestrator(1, error=RuntimeError("boom"))
+        runtime.submit(orchestrator)
+        orchestrator.release.set()
+        await settle()
+
+        run = runtime.list_runs()["recent"][0]
+        assert run["state"] == "failed"
+        assert run["error"] == "boom"
+        assert runtime.running == 0
+        assert runtime.stats()["failed"] == 1
+
+    async def test_stop_detaches_running_room(self):
+        """Test that a stopped room can be started again while the old run winds down."""
+        runtime = RoomRuntime(max_running=2)
+        old = FakeOrchestrator(1, ignore_stop=True)
+        runtime.submit(old)
+        await settle()
+
+        assert runtime.stop(1) is True
+        assert old._stop_requested is True
+        new = FakeOrchestrator(1)
+        assert runtime.submit(new).state == "running"
+        assert runtime.running == 2
+
+        old.release.set()
+        await settle()
+        assert runtime.get(1).orchestrator is new
+        new.release.set()
+        await settle()
+        assert [run["state"] for run in runtime.list_runs()["recent"]] == ["finished", "stopped"]
+
+    async def test_stop_queued_room(self):
+        """Test that stopping a queued room removes it from the queue."""
+        runtime = RoomRuntime(max_running=1)
+        running, waiting = FakeOrchestrator(1), FakeOrchestrator(2)
+        runtime.submit(running)
+        runtime.submit(waiting)
+
+        assert runtime.stop(2) is True
+        assert runtime.queued == 0
+        running.release.set()
+        await settle()
+        assert waiting.started.is_set() is False
+
+    async def test_cancel_resets_room_status(self):
+        """Test that cancelling a task that ignores stop ends it and resets the room."""
+        runtime = RoomRuntime(max_running=1)
+        orchestrator = FakeOrchestrator(1, ignore_stop=True)
+        runtime.submit(orchestrator)
+        await settle()
+
+        with patch("app.services.room_runtime._reset_room_status") as reset:
+            assert runtime.cancel(1) is True
+            for _ in range(20):
+                await asyncio.sleep(0.01)
+                if runtime.running == 0:
+                    break
+        reset.assert_called_once_with(1)
+        assert runtime.list_runs()["recent"][0]["state"] == "cancelled"
+        assert runtime.cancel(1) is False
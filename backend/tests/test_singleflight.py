@@ -0,0 +1,220 @@
+"""
+Unit tests for singleflight request coalescing.
+"""
+import asyncio
+import pytest
+from unittest.mock import patch
+from app.services.llm_adapter import BaseLLMAdapter
+from app.services.llm_cache import ResponseCache
+from app.services.llm_result import LLMResult
+from app.services.singleflight import SingleFlight
+
+
+class SlowAdapter(BaseLLMAdapter):
+    """Adapter whose provider calls take a while."""
+    
+    provider = "slow"
+    
+    def __init__(self):
+        super().__init__(model_name="slow-model", temperature=0.7)
+        self.calls = 0
+    
+    async def _generate(self, messages, system_prompt, options):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return LLMResult(content="shared answer", prompt_tokens=10, completion_tokens=5)
+    
+    async def _generate_stream(self, messages, system_prompt, options):
+        self.calls += 1
+        for chunk in ["a", "b", "c"]:
+            await asyncio.sleep(0.01)
+            yield chunk
+        yield LLMResult(prompt_tokens=10, completion_tokens=3)
+
+
+@pytest.mark.asyncio
+class TestSingleFlight:
+    """Tests for SingleFlight."""
+    
+    async def test_concurrent_calls_share_result(self):
+        """Test that identical concurrent calls run once."""
+        flights = SingleFlight()
+        calls = 0
+        
+        async def call():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+        
+        results = await asyncio.gather(*(flights.do("k", call) for _ in range(5)))
+        assert results == ["result"] * 5
+        assert calls == 1
+        stats = flights.stats()
+        assert stats["coalesced"] == 4
+        assert stats["in_flight"] == 0
+    
+    async def test_error_propagates_to_all_waiters(self):
+        """Test that every waiter sees the shared failure."""
+        flights = SingleFlight()
+        
+        async def call():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+        
+        results = await asyncio.gather(flights.do("k", call), flights.do("k", call), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+    
+    async def test_waiter_counts(self):
+        """Test that waiters are visible while the call is in flight."""
+        flights = SingleFlight()
+        release = asyncio.Event()
+        
+        async def call():
+            await release.wait()
+            return 1
+        
+        tasks = [asyncio.create_task(flights.do("k", call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert flights.stats() == {"in_flight": 1, "waiters": 3, "leaders": 1, "coalesced": 2}
+        release.set()
+        await asyncio.gather(*tasks)
+    
+    async def test_leader_cancellation_keeps_call_for_others(self):
+        """Test that the shared call survives while any waiter remains."""
+        flights = SingleFlight()
+        
+        async def call():
+            await asyncio.sleep(0.02)
+            return "done"
+        
+        leader = asyncio.create_task(flights.do("k", call))
+        follower = asyncio.create_task(flights.do("k", call))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "done"
+    
+    async def test_last_waiter_cancels_call(self):
+        """Test that the upstream call is cancelled once nobody waits."""
+        flights = SingleFlight()
+        cancelled = asyncio.Event()
+        
+        async def call():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        
+        task = asyncio.create_task(flights.do("k", call))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+    
+    async def test_stream_fan_out(self):
+        """Test that a late subscriber replays earlier chunks then follows the stream."""
+        flights = SingleFlight()
+        started = 0
+        
+        async def make_stream():
+            nonlocal started
+            started += 1
+            for chunk in ["x", "y", "z"]:
+                await asyncio.sleep(0.01)
+                yield chunk
+        
+        async def consume(delay):
+            await asyncio.sleep(delay)
+            return [chunk async for chunk in flights.stream("k", make_stream)]
+        
+        first, second = await asyncio.gather(consume(0), consume(0.015))
+        assert first == second == ["x", "y", "z"]
+        assert started == 1
+    
+    async def test_abandoned_stream_not_joined(self):
+        """Test that a stream cancelled by its last waiter is not joined by a new caller."""
+        flights = SingleFlight()
+        
+        async def make_stream():
+            for chunk in ["x", "y", "z"]:
+                await asyncio.sleep(0.01)
+                yield chunk
+        
+        stream = flights.stream("k", make_stream)
+        assert await stream.__anext__() == "x"
+        await stream.aclose()
+        assert [chunk async for chunk in flights.stream("k", make_stream)] == ["x", "y", "z"]
+
+
+@pytest.mark.asyncio
+class TestAdapterCoalescing:
+    """Tests for coalescing in BaseLLMAdapter."""
+    
+    @pytest.fixture(autouse=True)
+    def fresh_tables(self):
+        with patch("app.services.llm_adapter.singleflight", SingleFlight()), \
+             patch("app.services.llm_adapter.response_cache", ResponseCache()):
+            yield
+    
+    async def test_identical_generates_coalesced(self):
+        """Test that double-submitted requests make one upstream call."""
+        adapter = SlowAdapter()
+        messages = [{"role": "user", "content": "hi"}]
+        results = await asyncio.gather(adapter.generate(messages, "sys"), adapter.generate(messages, "sys"))
+        assert results == ["shared answer", "shared answer"]
+        assert adapter.calls == 1
+    
+    async def test_followers_record_no_usage(self):
+        """Test that only the caller that made the upstream call gets its token usage."""
+        adapter = SlowAdapter()
+        messages = [{"role": "user", "content": "hi"}]
+        results = await asyncio.gather(*(adapter.complete(messages, "sys") for _ in range(3)))
+        assert adapter.calls == 1
+        assert [result.total_tokens for result in results] == [15, None, None]
+        assert [result.coalesced for result in results] == [False, True, True]
+        assert all(result.content == "shared answer" for result in results)
+    
+    async def test_different_api_keys_not_coalesced(self):
+        """Test that identical requests made with different API keys are sent separately."""
+        first, second = SlowAdapter(), SlowAdapter()
+        first.api_key, second.api_key = "key-one", "key-two"
+        await asyncio.gather(first.generate([], "sys"), second.generate([], "sys"))
+        assert first.calls == second.calls == 1
+    
+    async def test_different_requests_not_coalesced(self):
+        """Test that different prompts are sent separately."""
+        adapter = SlowAdapter()
+        await asyncio.gather(adapter.generate([], "one"), adapter.generate([], "two"))
+        assert adapter.calls == 2
+    
+    async def test_identical_streams_coalesced(self):
+        """Test that identical concurrent streams share one upstream stream."""
+        adapter = SlowAdapter()
+        
+        async def consume():
+            return [chunk async for chunk in adapter.generate_stream([], "sys")]
+        
+        first, second = await asyncio.gather(consume(), consume())
+        assert first == second == ["a", "b", "c"]
+        assert adapter.calls == 1
+    
+    async def test_stream_followers_record_no_usage(self):
+        """Test that a coalesced stream's final result carries no usage for the followers."""
+        adapter = SlowAdapter()
+        
+        async def consume():
+            stream = adapter.stream([], "sys")
+            chunks = [chunk async for chunk in stream]
+            return chunks, stream.result
+        
+        (_, first), (chunks, second) = await asyncio.gather(consume(), consume())
+        assert chunks == ["a", "b", "c"]
+        assert first.total_tokens == 13
+        assert second.total_tokens is None and second.coalesced
+    
+    async def test_disabled_by_setting(self):
+        """Test that coalescing can be turned off."""
+        adapter = SlowAdapter()
+        with patch("app.services.llm_adapter.settings.llm_singleflight_enabled", False):
+            await asyncio.gather(adapter.generate([], "sys"), adapter.generate([], "sys"))
+        assert adapter.calls == 2
@@ -0,0 +1,167 @@
+"""
+Unit tests for rolling conversation summaries.
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from app.core.database import Base
+from app.models import ChatSession, ChatSessionMessage, Message, Room
+from app.services.message_window import message_windows
+from app.services.summarizer import (
+    ConversationSummarizer, aload_chat_summary, aload_room_summary, summary_prompt_section
+)
+
+
+@pytest.fixture
+async def db():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.fixture
+def llm():
+    adapter = MagicMock()
+    adapter.generate = AsyncMock(return_value="summary text")
+    with patch("app.services.summarizer.get_llm_adapter", return_value=adapter) as factory:
+        yield adapter, factory
+
+
+@pytest.fixture(autouse=True)
+def small_windows():
+    with patch("app.services.summarizer.settings.summary_interval_messages", 4), \
+         patch("app.services.summarizer.settings.summary_keep_recent_messages", 2):
+        yield
+
+
+MODEL = {"provider": "deepseek", "model_name": "deepseek-chat", "api_key": None, "use_proxy": False}
+
+
+async def _room_with_messages(db, count, session_id=0):
+    room = Room(name="r", topic="t", creator_id=1, session_id=session_id)
+    db.add(room)
+    await db.commit()
+    for i in range(count):
+        db.add(Message(room_id=room.id, content=f"message {i}", role="assistant",
+                       session_id=session_id, sender_name=f"speaker{i % 2}"))
+    await db.commit()
+    return room
+
+
+@pytest.mark.asyncio
+class TestConversationSummarizer:
+    """Tests for ConversationSummarizer.update."""
+    
+    async def test_waits_for_interval(self, db, llm):
+        """Test that nothing is summarized before enough messages accumulate."""
+        room = await _room_with_messages(db, 5)
+        updated = await ConversationSummarizer().update(db, ("room", room.id, 0), MODEL)
+        assert updated is False
+        llm[0].generate.assert_not_called()
+    
+    async def test_folds_all_but_recent_window(self, db, llm):
+        """Test that older messages are folded and the recent window is kept verbatim."""
+        room = await _room_with_messages(db, 7)
+        summarizer = ConversationSummarizer()
+        assert await summarizer.update(db, ("room", room.id, 0), MODEL) is True
+        
+        summary = await aload_room_summary(db, room.id, 0)
+        assert summary.content == "summary text"
+        assert summary.message_count == 5
+        ids = (await db.scalars(select(Message.id).order_by(Message.id))).all()
+        assert summary.last_message_id == ids[4]
+        prompt = llm[0].generate.call_args[0][0][0]["content"]
+        assert "speaker0: message 0" in prompt
+        assert "message 5" not in prompt
+        assert llm[1].call_args.kwargs["temperature"] == 0.0
+    
+    async def test_incremental_update_uses_previous_summary(self, db, llm):
+        """Test that later updates only send new messages plus the previous summary."""
+        room = await _room_with_messages(db, 7)
+        summarizer = ConversationSummarizer()
+        await summarizer.update(db, ("room", room.id, 0), MODEL)
+        for i in range(7, 11):
+            db.add(Message(room_id=room.id, content=f"message {i}", role="assistant", session_id=0))
+        await db.commit()
+        
+        llm[0].generate.return_value = "second summary"
+        assert await summarizer.update(db, ("room", room.id, 0), MODEL) is True
+        prompt = llm[0].generate.call_args[0][0][0]["content"]
+        assert "summary text" in prompt
+        assert "message 0" not in prompt
+        assert (await aload_room_summary(db, room.id, 0)).message_count == 9
+    
+    async def test_room_sessions_are_separate(self, db, llm):
+        """Test that a restarted room session starts without a summary."""
+        room = await _room_with_messages(db, 7)
+        await ConversationSummarizer().update(db, ("room", room.id, 0), MODEL)
+        assert await aload_room_summary(db, room.id, 1) is None
+    
+    async def test_running_room_window_gets_new_summary(self, db, llm):
+        """Test that an update replaces the summary held by the room's open window."""
+        room = await _room_with_messages(db, 7)
+        window = message_windows.open(room.id, 0, size=10)
+        try:
+            await ConversationSummarizer().update(db, ("room", room.id, 0), MODEL)
+            stored = await aload_room_summary(db, room.id, 0)
+            assert window.summary.content == "summary text"
+            assert window.summary.last_message_id == stored.last_message_id
+        finally:
+            message_windows.close(room.id, window)
+    
+    async def test_chat_session_summary(self, db, llm):
+        """Test summarizing a playground chat session."""
+        session = ChatSession(agent_id=1, user_id=1)
+        db.add(session)
+        await db.commit()
+        for i in range(6):
+            db.add(ChatSessionMessage(session_id=session.id, role="user" if i % 2 == 0 else "assistant", content=f"m{i}"))
+        await db.commit()
+        
+        assert await ConversationSummarizer().update(db, ("chat", session.id, 0), MODEL) is True
+        summary = await aload_chat_summary(db, session.id)
+        assert summary.message_count == 4
+        assert "User: m0" in llm[0].generate.call_args[0][0][0]["content"]
+
+
+@pytest.mark.asyncio
+class TestScheduling:
+    """Tests for background scheduling."""
+    
+    async def test_schedule_runs_off_hot_path_once(self, db, llm):
+        """Test that concurrent schedules for one key start a single task."""
+        room = await _room_with_messages(db, 7)
+        agent = MagicMock(provider="deepseek", model_name="deepseek-chat", api_key_config=None, use_proxy=False)
+        db.close = AsyncMock()
+        summarizer = ConversationSummarizer(session_factory=lambda: db)
+        summarizer.schedule_room(room.id, 0, agent)
+        summarizer.schedule_room(room.id, 0, agent)
+        assert summarizer.stats()["pending"] == 1
+        await asyncio.gather(*summarizer._tasks.values())
+        assert summarizer.stats() == {"pending": 0, "runs": 1, "failures": 0}
+    
+    async def test_disabled(self, llm):
+        """Test that nothing is scheduled when summaries are disabled."""
+        summarizer = ConversationSummarizer(session_factory=MagicMock())
+        with patch("app.services.summarizer.settings.summary_enabled", False):
+            summarizer.schedule_chat_session(1, MagicMock())
+        assert summarizer.stats()["pending"] == 0
+
+
+class TestSummaryPromptSection:
+    """Tests for summary_prompt_section."""
+    
+    def test_empty_without_summary(self):
+        """Test that no summary adds nothing to the prompt."""
+        assert summary_prompt_section(None) == ""
+    
+    def test_includes_summary(self):
+        """Test that the summary text is carried into the prompt."""
+        summary = MagicMock(content="they disagreed")
+        assert "they disagreed" in summary_prompt_section(summary)
@@ -0,0 +1,99 @@
+"""
+Unit tests for streamed room turns.
+"""
+import asyncio
+import pytest
+from app.services.turn_stream import TurnStream
+
+
+class Recorder:
+    """Broadcast callback recording the events it receives."""
+
+    def __init__(self):
+        self.events = []
+
+    async def __call__(self, room_id, event):
+        self.events.append((room_id, event))
+
+    def types(self):
+        return [event["type"] for _, event in self.events]
+
+
+@pytest.mark.asyncio
+class TestTurnStream:
+    """Tests for TurnStream."""
+
+    async def test_deltas_are_coalesced(self):
+        """Test that the first text goes out at once and later tokens are batched per window."""
+        broadcast = Recorder()
+        stream = TurnStream(broadcast, 7, {"agent_name": "Alice"}, window_ms=30)
+        await stream.start()
+        for index in range(20):
+            await stream.push(f"t{index} ")
+            await asyncio.sleep(0.002)
+        await stream.end({"id": 1, "content": "final"})
+
+        assert broadcast.types()[0] == "message_start"
+        assert broadcast.types()[-1] == "message_end"
+        deltas = [event["data"]["content"] for _, event in broadcast.events if event["type"] == "delta"]
+        assert deltas[0] == "t0 "
+        assert "".join(deltas) == "".join(f"t{index} " for index in range(20))
+        assert 2 <= len(deltas) < 20
+        assert all(room_id == 7 for room_id, _ in broadcast.events)
+        start, end = broadcast.events[0][1]["data"], broadcast.events[-1][1]["data"]
+        assert start["agent_name"] == "Alice"
+        assert start["stream_id"] == end["stream_id"]
+        assert end["content"] == "final"
+
+    async def test_window_flush_without_more_tokens(self):
+        """Test that buffered text is sent when the window ends even if no token follows."""
+        broadcast = Recorder()
+        stream = TurnStream(broadcast, 1, {}, window_ms=10)
+        await stream.push("a")
+        await stream.push("b")
+        assert broadcast.types() == ["delta"]
+        await asyncio.sleep(0.05)
+        assert [event["data"]["content"] for _, event in broadcast.events] == ["a", "b"]
+
+    async def test_abort_drops_pending_text(self):
+        """Test that an aborted turn ends without sending buffered text."""
+        broadcast = Recorder()
+        stream = TurnStream(broadcast, 1, {}, window_ms=1000)
+        await stream.push("a")
+        await stream.push("b")
+        await stream.abort("stopped")
+        await asyncio.sleep(0.01)
+
+        assert broadcast.types() == ["delta", "message_end"]
+        assert broadcast.events[-1][1]["data"]["aborted"] is True
+        assert broadcast.events[-1][1]["data"]["error"] == "stopped"
+
+    async def test_held_stream_sends_on_release(self):
+        """Test that a held stream broadcasts nothing until released, then the text so far."""
+        broadcast = Recorder()
+        stream = TurnStream(broadcast, 1, {"agent_name": "Alice"}, window_ms=10, held=True)
+        await stream.start()
+        await stream.push("a")
+        stream.discard()
+        await stream.push("b")
+        await stream.push("c")
+        await asyncio.sleep(0.03)
+        assert broadcast.events == []
+
+        await stream.release()
+        await stream.push("d")
+        await stream.end({"id": 1, "content": "bcd"})
+        assert broadcast.types()[0] == "message_start"
+        assert broadcast.types()[-1] == "message_end"
+        deltas = [event["data"]["content"] for _, event in broadcast.events if event["type"] == "delta"]
+        assert deltas[0] == "bc"
+        assert "".join(deltas) == "bcd"
+
+    async def test_abort_while_held_is_silent(self):
+        """Test that aborting a stream viewers never saw broadcasts nothing."""
+        broadcast = Recorder()
+        stream = TurnStream(broadcast, 1, {}, held=True)
+        await stream.start()
+        await stream.push("a")
+        await stream.abort("stopped")
+        assert broadcast.events == []
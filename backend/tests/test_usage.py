@@ -0,0 +1,195 @@
+"""
+Unit tests for LLM usage capture and aggregation.
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.api.usage import get_agent_usage, get_my_usage, get_room_usage
+from app.core.database import Base
+from app.models import Agent, ChatSession, ChatSessionMessage, Message, Room, User
+from app.services.llm_adapter import OllamaAdapter, OpenAIAdapter
+from app.services.llm_cache import ResponseCache
+from app.services.llm_result import LLMResult
+from app.services.singleflight import SingleFlight
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def fresh_tables():
+    with patch("app.services.llm_adapter.singleflight", SingleFlight()), \
+         patch("app.services.llm_adapter.response_cache", ResponseCache()):
+        yield
+
+
+def _usage(provider, prompt, completion, latency):
+    return LLMResult(provider=provider, model_name=f"{provider}-model", prompt_tokens=prompt,
+                     completion_tokens=completion, ttft_ms=latency / 2, latency_ms=latency).usage_columns()
+
+
+@pytest.mark.asyncio
+class TestAdapterResults:
+    """Tests for structured results from adapters."""
+    
+    async def test_openai_complete_reports_usage(self, fresh_tables):
+        """Test that usage, finish reason and request id are kept."""
+        adapter = OpenAIAdapter(model_name="gpt-4o", api_key="test-key")
+        response = MagicMock()
+        response.id = "chatcmpl-123"
+        response.choices[0].message.content = " Hello "
+        response.choices[0].finish_reason = "stop"
+        response.usage.prompt_tokens = 12
+        response.usage.completion_tokens = 3
+        response.usage.prompt_tokens_details = {"cached_tokens": 8}
+        with patch.object(adapter.client.chat.completions, 'create', new_callable=AsyncMock, return_value=response):
+            result = await adapter.complete([{"role": "user", "content": "Hi"}], "System")
+        
+        assert result.content == "Hello"
+        assert (result.prompt_tokens, result.completion_tokens, result.cached_tokens) == (12, 3, 8)
+        assert result.finish_reason == "stop"
+        assert result.request_id == "chatcmpl-123"
+        assert result.provider == "openai"
+        assert result.latency_ms is not None and result.ttft_ms == result.latency_ms
+    
+    async def test_openai_stream_reports_usage(self, fresh_tables):
+        """Test that the final usage chunk of a stream ends up in the stream result."""
+        adapter = OpenAIAdapter(model_name="gpt-4o", api_key="test-key")
+        
+        def chunk(content, finish_reason=None, usage=None, choices=True):
+            item = MagicMock()
+            item.id = "chatcmpl-9"
+            item.usage = usage
+            if choices:
+                item.choices[0].delta.content = content
+                item.choices[0].finish_reason = finish_reason
+            else:
+                item.choices = []
+            return item
+        
+        usage = MagicMock(prompt_tokens=5, completion_tokens=2, prompt_tokens_details=None)
+        
+        async def fake_stream():
+            for item in [chunk("Hel"), chunk("lo", "stop"), chunk(None, usage=usage, choices=False)]:
+                yield item
+        
+        with patch.object(adapter.client.chat.completions, 'create', new_callable=AsyncMock, return_value=fake_stream()) as mock_create:
+            stream = adapter.stream([{"role": "user", "content": "Hi"}], "System")
+            chunks = [c async for c in stream]
+        
+        assert chunks == ["Hel", "lo"]
+        assert mock_create.call_args.kwargs['extra_body'] == {"stream_options": {"include_usage": True}}
+        result = stream.result
+        assert result.content == "Hello"
+        assert (result.prompt_tokens, result.completion_tokens) == (5, 2)
+        assert result.finish_reason == "stop"
+        assert result.request_id == "chatcmpl-9"
+        assert result.ttft_ms is not None
+    
+    async def test_ollama_stream_usage_from_done_line(self, fresh_tables):
+        """Test that Ollama token counts are read from the final NDJSON line."""
+        adapter = OllamaAdapter(model_name="llama3")
+        lines = [
+            '{"message": {"content": "Hi"}, "done": false}',
+            '{"message": {"content": ""}, "done": true, "done_reason": "stop", "prompt_eval_count": 9, "eval_count": 1}',
+        ]
+        
+        async def aiter_lines():
+            for line in lines:
+                yield line
+        
+        response = MagicMock()
+        response.raise_for_status = MagicMock()
+        response.aiter_lines = aiter_lines
+        context = MagicMock()
+        context.__aenter__ = AsyncMock(return_value=response)
+        context.__aexit__ = AsyncMock(return_value=False)
+        with patch.object(adapter.client, 'stream', return_value=context):
+            stream = adapter.stream([{"role": "user", "content": "Hi"}], "System")
+            assert [c async for c in stream] == ["Hi"]
+        assert (stream.result.prompt_tokens, stream.result.completion_tokens) == (9, 1)
+        assert stream.result.finish_reason == "stop"
+
+
+class TestUsageEndpoints:
+    """Tests for the usage aggregation endpoints."""
+    
+    @pytest.fixture
+    def data(self, db):
+        user = User(username="u", hashed_password="x")
+        other = User(username="o", hashed_password="x")
+        db.add_all([user, other])
+        db.commit()
+        agent = Agent(name="a", provider="openai", model_name="openai-model", system_prompt="", user_id=user.id)
+        db.add(agent)
+        db.commit()
+        room = Room(name="r", topic="t", creator_id=user.id)
+        db.add(room)
+        db.commit()
+        db.add_all([
+            Message(room_id=room.id, agent_id=agent.id, content="1", role="assistant", **_usage("openai", 10, 5, 100)),
+            Message(room_id=room.id, agent_id=agent.id, content="2", role="assistant", **_usage("openai", 20, 5, 300)),
+            Message(room_id=room.id, agent_id=agent.id, content="3", role="assistant", session_id=1, **_usage("ollama", 7, 1, 50)),
+            Message(room_id=room.id, content="topic", role="system"),
+        ])
+        session = ChatSession(user_id=user.id, agent_id=agent.id)
+        db.add(session)
+        db.commit()
+        db.add_all([
+            ChatSessionMessage(session_id=session.id, role="user", content="hi"),
+            ChatSessionMessage(session_id=session.id, role="assistant", content="yo", **_usage("openai", 4, 2, 200)),
+        ])
+        db.commit()
+        return user, other, agent, room
+    
+    def test_room_usage(self, db, data):
+        """Test aggregation over a room's assistant messages."""
+        user, _, _, room = data
+        summary = get_room_usage(room.id, db=db, current_user=user)
+        assert summary.messages == 3
+        assert summary.prompt_tokens == 37
+        assert summary.completion_tokens == 11
+        assert summary.avg_latency_ms == 150.0
+        assert [item.provider for item in summary.by_model] == ["openai", "ollama"]
+        assert summary.by_model[0].avg_latency_ms == 200.0
+    
+    def test_room_usage_by_session(self, db, data):
+        """Test restricting a room's usage to one session."""
+        user, _, _, room = data
+        summary = get_room_usage(room.id, session_id=1, db=db, current_user=user)
+        assert summary.messages == 1
+        assert summary.by_model[0].provider == "ollama"
+    
+    def test_room_usage_requires_owner(self, db, data):
+        """Test that other users cannot read a room's usage."""
+        _, other, _, room = data
+        with pytest.raises(HTTPException) as exc:
+            get_room_usage(room.id, db=db, current_user=other)
+        assert exc.value.status_code == 404
+    
+    def test_agent_usage_includes_chat_sessions(self, db, data):
+        """Test that agent usage spans rooms and playground sessions."""
+        user, _, agent, _ = data
+        summary = get_agent_usage(agent.id, db=db, current_user=user)
+        assert summary.messages == 4
+        openai = next(item for item in summary.by_model if item.provider == "openai")
+        assert openai.messages == 3
+        assert openai.prompt_tokens == 34
+    
+    def test_user_usage(self, db, data):
+        """Test per-user usage and that other users see none of it."""
+        user, other, _, _ = data
+        assert get_my_usage(db=db, current_user=user).messages == 4
+        empty = get_my_usage(db=db, current_user=other)
+        assert empty.messages == 0
+        assert empty.avg_latency_ms is None
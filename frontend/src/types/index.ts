@@ -14,6 +14,21 @@ export interface Agent {
   user_id?: number
   use_proxy?: boolean
   is_global?: boolean
+  fallback_chain?: FallbackTarget[] | null
+  hedge_enabled?: boolean
+  cache_enabled?: boolean | null
+  context_token_budget?: number | null
+  max_tokens?: number | null
+  stop_sequences?: string[] | null
+  turn_timeout?: number | null
+}
+
+export interface FallbackTarget {
+  provider: string
+  model_name: string
+  api_key_config?: string
+  use_proxy?: boolean
+  temperature?: number
 }
 
 export interface Role {
@@ -36,6 +51,8 @@ export interface Room {
   current_rounds: number
   status: 'idle' | 'running' | 'finished'
   mode: 'debate' | 'group_chat'
+  turn_timeout?: number | null
+  pacing_seconds?: number | null
   session_id: number
   creator_id?: number
   created_at: string
@@ -53,6 +70,38 @@ export interface Message {
   created_at: string
   sender_role?: Role
   status?: 'sending' | 'sent' | 'error'
+  // LLM usage (assistant messages)
+  provider?: string | null
+  model_name?: string | null
+  prompt_tokens?: number | null
+  completion_tokens?: number | null
+  cached_tokens?: number | null
+  ttft_ms?: number | null
+  latency_ms?: number | null
+  finish_reason?: string | null
+}
+
+export interface UsageBreakdown {
+  provider: string | null
+  model_name: string | null
+  messages: number
+  prompt_tokens: number
+  completion_tokens: number
+  cached_tokens: number
+  avg_ttft_ms: number | null
+  avg_latency_ms: number | null
+}
+
+export interface UsageSummary {
+  scope: 'room' | 'agent' | 'user'
+  scope_id: number
+  messages: number
+  prompt_tokens: number
+  completion_tokens: number
+  cached_tokens: number
+  avg_ttft_ms: number | null
+  avg_latency_ms: number | null
+  by_model: UsageBreakdown[]
 }
 
 export interface CreateAgentRequest {
@@ -85,6 +134,8 @@ export interface CreateRoomRequest {
   agent_ids?: number[]
   role_ids?: number[]
   mode?: 'debate' | 'group_chat'
+  turn_timeout?: number | null
+  pacing_seconds?: number | null
 }
 
 export interface WSMessageData {
@@ -99,6 +150,6 @@ export interface WSMessageData {
 }
 
 export interface WSMessage {
-  type: string  // message, status, error
+  type: string  // message, message_start, delta, message_end, status, error
   data: WSMessageData
 }